@@ -0,0 +1,82 @@
+import os
+import requests
+from unittest import mock
+
+from urlchecker.core.batch import BatchChecker
+from urlchecker.core.urlproc import UrlCheckResult
+
+
+def make_response(*args, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    return response
+
+
+def test_batch_checker(tmp_path):
+    """
+    test that urls shared by paths are checked once, with results by path
+    """
+    paths = []
+    for name, content in [
+        ("one", "https://shared.example.com/\nhttps://one.example.com/\n"),
+        ("two", "https://shared.example.com/\n"),
+    ]:
+        os.makedirs(str(tmp_path / name))
+        (tmp_path / name / "README.md").write_text(content)
+        paths.append(str(tmp_path / name))
+
+    checker = BatchChecker(paths, file_types=[".md"], serial=True)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+        with mock.patch.object(
+            UrlCheckResult, "make_request", side_effect=make_response
+        ) as request:
+            results = checker.run(exclude_patterns=["one.example"])
+
+    assert request.call_count == 1
+    assert results[paths[0]]["passed"] == {"https://shared.example.com/"}
+    assert results[paths[0]]["excluded"] == {"https://one.example.com/"}
+    assert results[paths[1]]["passed"] == {"https://shared.example.com/"}
+
+    # The shared url is kept once, by every path
+    assert len(checker.url_table) == 2
+    first, second = [
+        checker.checkers[path].checks[os.path.join(path, "README.md")]["urls"]
+        for path in paths
+    ]
+    assert "https://shared.example.com/" in first and second[0] in first
+
+    output_file = str(tmp_path / "results.csv")
+    checker.save_results(output_file)
+    with open(output_file, "r") as fd:
+        lines = fd.read().splitlines()
+    assert lines[0] == "PATH,URL,RESULT,FILENAME"
+    assert "%s,https://shared.example.com/,passed,README.md" % paths[1] in lines
+
+
+def test_batch_cache(tmp_path):
+    """
+    test that all paths of a batch share one extraction cache, saved once
+    """
+    paths = []
+    for name in ["one", "two"]:
+        os.makedirs(str(tmp_path / name))
+        (tmp_path / name / "README.md").write_text("https://%s.example.com/\n" % name)
+        paths.append(str(tmp_path / name))
+
+    cache_file = str(tmp_path / "cache.json")
+    for run in range(2):
+        checker = BatchChecker(
+            paths, file_types=[".md"], serial=True, cache_file=cache_file
+        )
+        assert all(other.cache is checker.cache for other in checker.checkers.values())
+        with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+            with mock.patch.object(
+                UrlCheckResult, "make_request", side_effect=make_response
+            ):
+                checker.run()
+
+    # The second run finds both paths in the cache
+    assert (checker.cache.hits, checker.cache.misses) == (2, 0)
+    assert sorted(checker.cache.files) == [
+        os.path.join(path, "README.md") for path in paths
+    ]
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urlchecker.core.cache import (
+    ExtractionCache,
+    ResultCache,
+    check_entry,
+    get_stamp,
+    make_entry,
+)
+from urlchecker.core.check import decode_extracted, extract_task
+
+
+def test_check_entry(tmp_path):
+    """
+    test that entries are valid until the content changes
+    """
+    markdown = tmp_path / "README.md"
+    markdown.write_text("[link](https://www.google.com/)")
+    entry = make_entry(str(markdown), urls=["https://www.google.com/"], skipped=None)
+    assert entry["sha256"]
+    assert check_entry(str(markdown), entry) == entry
+    assert not check_entry(str(markdown), None)
+
+    # Only the modified time changed, the content hash is a match
+    os.utime(str(markdown), (time.time() + 10, time.time() + 10))
+    updated = check_entry(str(markdown), entry)
+    assert updated and updated["mtime"] != entry["mtime"]
+
+    # Same size, different content
+    markdown.write_text("[link](https://www.google.org/)")
+    assert not check_entry(str(markdown), entry)
+
+
+def test_extraction_cache(tmp_path):
+    """
+    test that the cache counts hits and misses, and persists to file
+    """
+    markdown = tmp_path / "README.md"
+    markdown.write_text("[link](https://www.google.com/)")
+    cache_file = str(tmp_path / "cache.json")
+
+    cache = ExtractionCache(cache_file)
+    kwargs = {"file_name": str(markdown), "use_cache": True}
+    result = extract_task(cache_entry=get_stamp(cache.get(str(markdown))), **kwargs)
+    assert "urls" not in result and not result["cached"]
+    entry = decode_extracted(result, cache.get(str(markdown)))
+    assert result["urls"] == ["https://www.google.com/"]
+    cache.update(str(markdown), entry, result["cached"])
+    cache.save()
+    assert cache.misses == 1 and not cache.hits
+
+    # A new cache loads the entry, and the file isn't extracted again
+    cache = ExtractionCache(cache_file)
+    result = extract_task(cache_entry=get_stamp(cache.get(str(markdown))), **kwargs)
+    assert result["cached"] and "links" not in result
+    decode_extracted(result, cache.get(str(markdown)))
+    assert result["urls"] == ["https://www.google.com/"]
+
+    # Different settings discard the cache
+    cache = ExtractionCache(cache_file, settings={"max_file_size": 10})
+    assert not cache.get(str(markdown))
+
+
+def test_result_cache():
+    """
+    test that threads needing the same url wait for a single check
+    """
+    result_cache = ResultCache()
+    checks = []
+
+    def check(url):
+        passed = result_cache.claim(url)
+        if passed is None:
+            checks.append(url)
+            time.sleep(0.05)
+            passed = url.endswith("ok")
+            result_cache.record(url, passed)
+        return passed
+
+    urls = ["https://a/ok", "https://b/fail"] * 8
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(check, urls))
+    assert results == [True, False] * 8
+    assert sorted(checks) == ["https://a/ok", "https://b/fail"]
+    assert (result_cache.misses, result_cache.hits) == (2, 14)
+
+    # Results older than max_age are checked again
+    result_cache = ResultCache(max_age=0.05)
+    assert result_cache.claim("https://a/ok") is None
+    result_cache.record("https://a/ok", True)
+    assert result_cache.claim("https://a/ok") is True
+    time.sleep(0.1)
+    assert result_cache.claim("https://a/ok") is None
+
+    # A thread whose awaited result is gone takes the claim itself
+    result_cache = ResultCache()
+    assert result_cache.claim("https://a/ok") is None
+    claims = []
+    waiter = threading.Thread(
+        target=lambda: claims.append(result_cache.claim("https://a/ok"))
+    )
+    waiter.start()
+    time.sleep(0.05)
+    with result_cache.lock:
+        event = result_cache.pending.pop("https://a/ok")
+    event.set()
+    waiter.join()
+    assert claims == [None] and "https://a/ok" in result_cache.pending
+
+    # Expired results are removed as others are recorded
+    result_cache = ResultCache(max_age=0.05)
+    result_cache.record("https://b/ok", True)
+    time.sleep(0.1)
+    result_cache.record("https://a/ok", True)
+    assert list(result_cache.results) == ["https://a/ok"]
+    assert list(result_cache.checked) == ["https://a/ok"]
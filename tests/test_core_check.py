@@ -161,3 +161,238 @@ def test_check_run_save(tmp_path, retry_count):
     for line in lines[1:]:
         url, result, filename = line.split(",")
         assert not filename.startswith(root)
+
+
+def test_save_locations(tmp_path):
+    """
+    test saving a row with the line and column of each url occurrence
+    """
+    checker = UrlChecker()
+    checker.checks["README.md"] = {
+        "failed": ["https://none.html"],
+        "passed": ["https://www.google.com/"],
+        "excluded": [],
+        "urls": ["https://www.google.com/", "https://none.html"],
+        "occurrences": [(0, 2, 14), (1, 3, 3), (0, 3, 34)],
+    }
+    output_file = os.path.join(str(tmp_path), "results.csv")
+    checker.save_results(output_file, locations=True)
+    with open(output_file, "r") as filey:
+        lines = filey.read().splitlines()
+    assert lines == [
+        "URL,RESULT,FILENAME,LINE,COLUMN",
+        "https://none.html,failed,README.md,3,3",
+        "https://www.google.com/,passed,README.md,2,14",
+        "https://www.google.com/,passed,README.md,3,34",
+    ]
+
+
+def test_check_revision(tmp_path):
+    """
+    test checking files at a git revision, read from the object store
+    """
+    from tests.test_main_github import make_repo
+
+    path = make_repo(tmp_path)
+
+    # The working tree has uncommitted changes, but main is read from git
+    checker = UrlChecker(path=path, file_types=[".md"], revision="main", serial=True)
+    assert sorted(checker.file_paths) == [
+        os.path.join(path, "README.md"),
+        os.path.join(path, "docs", "other.md"),
+    ]
+    checker.run(exclude_patterns=["example.com"])
+    readme = checker.checks[os.path.join(path, "README.md")]
+    assert readme["excluded"] == ["https://old.example.com/"]
+    assert readme["occurrences"] == [(0, 1, 7)]
+
+    # A subfolder of a bare repository, and large files are not read
+    checker = UrlChecker(
+        path=os.path.join(path, ".git"),
+        file_types=[".md"],
+        revision="main",
+        subfolder="docs",
+        max_file_size=10,
+        serial=True,
+    )
+    checker.run()
+    assert list(checker.skipped.values()) == ["larger than 10 bytes"]
+
+
+def test_iter_run(tmp_path, capsys):
+    """
+    test that results stream to a callback as each file finishes
+    """
+    import requests
+    from unittest import mock
+    from urlchecker.core.urlproc import UrlCheckResult
+
+    def make_response(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    for name in ["one", "two"]:
+        (tmp_path / ("%s.md" % name)).write_text("https://%s.example.com/\n" % name)
+
+    streamed = []
+    checker = UrlChecker(path=str(tmp_path), file_types=[".md"], serial=True)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+        with mock.patch.object(
+            UrlCheckResult, "make_request", side_effect=make_response
+        ):
+            results = checker.run(
+                on_result=lambda file_name, result: streamed.append(
+                    (os.path.basename(file_name), result["passed"])
+                ),
+                progress=True,
+            )
+    assert sorted(streamed) == [
+        ("one.md", ["https://one.example.com/"]),
+        ("two.md", ["https://two.example.com/"]),
+    ]
+    assert len(results["passed"]) == 2
+    assert "2 files, 2 urls checked (0 failed)" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("serial", [False, True])
+def test_task_error(tmp_path, serial):
+    """
+    test that a file whose check raises is skipped with the error, and the
+    other files are still checked
+    """
+    from unittest import mock
+    from urlchecker.core.urlproc import UrlCheckResult
+
+    def check_urls(self, *args, **kwargs):
+        if self.file_name.endswith("bad.md"):
+            raise RuntimeError("cannot check")
+        self.passed = list(self.urls)
+
+    for name in ["good", "bad"]:
+        (tmp_path / ("%s.md" % name)).write_text("https://%s.example.com/\n" % name)
+
+    checker = UrlChecker(path=str(tmp_path), file_types=[".md"], serial=serial)
+    with mock.patch.object(UrlCheckResult, "check_urls", check_urls):
+        results = checker.run()
+    assert results["passed"] == {"https://good.example.com/"}
+    assert checker.skipped == {
+        str(tmp_path / "bad.md"): "errored (RuntimeError: cannot check)"
+    }
+
+
+@pytest.mark.parametrize("serial", [False, True])
+def test_url_batches(tmp_path, serial):
+    """
+    test that a file with many urls is checked in batches across threads,
+    and the web driver is only started for urls that need it
+    """
+    import requests
+    from unittest import mock
+    from urlchecker.core.check import split_check_task
+    from urlchecker.core.urlproc import UrlCheckResult
+
+    def make_response(url, *args, **kwargs):
+        response = requests.Response()
+        response.status_code = 500 if "broken" in url else 200
+        return response
+
+    urls = ["https://example.com/%s" % number for number in range(20)]
+    urls.append("https://example.com/broken")
+    (tmp_path / "many.md").write_text("\n".join(urls) + "\n")
+    (tmp_path / "few.md").write_text("https://example.com/few\n")
+
+    parts = split_check_task({"urls": urls}, batch_size=8)
+    assert [len(part["check_urls"]) for part in parts] == [8, 8, 5]
+    assert len(split_check_task({"urls": urls, "added_urls": urls[:3]})) == 1
+
+    checker = UrlChecker(path=str(tmp_path), file_types=[".md"], serial=serial)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None) as driver:
+        with mock.patch.object(
+            UrlCheckResult, "make_request", side_effect=make_response
+        ):
+            results = checker.run(exclude_urls=["https://example.com/0"], retry_count=1)
+    assert driver.call_count == 1
+
+    many = checker.checks[str(tmp_path / "many.md")]
+    assert len(many["urls"]) == 21
+    assert many["excluded"] == ["https://example.com/0"]
+    assert many["failed"] == ["https://example.com/broken"]
+    assert sorted(many["passed"]) == sorted(urls[1:-1])
+    assert results["passed"] == set(urls[1:-1] + ["https://example.com/few"])
+
+    # Each url checked has one record, across batches
+    records = {record.url: record for record in checker.iter_records()}
+    assert len(records) == 21
+    assert records["https://example.com/broken"].status == 500
+    assert not records["https://example.com/broken"].passed
+
+
+def test_stream_save(tmp_path):
+    """
+    test that results are written as each file finishes, with every
+    location in the saved file
+    """
+    import json
+    import requests
+    from unittest import mock
+    from urlchecker.core.urlproc import UrlCheckResult
+
+    def make_response(url, *args, **kwargs):
+        response = requests.Response()
+        response.status_code = 500 if "broken" in url else 200
+        return response
+
+    (tmp_path / "one.md").write_text("https://one.example.com/\n")
+    (tmp_path / "two.md").write_text("text https://broken.example.com/\n")
+
+    output_file = str(tmp_path / "results.jsonl")
+    checker = UrlChecker(path=str(tmp_path), file_types=[".md"], serial=True)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+        with mock.patch.object(
+            UrlCheckResult, "make_request", side_effect=make_response
+        ):
+            checker.run(retry_count=1, save=output_file, save_locations=True)
+    with open(output_file, "r") as filey:
+        rows = sorted(
+            [json.loads(line) for line in filey], key=lambda row: row["filename"]
+        )
+    assert rows == [
+        {
+            "url": "https://one.example.com/",
+            "result": "passed",
+            "filename": "one.md",
+            "line": 1,
+            "column": 1,
+        },
+        {
+            "url": "https://broken.example.com/",
+            "result": "failed",
+            "filename": "two.md",
+            "line": 1,
+            "column": 6,
+        },
+    ]
+    assert checker.results["passed"] == {"https://one.example.com/"}
+    assert checker.get_locations(str(tmp_path / "two.md")) == {
+        "https://broken.example.com/": [(1, 6)]
+    }
+
+    # A database also keeps each attempt to check a url
+    import sqlite3
+
+    output_file = str(tmp_path / "results.db")
+    checker = UrlChecker(path=str(tmp_path), file_types=[".md"], serial=True)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+        with mock.patch.object(
+            UrlCheckResult, "make_request", side_effect=make_response
+        ):
+            checker.run(retry_count=1, save=output_file)
+    db = sqlite3.connect(output_file)
+    assert db.execute(
+        "SELECT url, status, attempt FROM attempts"
+        " JOIN urls ON urls.id = url_id ORDER BY url"
+    ).fetchall() == [
+        ("https://broken.example.com/", 500, 1),
+        ("https://one.example.com/", 200, 1),
+    ]
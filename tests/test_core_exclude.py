@@ -1,5 +1,10 @@
 import pytest
-from urlchecker.core.exclude import excluded
+from urlchecker.core.exclude import (
+    AUTOMATON_MIN_PATTERNS,
+    ExcludeMatcher,
+    PatternAutomaton,
+    excluded,
+)
 
 
 def test_whitelisted():
@@ -16,3 +21,50 @@ def test_whitelisted():
 
     # Pattern provided as white list
     assert excluded(url, [], ["https://excluded/"])
+
+
+def test_exclude_matcher():
+    """
+    test the compiled exclude matcher against the excluded function
+    """
+    urls = [
+        "https://excluded/subpage",
+        "https://example.com/page",
+        "http://localhost:8000/",
+    ]
+    patterns = ["excluded/", "nothing-%s" % ("x" * 3)]
+
+    # Small and large pattern lists use a loop and the automaton respectively
+    for extra in [0, AUTOMATON_MIN_PATTERNS]:
+        more = patterns + ["https://host%s.org/" % i for i in range(extra)]
+        matcher = ExcludeMatcher(["https://example.com/page"], more)
+        if extra:
+            assert matcher.automaton is not None
+        for url in urls:
+            assert matcher(url) == excluded(url, ["https://example.com/page"], more)
+        assert url in matcher.seen
+
+    # Globs and regular expressions
+    matcher = ExcludeMatcher(
+        exclude_globs=["https://*.com/*"],
+        exclude_regexes=[r"^https?://localhost(:\d+)?/"],
+    )
+    assert [matcher(url) for url in urls] == [False, True, True]
+    assert not ExcludeMatcher()
+
+    # A glob matches the whole url, not a url inside another
+    matcher = ExcludeMatcher(exclude_globs=["http://a.com/*"])
+    assert matcher("http://a.com/x")
+    assert not matcher("https://evil.com/?r=http://a.com/x")
+
+
+def test_pattern_automaton():
+    """
+    test that the automaton finds patterns that overlap or are suffixes
+    """
+    automaton = PatternAutomaton(["he", "she", "his", "hers"])
+    assert automaton.search("ushers")
+    assert automaton.search("ahis")
+    assert not automaton.search("hi")
+    assert not automaton.search("")
+    assert PatternAutomaton([""]).search("anything")
@@ -1,9 +1,13 @@
 import os
+import json
 import pytest
 import tempfile
+from urlchecker.core import extractors, fileproc
 from urlchecker.core.fileproc import (
     check_file_type,
     get_file_paths,
+    get_extractor,
+    sniff_file,
     collect_links_from_file,
     include_file,
     remove_empty,
@@ -99,6 +103,47 @@ def test_get_file_paths(base_path, file_types):
         assert found in expected_paths
 
 
+def test_get_file_paths_pruned(tmp_path):
+    """
+    test that pruned and excluded directories are skipped
+    """
+    for dirname in [".git", "node_modules", "docs", "build", "src"]:
+        os.makedirs(os.path.join(str(tmp_path), dirname))
+        with open(os.path.join(str(tmp_path), dirname, "README.md"), "w") as fd:
+            fd.write("https://www.google.com/")
+
+    base_path = str(tmp_path)
+    file_paths = get_file_paths(base_path, [".md"], exclude_files=["build/"])
+    assert sorted(os.path.relpath(x, base_path) for x in file_paths) == [
+        os.path.join("docs", "README.md"),
+        os.path.join("src", "README.md"),
+    ]
+
+    # An anchored pattern can't prune the directory, but still excludes files
+    file_paths = get_file_paths(
+        base_path, [".md"], exclude_files=["src/README.md$"], prune_directories=[]
+    )
+    assert sorted(os.path.relpath(x, base_path) for x in file_paths) == [
+        os.path.join(".git", "README.md"),
+        os.path.join("build", "README.md"),
+        os.path.join("docs", "README.md"),
+        os.path.join("node_modules", "README.md"),
+    ]
+
+
+@pytest.mark.parametrize("workers", [2, 8])
+def test_get_file_paths_parallel(workers):
+    """
+    test that a parallel walk finds the same files as a serial walk
+    """
+    for file_types in [[".md", ".py"], [".txt"]]:
+        serial = get_file_paths(".", file_types, exclude_files=["tests/"])
+        parallel = get_file_paths(
+            ".", file_types, exclude_files=["tests/"], workers=workers
+        )
+        assert sorted(parallel) == sorted(serial)
+
+
 @pytest.mark.parametrize(
     "file_path",
     ["tests/test_files/sample_test_file.md", "tests/test_files/sample_test_file.md"],
@@ -112,6 +157,246 @@ def collect_links_from_file(file_path):
     assert len(url) == 3
 
 
+@pytest.mark.parametrize(
+    "file_path,extractor",
+    [
+        ("README.md", extractors.extract_markdown),
+        ("docs/index.rst", extractors.extract_rst),
+        ("site/index.HTML", extractors.extract_html),
+        ("analysis.ipynb", extractors.extract_notebook),
+        ("script.py", extractors.extract_text),
+    ],
+)
+def test_get_extractor(file_path, extractor):
+    """
+    test that extractors are selected by extension, with text as fallback
+    """
+    assert get_extractor(file_path) == extractor
+
+
+def test_collect_links_from_html(tmp_path):
+    """
+    test that html links come from attributes and text, but not scripts
+    """
+    html_file = os.path.join(str(tmp_path), "index.html")
+    with open(html_file, "w") as fd:
+        fd.write(
+            '<html><head><script>var u = "https://script.example.com/x";</script>'
+            '<style>body { background: url("https://style.example.com/bg.png"); }</style>'
+            '</head><body><a href="https://github.com/urlstechie?a=1&amp;b=2">link</a>'
+            '<img src="https://img.shields.io/badge.svg"/>'
+            "<p>Visit https://www.google.com/ today</p></body></html>"
+        )
+    urls = fileproc.collect_links_from_file(html_file)
+    assert sorted(urls) == [
+        "https://github.com/urlstechie?a=1&b=2",
+        "https://img.shields.io/badge.svg",
+        "https://www.google.com/",
+    ]
+
+
+def test_html_chunks(tmp_path):
+    """
+    test that a url in text across the boundary of a chunk is kept whole
+    """
+    html_file = os.path.join(str(tmp_path), "index.html")
+    url = "https://www.example.com/across/the/chunk"
+    with open(html_file, "w") as fd:
+        fd.write("<p>" + "x" * (extractors.CHUNK_SIZE - 20) + " " + url + " </p>\n")
+        fd.write("<p>%s %s</p>" % ("y" * extractors.CHUNK_SIZE, url + "/2"))
+    assert fileproc.collect_links_from_file(html_file) == [url, url + "/2"]
+
+
+def test_collect_links_from_notebook(tmp_path):
+    """
+    test that notebook outputs are skipped, and invalid json falls back
+    """
+    notebook = {
+        "cells": [
+            {
+                "cell_type": "markdown",
+                "source": ["See [docs](https://docs.python.org/3)"],
+            },
+            {
+                "cell_type": "code",
+                "source": 'requests.get("https://github.com/urlstechie")',
+                "outputs": [{"text": ["https://output.example.com/ignored"]}],
+            },
+        ]
+    }
+    notebook_file = os.path.join(str(tmp_path), "analysis.ipynb")
+    with open(notebook_file, "w") as fd:
+        json.dump(notebook, fd)
+    urls = fileproc.collect_links_from_file(notebook_file)
+    assert sorted(urls) == [
+        "https://docs.python.org/3",
+        "https://github.com/urlstechie",
+    ]
+
+    # A notebook that isn't valid json is scanned as text
+    with open(notebook_file, "w") as fd:
+        fd.write("not json https://www.google.com/")
+    assert fileproc.collect_links_from_file(notebook_file) == [
+        "https://www.google.com/"
+    ]
+
+    # As is json that isn't laid out like a notebook
+    for malformed in [
+        [1, 2, "https://www.google.com/"],
+        {"cells": "https://www.google.com/"},
+        {"cells": [1, {"cell_type": "code", "source": "https://www.google.com/"}]},
+        {"cells": [{"cell_type": "code", "source": 1}], "x": "https://www.google.com/"},
+        {
+            "worksheets": [{"cells": [{"cell_type": "code", "input": [None]}]}],
+            "x": "https://www.google.com/",
+        },
+    ]:
+        with open(notebook_file, "w") as fd:
+            json.dump(malformed, fd)
+        assert fileproc.collect_links_from_file(notebook_file) == [
+            "https://www.google.com/"
+        ]
+
+
+def test_collect_link_occurrences(tmp_path):
+    """
+    test that each occurrence of a url has a line and column
+    """
+    markdown = os.path.join(str(tmp_path), "README.md")
+    with open(markdown, "w") as fd:
+        fd.write(
+            "# Title\n"
+            "See [google](https://www.google.com/) and\n"
+            "  https://github.com/urlstechie or https://www.google.com/\n"
+        )
+    urls, occurrences = fileproc.collect_link_occurrences(markdown)
+    assert urls == ["https://www.google.com/", "https://github.com/urlstechie"]
+    assert occurrences == [(0, 2, 14), (1, 3, 3), (0, 3, 36)]
+    assert fileproc.index_occurrences(urls, occurrences) == {
+        "https://www.google.com/": [(2, 14), (3, 36)],
+        "https://github.com/urlstechie": [(3, 3)],
+    }
+
+    # Packed to send between processes, and back
+    packed = fileproc.pack_links(urls, occurrences)
+    assert packed[0] == "https://www.google.com/https://github.com/urlstechie"
+    assert packed[2] == "H"
+    assert fileproc.unpack_links(packed) == (urls, occurrences)
+    assert fileproc.unpack_links(fileproc.pack_links([], [])) == ([], [])
+
+    # Any character can be in a url, even a NUL from a corrupt file
+    urls = ["https://a.com/\0x", "", "https://b.com/"]
+    occurrences = [(0, 1, 1), (2, 1, 20)]
+    packed = fileproc.pack_links(urls, occurrences)
+    assert fileproc.unpack_links(packed) == (urls, occurrences)
+    with pytest.raises(AssertionError):
+        fileproc.unpack_links(fileproc.pack_links(urls[:2], occurrences))
+
+
+def test_html_and_notebook_occurrences(tmp_path):
+    """
+    test that html attribute values are positioned where the value starts,
+    and notebook urls (parsed out of the json) have no locations
+    """
+    html_file = os.path.join(str(tmp_path), "index.html")
+    with open(html_file, "w") as fd:
+        fd.write(
+            '<p>text <a href="https://x.example.com/">x</a></p>\n'
+            '<img\n  alt="a" title="src=https://no.example.com/"'
+            " src='https://y.example.com/i.png'/>\n"
+        )
+    urls, occurrences = fileproc.collect_link_occurrences(html_file)
+    assert urls == ["https://x.example.com/", "https://y.example.com/i.png"]
+    assert occurrences == [(0, 1, 18), (1, 3, 52)]
+
+    notebook_file = os.path.join(str(tmp_path), "analysis.ipynb")
+    with open(notebook_file, "w") as fd:
+        json.dump({"cells": [{"cell_type": "code", "source": "https://x.com"}]}, fd)
+    assert fileproc.collect_link_occurrences(notebook_file) == (
+        ["https://x.com"],
+        [],
+    )
+
+
+def test_collect_added_links():
+    """
+    test that links in added lines match those the file's extractor finds
+    """
+    html = ['<a href="https://example.com/?a=1&amp;b=2">link</a>']
+    assert fileproc.collect_added_links("index.html", html) == [
+        "https://example.com/?a=1&amp;b=2",
+        "https://example.com/?a=1&b=2",
+    ]
+
+    # Lines of a notebook's json are read as the strings they hold
+    notebook = ['    "See \\"https://example.com/caf\\u00e9\\"\\n",']
+    assert "https://example.com/caf\u00e9" in fileproc.collect_added_links(
+        "analysis.ipynb", notebook
+    )
+    assert fileproc.collect_added_links("README.md", ["[a](https://a.com/)"]) == [
+        "https://a.com/"
+    ]
+
+
+def test_fragment_positions():
+    """
+    test the positions of many links in one fragment that spans lines
+    """
+    text = (
+        "see https://a.com/ and https://b.com/\n\n  https://c.com/ x https://d.com/\n"
+    )
+    urls, occurrences = fileproc.collect_occurrences([(5, 3, text * 200)])
+    assert urls == [
+        "https://a.com/",
+        "https://b.com/",
+        "https://c.com/",
+        "https://d.com/",
+    ]
+    assert occurrences[:6] == [
+        (0, 5, 7),
+        (1, 5, 26),
+        (2, 7, 3),
+        (3, 7, 20),
+        (0, 8, 5),
+        (1, 8, 24),
+    ]
+    assert occurrences[-1] == (3, 5 + 3 * 199 + 2, 20)
+
+
+def test_sniff_file(tmp_path):
+    """
+    test that binary, large, and non utf-8 files are detected
+    """
+    text_file = os.path.join(str(tmp_path), "text.md")
+    with open(text_file, "w", encoding="utf-8") as fd:
+        fd.write("Caf\u00e9 https://www.google.com/")
+    assert sniff_file(text_file) == ("utf-8", None)
+
+    # Too large for the limit, but a limit of 0 disables it
+    encoding, reason = sniff_file(text_file, max_file_size=10)
+    assert not encoding and "larger" in reason
+    assert sniff_file(text_file, max_file_size=0) == ("utf-8", None)
+
+    binary_file = os.path.join(str(tmp_path), "image.md")
+    with open(binary_file, "wb") as fd:
+        fd.write(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")
+    assert sniff_file(binary_file) == (None, "binary")
+
+    # Latin-1 content falls back instead of failing to decode
+    latin_file = os.path.join(str(tmp_path), "latin.md")
+    with open(latin_file, "wb") as fd:
+        fd.write("Caf\u00e9 https://www.google.com/".encode("latin-1"))
+    assert sniff_file(latin_file) == ("latin-1", None)
+    urls = fileproc.collect_links_from_file(latin_file, encoding="latin-1")
+    assert urls == ["https://www.google.com/"]
+
+    # Utf-16 has NUL bytes, but the byte order mark identifies it as text
+    utf16_file = os.path.join(str(tmp_path), "utf16.md")
+    with open(utf16_file, "w", encoding="utf-16") as fd:
+        fd.write("https://www.google.com/")
+    assert sniff_file(utf16_file) == ("utf-16", None)
+
+
 def test_remove_empty():
     """
     test that empty urls are removed
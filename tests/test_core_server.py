@@ -0,0 +1,95 @@
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from urlchecker.core.check import UrlChecker
+from urlchecker.core.server import UrlCheckServer, get_status, request_check
+from urlchecker.core.urlproc import UrlCheckResult
+
+
+def test_server(tmp_path):
+    """
+    test that a server checks urls for clients, checking each url once
+    """
+    checked = []
+
+    def make_response(self, url, *args, **kwargs):
+        checked.append(url)
+        response = requests.Response()
+        response.status_code = 500 if "broken" in url else 200
+        return response
+
+    urls = ["https://example.com/%s" % number for number in range(20)]
+    urls.append("https://example.com/broken")
+    (tmp_path / "links.md").write_text("\n".join(urls) + "\n")
+
+    server = UrlCheckServer(port=0, workers=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert get_status(server.url)["results"] == 0
+        with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+            with mock.patch.object(UrlCheckResult, "make_request", make_response):
+
+                # Concurrent clients asking for the same urls
+                with ThreadPoolExecutor(3) as executor:
+                    results = list(
+                        executor.map(
+                            lambda _: request_check(
+                                server.url,
+                                urls,
+                                retry_count=1,
+                                exclude_urls=["https://example.com/0"],
+                            ),
+                            range(3),
+                        )
+                    )
+
+                # A thin client extracts urls and sends them to the server
+                checker = UrlChecker(path=str(tmp_path), file_types=[".md"])
+                result = checker.run(server=server.url, retry_count=1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    for client in results:
+        assert sorted(client["passed"]) == sorted(urls[1:-1])
+        assert client["failed"] == ["https://example.com/broken"]
+        assert client["excluded"] == ["https://example.com/0"]
+    assert sorted(checked) == sorted(urls)
+    assert result["failed"] == {"https://example.com/broken"}
+    assert result["passed"] == set(urls[:-1])
+    assert get_status(server.url) is None
+
+
+def test_server_options():
+    """
+    test that results are kept for each set of check options, and that
+    unexpected errors are reported to the client
+    """
+
+    def make_response(self, url, timeout=5, headers=None, verify=True):
+        response = requests.Response()
+        response.status_code = 500 if verify else 200
+        return response
+
+    url = "https://self-signed.example.com/"
+    server = UrlCheckServer(port=0, workers=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+            with mock.patch.object(UrlCheckResult, "make_request", make_response):
+                assert server.check([url], retry_count=1)["failed"] == [url]
+                result = server.check([url], retry_count=1, no_check_certs=True)
+                assert result["passed"] == [url]
+                assert server.status["results"] == 2
+
+        with mock.patch.object(server, "check", side_effect=RuntimeError("broken")):
+            response = requests.post(server.url + "/check", json={"urls": [url]})
+        assert response.status_code == 500
+        assert response.json() == {"error": "RuntimeError: broken"}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,109 @@
+import json
+import os
+import pytest
+from urlchecker.core.sink import CsvSink, JsonlSink, get_sink
+
+
+def test_csv_sink(tmp_path):
+    """
+    test writing rows to a csv file, flushed as they are written
+    """
+    output_file = os.path.join(str(tmp_path), "results.csv")
+    sink = get_sink(output_file, ["URL", "RESULT"], flush_every=2)
+    assert isinstance(sink, CsvSink)
+
+    # Rows are on disk once enough are written, before the sink is closed
+    sink.write([["https://one.example.com/", "passed"]])
+    sink.write([["https://two.example.com/", "failed"]])
+    with open(output_file, "r") as filey:
+        assert filey.read().splitlines() == [
+            "URL,RESULT",
+            "https://one.example.com/,passed",
+            "https://two.example.com/,failed",
+        ]
+    sink.close()
+    assert sink.rows == 2
+
+
+def test_jsonl_sink(tmp_path):
+    """
+    test writing rows to a json lines file, keyed by the header
+    """
+    output_file = os.path.join(str(tmp_path), "results.jsonl")
+    with get_sink(output_file, ["URL", "RESULT"], sep="\t") as sink:
+        assert isinstance(sink, JsonlSink)
+        sink.write([["https://one.example.com/", "passed"]])
+    with open(output_file, "r") as filey:
+        rows = [json.loads(line) for line in filey]
+    assert rows == [{"url": "https://one.example.com/", "result": "passed"}]
+
+
+def test_sink_missing_directory(tmp_path):
+    """
+    test that saving to a directory that doesn't exist exits
+    """
+    with pytest.raises(SystemExit):
+        get_sink(os.path.join(str(tmp_path), "missing", "results.csv"), ["URL"])
+
+
+def test_sqlite_sink(tmp_path):
+    """
+    test that each run adds its occurrences and attempts to a database
+    """
+    import sqlite3
+    from urlchecker.core.sink import SqliteSink
+    from urlchecker.core.urlproc import Attempt, UrlRecord
+
+    output_file = os.path.join(str(tmp_path), "results.db")
+    result = {
+        "failed": ["https://slow.example.com/"],
+        "passed": ["https://example.com/"],
+        "excluded": [],
+        "urls": ["https://example.com/", "https://slow.example.com/"],
+        "occurrences": [(0, 2, 14), (1, 3, 3), (0, 3, 34)],
+        "records": [
+            UrlRecord("https://example.com/", passed=True, status=200),
+            UrlRecord(
+                "https://slow.example.com/",
+                error="ReadTimeout",
+                attempts=(Attempt(elapsed=5.0, error="ReadTimeout"),),
+            ),
+        ],
+    }
+    for _ in range(2):
+        with get_sink(output_file, ["URL", "RESULT", "FILENAME"]) as sink:
+            assert isinstance(sink, SqliteSink)
+            sink.write_result("README.md", result, [], path="docs")
+
+    db = sqlite3.connect(output_file)
+    assert db.execute("SELECT COUNT(*) FROM runs WHERE finished").fetchone() == (2,)
+    assert db.execute(
+        "SELECT result, path, file, line, column FROM occurrences"
+        " JOIN urls ON urls.id = url_id WHERE run_id = 2 ORDER BY line, column"
+    ).fetchall() == [
+        ("passed", "docs", "README.md", 2, 14),
+        ("failed", "docs", "README.md", 3, 3),
+        ("passed", "docs", "README.md", 3, 34),
+    ]
+    assert db.execute(
+        "SELECT host, COUNT(*), AVG(elapsed), error FROM attempts"
+        " JOIN urls ON urls.id = url_id GROUP BY host"
+    ).fetchall() == [("slow.example.com", 2, 5.0, "ReadTimeout")]
+
+    # Rows can be written too, as occurrences
+    with get_sink(output_file, ["PATH", "URL", "RESULT", "FILENAME"]) as sink:
+        sink.write([["docs", "https://example.com/", "passed", "index.md"]])
+    assert db.execute(
+        "SELECT url, result, path, file, line FROM occurrences"
+        " JOIN urls ON urls.id = url_id WHERE run_id = 3"
+    ).fetchall() == [("https://example.com/", "passed", "docs", "index.md", None)]
+
+
+def test_sink_abstract(tmp_path):
+    """
+    test that a sink must implement write_row
+    """
+    from urlchecker.core.sink import ResultSink
+
+    with pytest.raises(TypeError):
+        ResultSink(os.path.join(str(tmp_path), "results.txt"), ["URL"])
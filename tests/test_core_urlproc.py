@@ -54,6 +54,17 @@ def test_check_urls(file):
         )
 
 
+def test_skipped_file(tmp_path):
+    """
+    test that a binary file is skipped with a reason, and not extracted
+    """
+    binary_file = tmp_path / "data.py"
+    binary_file.write_bytes(b"\x00\x01https://www.google.com/")
+    checker = UrlCheckResult(file_name=str(binary_file))
+    assert checker.skipped == "binary"
+    assert not checker.urls
+
+
 def test_get_user_agent():
     ua = get_user_agent()
     assert isinstance(ua, dict)
@@ -73,3 +84,46 @@ def test_check_response_status_code():
     )
     assert check_response_status_code("https://this-should-fail", failedResponse)
     assert check_response_status_code("https://this-should-also-fail", None)
+
+
+def test_record_attempts():
+    """
+    test that each request is recorded, with the status, redirect and error
+    """
+    import requests
+    from unittest import mock
+
+    class Session:
+        def head(self, url, **kwargs):
+            if "down" in url:
+                raise requests.ConnectionError("down")
+            response = requests.Response()
+            response.url = url
+            response.status_code = 301 if "moved" in url else 200
+            response.headers["location"] = "https://example.com/new"
+            response._content = b""
+            return response
+
+    urls = ["https://example.com/", "https://example.com/moved", "https://down.com/"]
+    checker = UrlCheckResult(print_all=False, session=Session(), record_attempts=True)
+    with mock.patch.object(UrlCheckResult, "get_driver", return_value=None):
+        checker.check_urls(urls, retry_count=1)
+
+    records = {record.url: record for record in checker.records}
+    assert len(records) == 3
+    assert records["https://example.com/"].passed
+    assert records["https://example.com/"].attempts[0].redirect is None
+    moved = records["https://example.com/moved"]
+    assert not moved.passed and moved.status == 301 and moved.tries == 1
+    assert [attempt.status for attempt in moved.attempts] == [301]
+    assert moved.attempts[0].redirect == "https://example.com/new"
+    down = records["https://down.com/"]
+    assert down.status == 0 and down.error == "ConnectionError"
+    assert not down.driver
+    assert down.to_dict()["attempts"][0]["error"] == "ConnectionError"
+
+    # Records are small, and attempts are only kept if requested
+    assert not hasattr(down, "__dict__")
+    checker = UrlCheckResult(print_all=False, session=Session())
+    checker.check_urls(urls[:1])
+    assert checker.records[0].passed and checker.records[0].attempts == ()
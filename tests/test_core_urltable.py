@@ -0,0 +1,52 @@
+from urlchecker.core.urltable import CheckResults, ResultSets, UrlTable
+
+
+def test_url_table():
+    """
+    test that each distinct url is kept once, with an id
+    """
+    table = UrlTable()
+    ids = table.intern(["https://one.com/", "https://two.com/", "https://one.com/"])
+    assert list(ids) == [0, 1, 0]
+    assert len(table) == 2 and "https://two.com/" in table
+    assert table[1] == "https://two.com/"
+
+    # The same url from another file is the table's string
+    url = "".join(["https://", "one.com/"])
+    assert table.canonical([url])[0] is table[0]
+
+
+def test_check_results():
+    """
+    test that results are stored as url ids and projected back
+    """
+    checks = CheckResults()
+    results = ResultSets(checks)
+    result = {
+        "failed": ["https://none.html"],
+        "passed": ["https://www.google.com/"],
+        "excluded": [],
+        "skipped": None,
+        "urls": ["https://www.google.com/", "https://none.html"],
+        "occurrences": [(0, 2, 14), (1, 3, 3), (0, 70000, 34)],
+        "records": [],
+        "cached": True,
+    }
+    checks["README.md"] = result
+    assert checks["README.md"] == result
+    assert list(checks) == ["README.md"]
+    assert results["failed"] == {"https://none.html"}
+
+    # Changing a projection doesn't change what is kept
+    checks["README.md"]["failed"].append("https://other.html")
+    assert checks["README.md"]["failed"] == ["https://none.html"]
+
+    # The sets follow new results
+    checks["other.md"] = dict(result, failed=[], passed=["https://none.html"])
+    assert results["passed"] == {"https://www.google.com/", "https://none.html"}
+    assert len(checks.table) == 2
+    assert dict(results) == {
+        "failed": {"https://none.html"},
+        "passed": {"https://www.google.com/", "https://none.html"},
+        "excluded": set(),
+    }
@@ -0,0 +1,234 @@
+import asyncio
+import time
+import pytest
+from urlchecker.core import worker
+from urlchecker.core.worker import Pipeline, Workers
+
+
+def extract_length(*args, **kwargs):
+    return {"length": len(kwargs["name"])}
+
+
+def check_length(*args, **kwargs):
+    return kwargs["length"] * 2
+
+
+@pytest.mark.parametrize("serial", [False, True])
+@pytest.mark.parametrize("extract_workers", [1, 2])
+@pytest.mark.parametrize("backend", ["process", "thread"])
+def test_pipeline(serial, extract_workers, backend):
+    """
+    test that tasks stream through extract and then check
+    """
+    names = ["a", "bb", "ccc", "dddd"]
+    tasks = ((name, {"name": name}) for name in names)
+    pipeline = Pipeline(
+        extract_workers=extract_workers, check_workers=2, serial=serial, backend=backend
+    )
+    results = dict(pipeline.run(extract_length, check_length, tasks))
+    assert results == {"a": 2, "bb": 4, "ccc": 6, "dddd": 8}
+
+
+def extract_or_raise(*args, **kwargs):
+    if kwargs["name"] == "bad extract":
+        raise ValueError("cannot extract")
+    return extract_length(**kwargs)
+
+
+def check_or_raise(*args, **kwargs):
+    if kwargs["name"] == "bad check":
+        raise RuntimeError("cannot check")
+    return check_length(**kwargs)
+
+
+@pytest.mark.parametrize("serial", [False, True])
+@pytest.mark.parametrize("backend", ["process", "thread"])
+def test_pipeline_errors(serial, backend):
+    """
+    test that a task that raises is reported, and the others continue
+    """
+    names = ["a", "bad extract", "bb", "bad check", "ccc"]
+    pipeline = Pipeline(
+        extract_workers=2, check_workers=2, serial=serial, backend=backend
+    )
+    tasks = ((name, {"name": name}) for name in names)
+    results = dict(
+        pipeline.run(
+            extract_or_raise, check_or_raise, tasks, on_error=lambda key, error: error
+        )
+    )
+    assert results == {
+        "a": 2,
+        "bad extract": "ValueError: cannot extract",
+        "bb": 4,
+        "bad check": "RuntimeError: cannot check",
+        "ccc": 6,
+    }
+
+    # Without on_error, tasks that raise are left out
+    tasks = ((name, {"name": name}) for name in names)
+    results = dict(pipeline.run(extract_or_raise, check_or_raise, tasks))
+    assert results == {"a": 2, "bb": 4, "ccc": 6}
+
+
+def sleep_check(*args, **kwargs):
+    time.sleep(0.5)
+    return kwargs["length"]
+
+
+def test_pipeline_close():
+    """
+    test that checks that haven't started are cancelled if the caller stops
+    """
+    tasks = (("%s" % number, {"name": "a"}) for number in range(20))
+    pipeline = Pipeline(extract_workers=1, check_workers=1)
+    start = time.time()
+    results = pipeline.run(extract_length, sleep_check, tasks)
+    next(results)
+    results.close()
+    assert time.time() - start < 2
+
+
+def sleep_length(name):
+    time.sleep(0.2 * len(name))
+    return len(name)
+
+
+@pytest.mark.parametrize("backend", ["process", "thread", "asyncio"])
+def test_workers_stream(backend):
+    """
+    test that worker results stream in the order tasks complete
+    """
+    names = ["ccc", "a", "bb"]
+    tasks = {name: {"name": name} for name in names}
+    funcs = {name: sleep_length for name in names}
+    workers = Workers(workers=3, backend=backend)
+    assert [key for key, _ in workers.stream(funcs, tasks)] == ["a", "bb", "ccc"]
+    assert workers.run(funcs, tasks) == {"a": 1, "bb": 2, "ccc": 3}
+
+
+async def async_length(name):
+    await asyncio.sleep(0.1 * len(name))
+    return len(name)
+
+
+def test_workers_backends():
+    """
+    test running tasks in serial, and coroutines with asyncio
+    """
+    names = ["ccc", "a", "bb"]
+    tasks = {name: {"name": name} for name in names}
+    workers = Workers(workers=3, backend="serial")
+    funcs = {name: sleep_length for name in names}
+    assert [key for key, _ in workers.stream(funcs, tasks)] == names
+
+    workers = Workers(workers=3, backend="asyncio")
+    funcs = {name: async_length for name in names}
+    assert [key for key, _ in workers.stream(funcs, tasks)] == ["a", "bb", "ccc"]
+
+    with pytest.raises(SystemExit):
+        Workers(backend="fork")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+def test_concurrency(monkeypatch):
+    """
+    test that adaptive concurrency grows to the capacity of a service and
+    backs off on latency and errors, within bounds
+    """
+    clock = FakeClock()
+    monkeypatch.setattr(worker, "time", clock)
+
+    # A service that does 16 requests at once, and queues the rest
+    concurrency = worker.Concurrency(minimum=2, maximum=64)
+    limits = []
+    for _ in range(40):
+        limit = concurrency.limit
+        limits.append(limit)
+        tasks = max(limit, 4)
+        clock.now += tasks / min(limit, 16)
+        for _ in range(tasks):
+            concurrency.record(max(1.0, limit / 16), units=1)
+
+    assert limits[:4] == [2, 4, 8, 16]
+    assert not concurrency.slow_start
+    assert all(2 <= limit <= 64 for limit in limits)
+    assert max(limits) < 64
+    assert concurrency.best[1] >= 16
+
+    # A burst of errors halves the limit
+    limit = concurrency.limit
+    clock.now += 1
+    for _ in range(max(limit, 4)):
+        concurrency.record(1.0, units=1, errors=1)
+    assert concurrency.limit == max(2, limit // 2)
+
+
+def test_concurrency_errors(monkeypatch):
+    """
+    test that the limit never grows while every window has many errors
+    """
+    clock = FakeClock()
+    monkeypatch.setattr(worker, "time", clock)
+
+    # A clean window first, so the lowest error rate seen is zero
+    concurrency = worker.Concurrency(minimum=2, maximum=64, initial=8)
+    clock.now += 1
+    for _ in range(8):
+        concurrency.record(1.0, units=1)
+    limits = [concurrency.limit]
+    for _ in range(6):
+        tasks = max(concurrency.limit, 4)
+        clock.now += 1
+        for number in range(tasks):
+            concurrency.record(1.0, units=1, errors=int(number % 5 < 3))
+        limits.append(concurrency.limit)
+    assert concurrency.base_errors == 0.0
+    assert all(after <= before for before, after in zip(limits, limits[1:]))
+    assert limits[-1] == 2
+
+
+def test_pipeline_end(capsys):
+    """
+    test that the best adaptive concurrency is shown, so it can be pinned
+    """
+    pipeline = Pipeline(min_check_workers=2, max_check_workers=64)
+    pipeline.start()
+    pipeline.concurrency.history = [(2, 10.0), (4, 30.0), (8, 25.0)]
+    pipeline.concurrency.best = (30.0, 4)
+    pipeline.end()
+    assert "pin with --workers 4" in capsys.readouterr().err
+
+    # Pinned workers have nothing to report
+    pipeline = Pipeline(check_workers=8)
+    pipeline.start()
+    pipeline.end()
+    assert capsys.readouterr().err == ""
+
+
+def test_parse_workers():
+    """
+    test parsing pinned workers, bounds and auto
+    """
+    assert worker.parse_workers(None) == {}
+    assert worker.parse_workers("auto") == {}
+    assert worker.parse_workers("16") == {"check_workers": 16}
+    assert worker.parse_workers("4:128") == {
+        "min_check_workers": 4,
+        "max_check_workers": 128,
+    }
+    for value in ["0", "8:4", "many"]:
+        with pytest.raises(SystemExit):
+            worker.parse_workers(value)
+
+    assert Pipeline(check_workers=8).concurrency is None
+    pipeline = Pipeline(min_check_workers=4, max_check_workers=128)
+    assert pipeline.concurrency.limit == 4
+    assert pipeline.check_workers == 128
@@ -0,0 +1,81 @@
+import io
+import threading
+import time
+import pytest
+from urlchecker.logger import Reporter, get_reporter, set_reporter
+
+
+@pytest.mark.parametrize(
+    "mode,lines",
+    [
+        ("all", ["https://pass.com/", "https://fail.com/", "Skipping file.md"]),
+        ("failures", ["https://fail.com/", "Skipping file.md"]),
+        ("progress", []),
+    ],
+)
+def test_reporter_modes(mode, lines):
+    """
+    test that each mode reports the urls (and messages) it should
+    """
+    stream = io.StringIO()
+    reporter = Reporter(mode, stream=stream)
+    reporter.success("https://pass.com/")
+    reporter.failure("https://fail.com/")
+    reporter.message("Skipping file.md")
+    written = stream.getvalue().replace("\033[92m", "").replace("\033[91m", "")
+    assert written.replace("\033[0m", "").splitlines() == lines
+
+
+def test_reporter_buffered():
+    """
+    test that buffered lines are written together
+    """
+    stream = io.StringIO()
+    reporter = Reporter("buffered", stream=stream, interval=60, max_lines=3)
+    reporter.failure("https://one.com/")
+    reporter.failure("https://two.com/")
+    assert stream.getvalue() == ""
+    reporter.failure("https://three.com/")
+    assert len(stream.getvalue().splitlines()) == 3
+
+    # Anything held is written when the reporter is replaced
+    reporter.failure("https://four.com/")
+    previous = set_reporter(reporter)
+    assert get_reporter() is reporter
+    set_reporter(previous)
+    assert len(stream.getvalue().splitlines()) == 4
+
+    with pytest.raises(SystemExit):
+        Reporter("verbose")
+
+
+def test_reporter_buffered_interval():
+    """
+    test that held lines are written once the interval passes, without
+    waiting for another line
+    """
+    stream = io.StringIO()
+    reporter = Reporter("buffered", stream=stream, interval=0.1)
+    reporter.failure("https://one.com/")
+    assert stream.getvalue() == ""
+    time.sleep(0.3)
+    assert len(stream.getvalue().splitlines()) == 1
+
+
+def test_reporter_threads():
+    """
+    test that lines written from many threads are written whole
+    """
+    stream = io.StringIO()
+    reporter = Reporter("all", stream=stream)
+    threads = [
+        threading.Thread(
+            target=lambda: [reporter.message("x" * 50) for _ in range(200)]
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stream.getvalue().splitlines() == ["x" * 50] * 1600
@@ -0,0 +1,10 @@
+from urlchecker.main.benchmark import benchmark_backends
+
+
+def test_benchmark_backends():
+    """
+    test timing simulated checks with each backend
+    """
+    runtimes = benchmark_backends(files=4, urls=2, latency=0.01, workers=2)
+    assert list(runtimes) == ["process", "thread", "asyncio", "serial"]
+    assert all(runtime > 0 for runtime in runtimes.values())
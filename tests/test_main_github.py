@@ -1,6 +1,44 @@
 import os
 import pytest
-from urlchecker.main.github import clone_repo, delete_repo, get_branch
+import subprocess
+from urlchecker.core.check import UrlChecker
+from urlchecker.main.github import (
+    clone_repo,
+    delete_repo,
+    get_added_lines,
+    get_branch,
+    get_changed_files,
+    get_sparse_patterns,
+    get_tracked_files,
+)
+
+
+def make_repo(path):
+    """
+    Make a repository with a main branch, and a pr branch with changes.
+    """
+    path = str(path)
+
+    def git(*args):
+        subprocess.run(["git", "-C", path] + list(args), check=True)
+
+    os.makedirs(os.path.join(path, "docs"))
+    git("init", "-q")
+    git("config", "user.email", "urlchecker@example.com")
+    git("config", "user.name", "urlchecker")
+    git("checkout", "-q", "-b", "main")
+    with open(os.path.join(path, "README.md"), "w") as fd:
+        fd.write("[old](https://old.example.com/)\n")
+    with open(os.path.join(path, "docs", "other.md"), "w") as fd:
+        fd.write("[other](https://other.example.com/)\n")
+    git("add", ".")
+    git("commit", "-q", "-m", "base")
+    git("checkout", "-q", "-b", "pr")
+    with open(os.path.join(path, "README.md"), "a") as fd:
+        fd.write("++ [new](https://new.example.com/)\n")
+    with open(os.path.join(path, "docs", "new.md"), "w") as fd:
+        fd.write("[untracked](https://untracked.example.com/)\n")
+    return os.path.realpath(path)
 
 
 @pytest.mark.parametrize(
@@ -24,6 +62,114 @@ def test_clone_and_del_repo(git_path):
         raise AssertionError
 
 
+def test_changed_since(tmp_path):
+    """
+    test listing files and lines changed since a base ref
+    """
+    repo = make_repo(tmp_path)
+    readme = os.path.join(repo, "README.md")
+    untracked = os.path.join(repo, "docs", "new.md")
+    assert sorted(get_changed_files(repo, "main")) == [readme, untracked]
+
+    # Untracked files are entirely new (None)
+    added = get_added_lines(repo, "main")
+    assert added == {readme: ["++ [new](https://new.example.com/)"], untracked: None}
+
+    # The checker only discovers changed files, and added urls
+    checker = UrlChecker(repo, changed_since="main", added_urls_only=True)
+    assert sorted(checker.file_paths) == [readme, untracked]
+    assert checker.get_added_urls(readme) == ["https://new.example.com/"]
+    assert checker.get_added_urls(untracked) is None
+
+    # A subfolder only includes changes under it
+    checker = UrlChecker(os.path.join(repo, "docs"), changed_since="main")
+    assert checker.file_paths == [untracked]
+
+
+def test_added_lines_quoted_paths(tmp_path):
+    """
+    test that added lines are found for files whose names git quotes
+    """
+    repo = make_repo(tmp_path)
+    names = ["with space.md", 'with "quote".md', "na\u00efve.md"]
+    for name in names:
+        with open(os.path.join(repo, "docs", name), "w") as fd:
+            fd.write("[old](https://old.example.com/)\n")
+    subprocess.run(["git", "-C", repo, "add", "docs"], check=True)
+    subprocess.run(["git", "-C", repo, "commit", "-q", "-m", "quoted"], check=True)
+    subprocess.run(["git", "-C", repo, "branch", "-q", "quoted"], check=True)
+    for name in names:
+        with open(os.path.join(repo, "docs", name), "a") as fd:
+            fd.write("[new](https://new.example.com/)\n")
+
+    added = get_added_lines(repo, "quoted")
+    for name in names:
+        assert added[os.path.join(repo, "docs", name)] == [
+            "[new](https://new.example.com/)"
+        ]
+
+
+def test_git_discovery(tmp_path):
+    """
+    test listing files from the git index, respecting .gitignore
+    """
+    repo = make_repo(tmp_path / "repo")
+    os.makedirs(os.path.join(repo, "build"))
+    with open(os.path.join(repo, "build", "generated.md"), "w") as fd:
+        fd.write("[generated](https://generated.example.com/)\n")
+    with open(os.path.join(repo, ".gitignore"), "w") as fd:
+        fd.write("build/\n")
+
+    expected = [
+        os.path.join(repo, "README.md"),
+        os.path.join(repo, "docs", "new.md"),
+        os.path.join(repo, "docs", "other.md"),
+    ]
+    checker = UrlChecker(repo, discovery="git")
+    assert sorted(checker.file_paths) == expected
+
+    # The walker finds the ignored file
+    checker = UrlChecker(repo, discovery="walk")
+    assert len(checker.file_paths) == 4
+
+    # Not a git repository falls back to walking
+    assert get_tracked_files(str(tmp_path)) is None
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "README.md").write_text("https://www.google.com/")
+    checker = UrlChecker(str(other), discovery="auto")
+    assert checker.file_paths == [str(other / "README.md")]
+
+
+def test_clone_options(tmp_path):
+    """
+    test a shallow, partial and sparse clone only checks out matching files
+    """
+    source = make_repo(tmp_path / "source")
+    subprocess.run(["git", "-C", source, "config", "uploadpack.allowFilter", "true"])
+    with open(os.path.join(source, "setup.py"), "w") as fd:
+        fd.write("# https://example.com/\n")
+
+    assert get_sparse_patterns([".md", "*.html"]) == ["*.md", "*.html"]
+    assert get_sparse_patterns([".md"], "docs/") == ["/docs/**/*.md"]
+
+    dest = clone_repo(
+        "file://%s" % source,
+        branch="main",
+        dest=str(tmp_path / "clone"),
+        depth=1,
+        filter_spec="blob:none",
+        sparse_patterns=get_sparse_patterns([".md"], "docs"),
+    )
+    files = [
+        os.path.relpath(os.path.join(root, name), dest)
+        for root, dirs, names in os.walk(dest)
+        for name in names
+        if ".git" not in root.split(os.sep)
+    ]
+    assert files == [os.path.join("docs", "other.md")]
+
+
 def test_get_branch():
     """
     test getting branch from environment or default
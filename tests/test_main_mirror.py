@@ -0,0 +1,48 @@
+import os
+import subprocess
+import time
+
+from urlchecker.main.mirror import MirrorCache
+from tests.test_main_github import make_repo
+
+
+def test_mirror_cache(tmp_path):
+    """
+    test that a mirror is cloned once, fetched after, and checked out
+    """
+    source = make_repo(tmp_path / "source")
+    git_path = "file://%s" % source
+    mirrors = MirrorCache(str(tmp_path / "mirrors"))
+
+    dest = mirrors.checkout(git_path, branch="main", dest=str(tmp_path / "one"))
+    assert sorted(os.listdir(dest)) == [".git", "README.md", "docs"]
+    assert len(mirrors.list_mirrors()) == 1
+
+    # A new commit is fetched into the existing mirror
+    subprocess.run(["git", "-C", source, "add", "."], check=True)
+    subprocess.run(["git", "-C", source, "commit", "-q", "-m", "pr"], check=True)
+    dest = mirrors.checkout(git_path, branch="pr", dest=str(tmp_path / "two"))
+    assert os.path.exists(os.path.join(dest, "docs", "new.md"))
+    assert [x[2] for x in mirrors.list_mirrors()] == [mirrors.get_mirror_path(git_path)]
+
+
+def test_mirror_eviction(tmp_path):
+    """
+    test that mirrors are evicted by age, then by size
+    """
+    mirrors = MirrorCache(str(tmp_path))
+    for name in ["old", "used", "new"]:
+        os.makedirs(str(tmp_path / ("%s.git" % name)))
+        with open(str(tmp_path / ("%s.git" % name) / "pack"), "w") as fd:
+            fd.write("x" * 100)
+    now = time.time()
+    os.utime(str(tmp_path / "old.git"), (now - 3600, now - 3600))
+    os.utime(str(tmp_path / "used.git"), (now - 60, now - 60))
+
+    mirrors.max_age = 600
+    assert mirrors.evict() == [str(tmp_path / "old.git")]
+
+    # Too big, the least recently used goes (unless we keep it)
+    mirrors.max_size = 150
+    assert mirrors.evict(keep=str(tmp_path / "used.git")) == [str(tmp_path / "new.git")]
+    assert [x[2] for x in mirrors.list_mirrors()] == [str(tmp_path / "used.git")]
@@ -1,6 +1,6 @@
 import os
 import pytest
-from urlchecker.main.utils import get_tmpdir
+from urlchecker.main.utils import format_size, get_tmpdir
 
 
 def test_get_tmpdir(tmp_path):
@@ -24,3 +24,12 @@ def test_get_tmpdir(tmp_path):
     named = get_tmpdir(prefix="tacos", create=False)
     if not (os.path.basename(named).startswith("tacos")):
         raise AssertionError
+
+
+def test_format_size():
+    """
+    test formatting a size in bytes for humans
+    """
+    assert format_size(10) == "10 bytes"
+    assert format_size(1536) == "1.5 KB"
+    assert format_size(3 * 1024**3) == "3.0 GB"
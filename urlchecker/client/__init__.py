@@ -51,88 +51,282 @@ def get_parser():
         help="the local path or GitHub repository to clone and check",
     )
 
-    check.add_argument(
+    add_check_arguments(check)
+
+    # check many paths (or GitHub repositories) in one run
+    batch = subparsers.add_parser(
+        "batch",
+        help="check urls in many paths (or GitHub repositories) at once, checking each url once",
+    )
+    batch.add_argument(
+        "paths",
+        help="the local paths or GitHub repositories to clone and check",
+        nargs="+",
+    )
+    add_check_arguments(batch)
+
+    # a local server that checks urls for clients, keeping caches warm
+    serve = subparsers.add_parser(
+        "serve",
+        help="run a local server that checks urls for clients (check --server), keeping connections and results warm",
+    )
+    serve.add_argument(
+        "--host",
+        help="the host to listen on (defaults to 127.0.0.1)",
+        default="127.0.0.1",
+    )
+    serve.add_argument(
+        "--port",
+        help="the port to listen on (defaults to 8711)",
+        type=int,
+        default=8711,
+    )
+    serve.add_argument(
+        "--workers",
+        help="threads checking urls, shared by all clients (defaults to 32)",
+        type=int,
+        default=32,
+    )
+    serve.add_argument(
+        "--result-ttl",
+        dest="result_ttl",
+        help="seconds to keep a url result before checking it again (defaults to 300)",
+        type=float,
+        default=300,
+    )
+
+    return parser
+
+
+def add_check_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the arguments shared by check and batch (everything but the paths).
+    """
+    parser.add_argument(
         "-b",
         "--branch",
         help="if cloning, specify a branch to use (defaults to main)",
         default="main",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--subfolder",
         help="relative subfolder path within path (if not specified, we use root)",
     )
 
-    check.add_argument(
+    parser.add_argument(
+        "--clone-depth",
+        dest="clone_depth",
+        help="if cloning, the number of commits of history to fetch (e.g., 1). Defaults to all history. Not used with --mirror-cache.",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--clone-filter",
+        dest="clone_filter",
+        help="if cloning, a partial clone filter (e.g., blob:none to only fetch files that are checked out). Not used with --mirror-cache.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--sparse",
+        help="if cloning, only check out files matching --file-types (and under --subfolder)",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--mirror-cache",
+        dest="mirror_cache",
+        help="if cloning, keep a bare mirror of the repository in this directory, and only fetch changes on later runs.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--mirror-max-age",
+        dest="mirror_max_age",
+        help="evict mirrors not used for this many days (defaults to never).",
+        type=float,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--mirror-max-size",
+        dest="mirror_max_size",
+        help="evict the least recently used mirrors while the cache is larger than this many MB (defaults to no limit).",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
         "--cleanup",
         help="remove root folder after checking (defaults to False, no cleaup)",
         default=False,
         action="store_true",
     )
 
-    check.add_argument(
+    parser.add_argument(
+        "--progress",
+        help="show live progress and throughput (files, urls and urls per second) on stderr",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--report",
+        help="how to report each url: all as it is checked, buffered (written together a few times a second), failures only, or progress (only the progress line). Defaults to all (or URLCHECKER_REPORT).",
+        choices=["all", "buffered", "failures", "progress"],
+        default=None,
+    )
+
+    parser.add_argument(
         "--serial",
         help="run checks in serial (no multiprocess)",
         default=False,
         action="store_true",
     )
-    check.add_argument(
+    parser.add_argument(
         "--no-check-certs",
         dest="no_check_certs",
         help="Allow urls to validate that fail certificate checks",
         default=False,
         action="store_true",
     )
-    check.add_argument(
+    parser.add_argument(
         "--force-pass",
         help="force successful pass (return code 0) regardless of result",
         default=False,
         action="store_true",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--no-print",
         help="Skip printing results to the screen (defaults to printing to console).",
         default=False,
         action="store_true",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--verbose",
         help="Print file names for failed urls in addition to the urls.",
         default=False,
         action="store_true",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--file-types",
         dest="file_types",
         help="comma separated list of file extensions to check (defaults to .md,.py)",
         default=".md,.py",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--files",
         dest="files",
         help="comma separated list of exact files or patterns to check.",
         default="",
     )
 
+    parser.add_argument(
+        "--max-file-size",
+        dest="max_file_size",
+        help="skip files larger than this many bytes, 0 for no limit (defaults to 10485760, 10MB)",
+        type=int,
+        default=10485760,
+    )
+
+    parser.add_argument(
+        "--discovery",
+        help="find files by walking the filesystem (walk), listing the git index respecting .gitignore (git), or git if possible (auto). Defaults to walk.",
+        choices=["walk", "git", "auto"],
+        default="walk",
+    )
+
+    parser.add_argument(
+        "--traversal-workers",
+        dest="traversal_workers",
+        help="threads reading directories concurrently when walking, useful for very large trees or network filesystems. Defaults to 1 (serial).",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--workers",
+        help="checks in flight: a number to pin (e.g., 16), MIN:MAX bounds to adapt within (e.g., 4:128) or auto. Defaults to auto (2:64), adapting to throughput, latency and errors.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--backend",
+        help="extract files in a process pool (process), in this process with checks in threads (thread or asyncio), or run everything in serial. Defaults to process (or URLCHECKER_BACKEND).",
+        choices=["process", "thread", "asyncio", "serial"],
+        default=None,
+    )
+
+    parser.add_argument(
+        "--server",
+        help="check urls with a urlchecker server (e.g., http://127.0.0.1:8711, see urlchecker serve) instead of in this process. Urls are still extracted here.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--revision",
+        help="check files at a git revision (branch, tag or commit) read from the object store, without a checkout. A repository url is cloned bare.",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--changed-since",
+        dest="changed_since",
+        help="only check files changed since this git ref (e.g., origin/main)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--added-urls-only",
+        dest="added_urls_only",
+        help="with --changed-since, only check urls that appear in added lines",
+        default=False,
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--cache",
+        help="Path to a json file to cache extracted urls, so unchanged files are not parsed again.",
+        default=None,
+    )
+
     # Exlude patterns (previously whitelisting)
 
-    check.add_argument(
+    parser.add_argument(
         "--exclude-urls",
         help="comma separated links to exclude (no spaces)",
         default="",
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--exclude-patterns",
         help="comma separated list of patterns to exclude (no spaces)",
         default="",
     )
 
-    check.add_argument(
+    parser.add_argument(
+        "--exclude-globs",
+        dest="exclude_globs",
+        help="comma separated list of glob patterns (e.g., https://*.example.com/*) for urls to exclude (no spaces)",
+        default="",
+    )
+
+    parser.add_argument(
+        "--exclude-regex",
+        dest="exclude_regexes",
+        help="a regular expression for urls to exclude, can be given more than once (commas are kept)",
+        action="append",
+        default=[],
+    )
+
+    parser.add_argument(
         "--exclude-files",
         help="comma separated list of files and patterns to exclude (no spaces)",
         default="",
@@ -140,30 +334,36 @@ def get_parser():
 
     # Saving
 
-    check.add_argument(
+    parser.add_argument(
         "--save",
-        help="Path to a csv file to save results to.",
+        help="Path to a csv file (.jsonl for json lines, or .db for a SQLite database of runs, urls, occurrences and attempts) to save results to, written as each file finishes. The file then holds the url attempts and the locations of urls in files without failures, which are not kept in memory.",
         default=None,
     )
 
+    parser.add_argument(
+        "--save-locations",
+        dest="save_locations",
+        help="With --save, add LINE,COLUMN columns with a row for each occurrence of a url.",
+        default=False,
+        action="store_true",
+    )
+
     # Timeouts
 
-    check.add_argument(
+    parser.add_argument(
         "--retry-count",
         help="retry count upon failure (defaults to 2, one retry).",
         type=int,
         default=2,
     )
 
-    check.add_argument(
+    parser.add_argument(
         "--timeout",
         help="timeout (seconds) to provide to the requests library (defaults to 5)",
         type=int,
         default=5,
     )
 
-    return parser
-
 
 def main():
     """
@@ -198,6 +398,10 @@ def main():
 
     if args.command == "check":
         from .check import main
+    elif args.command == "batch":
+        from .batch import main
+    elif args.command == "serve":
+        from .serve import main
     else:
         print("Unsupported command %s" % args.command)
         sys.exit(0)
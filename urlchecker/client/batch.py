@@ -0,0 +1,158 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import logging
+import os
+import sys
+
+from urlchecker.client.check import get_path
+from urlchecker.core.batch import BatchChecker
+from urlchecker.core.fileproc import remove_empty
+from urlchecker.core.server import get_status
+from urlchecker.core.worker import get_backend
+from urlchecker.logger import Reporter, print_failure, print_success, set_reporter
+from urlchecker.main.github import delete_repo
+
+logger = logging.getLogger("urlchecker")
+
+
+def main(args, extra):
+    """
+    Main entrypoint for checking many paths (or GitHub urls to clone) in
+    one run. Each distinct url is checked once, and results are reported
+    for each path.
+
+    Args:
+      - args  : the argparse ArgParser with parsed args
+      - extra : extra arguments not handled by the parser
+    """
+    # A server must be running to check with it
+    if args.server and not get_status(args.server):
+        sys.exit(
+            "Cannot reach a urlchecker server at %s, start one with urlchecker serve."
+            % args.server
+        )
+
+    # Clone (or find) every path first, so they are checked in one run
+    paths = {}
+    cleanup = {}
+    for original in args.paths:
+        path, cleanup[original], bare = get_path(args, original)
+        if bare:
+            sys.exit("Batch checks of a revision need local paths, found %s" % original)
+        if not os.path.exists(path):
+            sys.exit("Error %s does not exist." % path)
+        paths[original] = path
+
+    # Parse file types, and excluded urls and files (includes absolute and patterns)
+    file_types = args.file_types.split(",")
+    exclude_urls = remove_empty(args.exclude_urls.split(","))
+    exclude_patterns = remove_empty(args.exclude_patterns.split(","))
+    exclude_globs = remove_empty(args.exclude_globs.split(","))
+    exclude_files = remove_empty(args.exclude_files.split(","))
+    files = remove_empty(args.files.split(","))
+
+    # Url results are reported as checks finish, in the chosen mode
+    reporter = Reporter(getattr(args, "report", None))
+    set_reporter(reporter)
+
+    # Alert user about settings
+    print("                   paths: %s" % list(paths.values()))
+    print("               subfolder: %s" % args.subfolder)
+    print("                  branch: %s" % args.branch)
+    print("                 cleanup: %s" % args.cleanup)
+    print("                revision: %s" % args.revision)
+    print("                  serial: %s" % args.serial)
+    print("                 workers: %s" % (args.workers or "auto"))
+    print("                 backend: %s" % get_backend(args.backend))
+    print("                  report: %s" % reporter.mode)
+    print("                  server: %s" % args.server)
+    print("              file types: %s" % file_types)
+    print("                   files: %s" % files)
+    print("               discovery: %s" % args.discovery)
+    print("               print all: %s" % (not args.no_print))
+    print("                 verbose: %s" % (args.verbose))
+    print("           urls excluded: %s" % exclude_urls)
+    print("   url patterns excluded: %s" % exclude_patterns)
+    print("  file patterns excluded: %s" % exclude_files)
+    print("              force pass: %s" % args.force_pass)
+    print("             retry count: %s" % args.retry_count)
+    print("                    save: %s" % args.save)
+    print("                 timeout: %s" % args.timeout)
+
+    # One checker for all paths, sharing url results
+    checker = BatchChecker(
+        list(paths.values()),
+        file_types=file_types,
+        include_patterns=files,
+        exclude_files=exclude_files,
+        print_all=not args.no_print,
+        serial=args.serial,
+        max_file_size=args.max_file_size,
+        cache_file=args.cache,
+        changed_since=args.changed_since,
+        added_urls_only=args.added_urls_only,
+        discovery=args.discovery,
+        traversal_workers=args.traversal_workers,
+        workers=args.workers,
+        backend=args.backend,
+        revision=args.revision,
+    )
+    results = checker.run(
+        exclude_urls=exclude_urls,
+        exclude_patterns=exclude_patterns,
+        exclude_globs=exclude_globs,
+        exclude_regexes=args.exclude_regexes,
+        no_check_certs=args.no_check_certs,
+        retry_count=args.retry_count,
+        timeout=args.timeout,
+        progress=args.progress or reporter.mode == "progress",
+        server=args.server,
+        save=args.save,
+        save_locations=args.save_locations,
+    )
+
+    # Report on each path, with failed urls (and their files if verbose)
+    failed = False
+    print("\n\U0001F4CB Results by path:")
+    for original, path in paths.items():
+        result = results[path]
+        summary = "%s: %s passed, %s failed, %s excluded" % (
+            original,
+            len(result["passed"]),
+            len(result["failed"]),
+            len(result["excluded"]),
+        )
+        if not result["failed"]:
+            print_success("\U0001F389 " + summary)
+            continue
+
+        failed = True
+        print_failure("\U0001F914 " + summary)
+        if args.verbose:
+            single = checker.checkers[path]
+            for file_name, check in single.checks.items():
+                for url in check["failed"]:
+                    print_failure("     ❌️ %s (%s)" % (url, file_name))
+        else:
+            for url in sorted(result["failed"]):
+                print_failure("     ❌️ " + url)
+
+    # delete repos when done, if requested
+    for original, path in paths.items():
+        if cleanup[original] and path != original:
+            logger.info("Cleaning up %s..." % path)
+            delete_repo(path)
+
+    # If we have failures and it's not a force pass, exit with 1
+    if failed and not args.force_pass:
+        sys.exit(1)
+    if failed:
+        print("\n\U0001F928 Conditional pass force pass True.")
+    sys.exit(0)
@@ -11,11 +11,15 @@ import logging
 import os
 import re
 import sys
+from typing import Tuple
 
 from urlchecker.core.check import UrlChecker
 from urlchecker.core.fileproc import remove_empty
-from urlchecker.logger import print_failure
-from urlchecker.main.github import clone_repo, delete_repo
+from urlchecker.core.server import get_status
+from urlchecker.core.worker import get_backend
+from urlchecker.logger import Reporter, print_failure, set_reporter
+from urlchecker.main.github import clone_repo, delete_repo, get_sparse_patterns
+from urlchecker.main.mirror import MirrorCache
 
 logger = logging.getLogger("urlchecker")
 
@@ -31,21 +35,15 @@ def main(args, extra):
       - args  : the argparse ArgParser with parsed args
       - extra : extra arguments not handled by the parser
     """
-    path = args.path
+    # A server must be running to check with it
+    server = getattr(args, "server", None)
+    if server and not get_status(server):
+        sys.exit(
+            "Cannot reach a urlchecker server at %s, start one with urlchecker serve."
+            % server
+        )
 
-    # Case 1: specify present working directory
-    if not path or path == ".":
-        path = os.getcwd()
-        logging.debug("Path specified as present working directory, %s" % path)
-
-    # Case 2: We need to clone
-    elif re.search("^(git@|http)", path):
-        logging.debug("Repository url %s detected, attempting clone" % path)
-        path = clone_repo(path, branch=args.branch)
-
-    # Add subfolder to path
-    if args.subfolder:
-        path = os.path.join(path, args.subfolder)
+    path, cleanup, bare = get_path(args, args.path)
 
     # By the time we get here, a path must exist
     if not os.path.exists(path):
@@ -55,22 +53,44 @@ def main(args, extra):
     file_types = args.file_types.split(",")
     exclude_urls = remove_empty(args.exclude_urls.split(","))
     exclude_patterns = remove_empty(args.exclude_patterns.split(","))
+    exclude_globs = remove_empty(args.exclude_globs.split(","))
     exclude_files = remove_empty(args.exclude_files.split(","))
     files = remove_empty(args.files.split(","))
 
+    # Url results are reported as checks finish, in the chosen mode
+    reporter = Reporter(getattr(args, "report", None))
+    set_reporter(reporter)
+
     # Alert user about settings
     print("           original path: %s" % args.path)
     print("              final path: %s" % path)
     print("               subfolder: %s" % args.subfolder)
     print("                  branch: %s" % args.branch)
     print("                 cleanup: %s" % args.cleanup)
+    print("             clone depth: %s" % args.clone_depth)
+    print("            clone filter: %s" % args.clone_filter)
+    print("                  sparse: %s" % args.sparse)
+    print("            mirror cache: %s" % args.mirror_cache)
+    print("                revision: %s" % args.revision)
     print("                  serial: %s" % args.serial)
+    print("                 workers: %s" % (args.workers or "auto"))
+    print("                 backend: %s" % get_backend(args.backend))
+    print("                  report: %s" % reporter.mode)
+    print("                  server: %s" % args.server)
     print("              file types: %s" % file_types)
     print("                   files: %s" % files)
+    print("           max file size: %s" % args.max_file_size)
+    print("                   cache: %s" % args.cache)
+    print("               discovery: %s" % args.discovery)
+    print("       traversal workers: %s" % args.traversal_workers)
+    print("           changed since: %s" % args.changed_since)
+    print("         added urls only: %s" % args.added_urls_only)
     print("               print all: %s" % (not args.no_print))
     print("                 verbose: %s" % (args.verbose))
     print("           urls excluded: %s" % exclude_urls)
     print("   url patterns excluded: %s" % exclude_patterns)
+    print("      url globs excluded: %s" % exclude_globs)
+    print("    url regexes excluded: %s" % args.exclude_regexes)
     print("  file patterns excluded: %s" % exclude_files)
     print("          no check certs: %s" % args.no_check_certs)
     print("              force pass: %s" % args.force_pass)
@@ -86,21 +106,40 @@ def main(args, extra):
         exclude_files=exclude_files,
         print_all=not args.no_print,
         serial=args.serial,
+        max_file_size=args.max_file_size,
+        cache_file=args.cache,
+        changed_since=args.changed_since,
+        added_urls_only=args.added_urls_only,
+        discovery=args.discovery,
+        traversal_workers=args.traversal_workers,
+        workers=args.workers,
+        backend=args.backend,
+        revision=args.revision,
+        subfolder=args.subfolder if bare else None,
     )
     check_results = checker.run(
         exclude_urls=exclude_urls,
         exclude_patterns=exclude_patterns,
+        exclude_globs=exclude_globs,
+        exclude_regexes=args.exclude_regexes,
         no_check_certs=args.no_check_certs,
         retry_count=args.retry_count,
         timeout=args.timeout,
+        progress=args.progress or reporter.mode == "progress",
+        server=args.server,
+        save=args.save,
+        save_locations=getattr(args, "save_locations", False),
     )
 
-    # save results to file, if save indicated
-    if args.save:
-        checker.save_results(args.save)
+    # Let the user know about files that were not read
+    if checker.skipped:
+        print("\n%s file(s) skipped before extraction." % len(checker.skipped))
+        if args.verbose:
+            for file_name, reason in checker.skipped.items():
+                print("     %s: %s" % (file_name, reason))
 
     # delete repo when done, if requested
-    if args.cleanup:
+    if cleanup:
         logger.info("Cleaning up %s..." % path)
         delete_repo(path)
 
@@ -116,8 +155,14 @@ def main(args, extra):
             for file_name, result in checker.checks.items():
                 if result["failed"]:
                     print_failure(file_name + ":")
+                    locations = checker.get_locations(file_name)
                     for url in result["failed"]:
-                        print_failure("     ❌️ " + url)
+                        lines = ", ".join(
+                            "%s:%s" % location for location in locations.get(url, [])
+                        )
+                        print_failure(
+                            "     ❌️ " + url + (" (%s)" % lines if lines else "")
+                        )
         else:
             print("\n\U0001F914 Uh oh... The following urls did not pass:")
             for failed_url in check_results["failed"]:
@@ -133,3 +178,72 @@ def main(args, extra):
     else:
         print("\n\n\U0001F389 All URLS passed!")
     sys.exit(0)
+
+
+def get_path(args, path: str) -> Tuple[str, bool, bool]:
+    """
+    Get the local path to check for a path given on the command line. The
+    present working directory is used for ".", a repository url is cloned
+    (or checked out from a mirror), and the subfolder is added.
+
+    Args:
+      - args        : the argparse ArgParser with parsed args
+      - path (str)  : the path (or GitHub url) to check
+
+    Returns:
+      (tuple) the local path, if it should be cleaned up, and if it is a bare repository.
+    """
+    # With a revision, a clone is bare (files are read from the object store)
+    revision = getattr(args, "revision", None)
+    cleanup = args.cleanup
+    bare = False
+
+    # Case 1: specify present working directory
+    if not path or path == ".":
+        path = os.getcwd()
+        logging.debug("Path specified as present working directory, %s" % path)
+
+    # Case 2: We need to clone
+    elif re.search("^(git@|http)", path):
+        logging.debug("Repository url %s detected, attempting clone" % path)
+        bare = bool(revision)
+
+        # Clone options may be missing if args are not from the parser
+        sparse_patterns = None
+        if getattr(args, "sparse", False):
+            sparse_patterns = get_sparse_patterns(
+                args.file_types.split(","), args.subfolder
+            )
+        if getattr(args, "mirror_cache", None):
+            mirrors = MirrorCache(
+                args.mirror_cache,
+                max_age=(args.mirror_max_age * 86400 if args.mirror_max_age else None),
+                max_size=(
+                    args.mirror_max_size * 1024 * 1024 if args.mirror_max_size else None
+                ),
+            )
+
+            # A revision is read from the mirror itself, which is kept
+            if revision:
+                path = mirrors.update(path)
+                mirrors.evict(keep=path)
+                cleanup = False
+            else:
+                path = mirrors.checkout(
+                    path, branch=args.branch, sparse_patterns=sparse_patterns
+                )
+        else:
+            path = clone_repo(
+                path,
+                branch=args.branch,
+                depth=getattr(args, "clone_depth", None),
+                filter_spec=getattr(args, "clone_filter", None),
+                sparse_patterns=sparse_patterns,
+                bare=bare,
+            )
+
+    # Add subfolder to path (a bare repository lists files under it instead)
+    if args.subfolder and not bare:
+        path = os.path.join(path, args.subfolder)
+
+    return path, cleanup, bare
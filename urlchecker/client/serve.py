@@ -0,0 +1,44 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import sys
+
+from urlchecker.core.server import UrlCheckServer
+
+
+def main(args, extra):
+    """
+    Main entrypoint for running a local server that checks urls for
+    clients (urlchecker check --server), until interrupted.
+
+    Args:
+      - args  : the argparse ArgParser with parsed args
+      - extra : extra arguments not handled by the parser
+    """
+    try:
+        server = UrlCheckServer(
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            max_age=args.result_ttl,
+        )
+    except OSError as e:
+        sys.exit("Cannot listen on %s:%s: %s" % (args.host, args.port, e))
+
+    print("                 workers: %s" % args.workers)
+    print("              result ttl: %s" % args.result_ttl)
+    print("Serving urlchecker on %s, check with --server %s" % (server.url, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping server.")
+    finally:
+        server.server_close()
+        server.executor.shutdown(wait=False)
+    sys.exit(0)
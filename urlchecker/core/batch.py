@@ -0,0 +1,264 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import csv
+import os
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from urlchecker.core import cache, fileproc
+from urlchecker.core.check import (
+    RESULT_HEADER,
+    UrlChecker,
+    error_result,
+    extract_task,
+    get_check_task,
+    get_ports,
+    measure_check,
+    merge_check_results,
+    split_check_task,
+)
+from urlchecker.core.sink import get_sink
+from urlchecker.core.urltable import UrlTable
+from urlchecker.core.worker import Pipeline, get_backend, parse_workers
+from urlchecker.logger import Progress, get_reporter
+
+
+class BatchChecker:
+    """
+    A BatchChecker checks many paths (e.g., repositories) in one run. Files
+    from all paths stream through a single pipeline, and check threads
+    share one result cache, so a url that appears in many repositories is
+    only checked once (and kept once, in a shared url table). With a cache
+    file, all paths share one extraction cache, saved once. Results are
+    kept by path, with a UrlChecker for each.
+    """
+
+    def __init__(
+        self,
+        paths: List[str],
+        serial: bool = False,
+        print_all: bool = True,
+        workers: Optional[str] = None,
+        backend: Optional[str] = None,
+        **kwargs
+    ):
+        """
+        Initiate a batch checker, with a UrlChecker (which finds the files to
+        check) for each path.
+
+        Args:
+            - paths      (list) : full paths to the root folders to check.
+            - serial     (bool) : do checks in serial (no multiprocessing)
+            - print_all  (bool) : control var for whether to print all checked file names or only the ones with urls.
+            - workers     (str) : check threads to pin (e.g., 16), bounds to adapt within (e.g., 4:64) or auto.
+            - backend     (str) : extract files in processes ("process"), in this process ("thread" or "asyncio") or run all in "serial".
+            - kwargs     (dict) : other arguments for each UrlChecker (e.g., file_types).
+        """
+        self.serial = serial
+        self.print_all = print_all
+        self.workers = workers
+        parse_workers(workers)
+        self.backend = get_backend(backend)
+        self.result_cache = cache.ResultCache()
+        self.url_table = UrlTable()
+
+        # One extraction cache for all paths, so each doesn't save over the last
+        self.cache = None  # type: Optional[cache.ExtractionCache]
+        cache_file = kwargs.pop("cache_file", None)
+        if cache_file:
+            self.cache = cache.ExtractionCache(
+                cache_file,
+                settings={
+                    "max_file_size": kwargs.get("max_file_size", fileproc.MAX_FILE_SIZE)
+                },
+            )
+        self.checkers = {}  # type: Dict[str, UrlChecker]
+        for path in paths:
+            if path in self.checkers:
+                continue
+            self.checkers[path] = UrlChecker(
+                path=path,
+                serial=serial,
+                print_all=print_all,
+                url_table=self.url_table,
+                extraction_cache=self.cache,
+                **kwargs
+            )
+
+    def __str__(self) -> str:
+        return "BatchChecker:%s" % len(self.checkers)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @property
+    def results(self) -> Dict[str, Mapping[str, set]]:
+        """
+        The flattened results of each path.
+        """
+        return {path: checker.results for path, checker in self.checkers.items()}
+
+    def iter_tasks(self) -> Iterator[Tuple[Tuple[str, str], Dict[str, Any]]]:
+        """
+        Yield extraction tasks for all paths, keyed by the path and file name.
+        """
+        ports = get_ports()
+        for path, checker in self.checkers.items():
+            for file_name, kwargs in checker.iter_tasks(ports=ports):
+                yield (path, file_name), kwargs
+
+    def add_extracted(self, key: Tuple[str, str], extracted: dict):
+        """
+        Add an extraction result to the UrlChecker of the path it belongs to.
+        """
+        path, file_name = key
+        self.checkers[path].add_extracted(file_name, extracted)
+
+    def run(
+        self,
+        exclude_patterns: Optional[List[str]] = None,
+        exclude_urls: Optional[List[str]] = None,
+        retry_count: int = 2,
+        timeout: int = 5,
+        no_check_certs: bool = False,
+        exclude_globs: Optional[List[str]] = None,
+        exclude_regexes: Optional[List[str]] = None,
+        on_result: Optional[Callable[[str, str, Dict[str, Any]], Any]] = None,
+        progress: bool = False,
+        server: Optional[str] = None,
+        save: Optional[str] = None,
+        save_locations: bool = False,
+    ) -> Dict[str, Mapping[str, set]]:
+        """
+        Run the checks for all paths in one pipeline, sharing exclusions and
+        results, and add the results to the UrlChecker for each path.
+
+        Args:
+            - exclude_urls     (list) : list of excluded urls.
+            - exclude_patterns (list) : list of excluded patterns for urls.
+            - retry_count       (int) : number of retries on failed first check. Default=2.
+            - timeout           (int) : timeout to use when waiting on check feedback. Default=5.
+            - no_check_certs   (bool) : do not check certificates
+            - exclude_globs    (list) : list of excluded glob patterns for urls.
+            - exclude_regexes  (list) : list of excluded regular expressions for urls.
+            - on_result    (function) : called with the path, file name and result as each file finishes.
+            - progress         (bool) : show live progress and throughput (on stderr).
+            - server            (str) : check urls with this urlchecker server (see urlchecker serve).
+            - save              (str) : write results (with the PATH first) to this file (csv, .jsonl or a .db for SQLite) as each file finishes.
+            - save_locations   (bool) : with save, add LINE,COLUMN with a row for each occurrence of a url.
+
+        Returns:
+            (dict) the flattened results ("failed", "passed", "excluded") of each path.
+        """
+        # Results are written as each file finishes, if saving
+        sink = None
+        if save:
+            sink = get_sink(
+                save, ["PATH"] + RESULT_HEADER[: 5 if save_locations else 3]
+            )
+            print("Saving results to %s" % sink.file_path)
+
+        check = get_check_task(
+            exclude_urls=exclude_urls,
+            exclude_patterns=exclude_patterns,
+            exclude_globs=exclude_globs,
+            exclude_regexes=exclude_regexes,
+            result_cache=self.result_cache,
+            no_check_certs=no_check_certs,
+            print_all=self.print_all,
+            retry_count=retry_count,
+            timeout=timeout,
+            server=server,
+            record_attempts=sink is not None and sink.record_attempts,
+        )
+
+        pipeline = Pipeline(
+            serial=self.serial, backend=self.backend, **parse_workers(self.workers)
+        )
+        display = Progress() if progress else None
+
+        try:
+            for (path, file_name), result in pipeline.run(
+                extract_task,
+                check,
+                self.iter_tasks(),
+                on_extract=self.add_extracted,
+                measure=measure_check,
+                split=split_check_task,
+                merge=merge_check_results,
+                on_error=error_result,
+            ):
+                checker = self.checkers[path]
+                checker.add_result(file_name, result, keep_urls=sink is None)
+                if sink:
+                    checker.write_result(
+                        sink, file_name, result, locations=save_locations, path=path
+                    )
+                if display:
+                    display.update(len(result["urls"]), len(result["failed"]))
+                if on_result:
+                    on_result(path, file_name, result)
+
+        # Keep what was written (and reported) if the run is interrupted
+        finally:
+            if sink:
+                sink.close()
+            get_reporter().flush()
+
+        if display:
+            display.finish()
+        for checker in self.checkers.values():
+            checker.finish(save_cache=False)
+        if self.cache:
+            self.cache.save()
+            print(
+                "Extraction cache: %s hits, %s misses."
+                % (self.cache.hits, self.cache.misses)
+            )
+
+        print(
+            "Checked %s distinct urls for %s paths (%s reused)."
+            % (
+                self.result_cache.misses,
+                len(self.checkers),
+                self.result_cache.hits,
+            )
+        )
+        return self.results
+
+    def save_results(
+        self,
+        file_path: str,
+        sep: str = ",",
+        relative_paths: bool = True,
+        locations: bool = False,
+    ) -> str:
+        """
+        Save the results of all paths to one csv file, with the PATH of each
+        row first and then the columns of UrlChecker.save_results.
+
+        Args:
+            - file_path       (str) : the file path (.csv, .jsonl or .db for SQLite) to save to.
+            - sep             (str) : the separate to use (defaults to comma)
+            - relative_paths (bool) : save file names relative to each path (default True)
+            - locations      (bool) : add LINE,COLUMN with a row for each occurrence of a url (default False)
+
+        Returns:
+            (str) file_path: a newly saved csv with the results
+        """
+        header = ["PATH"] + RESULT_HEADER[: 5 if locations else 3]
+        with get_sink(file_path, header, sep=sep) as sink:
+            print("Saving results to %s" % sink.file_path)
+            for path, checker in self.checkers.items():
+                for file_name, result in checker.checks.items():
+                    checker.write_result(
+                        sink, file_name, result, relative_paths, locations, path=path
+                    )
+        return sink.file_path
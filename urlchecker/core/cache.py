@@ -0,0 +1,278 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from urlchecker.version import __version__
+
+# Bump when the format of an entry changes
+CACHE_VERSION = 2
+
+
+def hash_file(file_name: str) -> str:
+    """
+    Get the sha256 digest of a file's content, reading in chunks.
+
+    Args:
+        - file_name (str) : path to file.
+
+    Returns:
+        (str) the hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_entry(file_name: str, **extracted) -> Dict[str, Any]:
+    """
+    Make a cache entry for a file, recording its size, modified time and
+    content hash along with the extracted result.
+
+    Args:
+        - file_name  (str) : path to file.
+        - extracted (dict) : the extraction result to store (e.g., urls).
+
+    Returns:
+        (dict) the cache entry.
+    """
+    stat = os.stat(file_name)
+    entry = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": None,
+    }  # type: Dict[str, Any]
+    if not extracted.get("skipped"):
+        entry["sha256"] = hash_file(file_name)
+    entry.update(extracted)
+    return entry
+
+
+def get_stamp(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Get the stamp of a cache entry (size, modified time and content hash)
+    without the extracted result, which is all check_entry needs.
+
+    Args:
+        - entry (dict) : the cache entry (or None).
+
+    Returns:
+        (dict) the stamp, or None if there is no entry.
+    """
+    if not entry:
+        return None
+    return {key: entry[key] for key in ["size", "mtime", "sha256"]}
+
+
+def check_entry(
+    file_name: str, entry: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Check if a cache entry is still valid for a file. A matching size and
+    modified time is a hit. If only the modified time changed (e.g., a fresh
+    clone) the content hash is compared, and a match is still a hit.
+
+    Args:
+        - file_name (str) : path to file.
+        - entry    (dict) : the cache entry for the file (or None).
+
+    Returns:
+        (dict) the (possibly updated) entry if valid, otherwise None.
+    """
+    if not entry:
+        return None
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+
+    if stat.st_size != entry["size"]:
+        return None
+    if stat.st_mtime == entry["mtime"]:
+        return entry
+    if entry["sha256"] and hash_file(file_name) == entry["sha256"]:
+        entry = dict(entry)
+        entry["mtime"] = stat.st_mtime
+        return entry
+    return None
+
+
+class ExtractionCache:
+    """
+    A persistent cache of urls extracted from each file, so unchanged files
+    are not read and parsed again. Entries are keyed by absolute path, and
+    the cache is discarded if the urlchecker version or settings that change
+    extraction (e.g., the maximum file size) differ.
+    """
+
+    def __init__(self, file_name: str, settings: Optional[Dict[str, Any]] = None):
+        self.file_name = os.path.abspath(file_name)
+        self.settings = settings or {}
+        self.hits = 0
+        self.misses = 0
+        self.files = {}  # type: Dict[str, Dict[str, Any]]
+        self.load()
+
+    def __str__(self) -> str:
+        return "ExtractionCache:%s" % self.file_name
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @property
+    def header(self) -> Dict[str, Any]:
+        return {
+            "version": CACHE_VERSION,
+            "urlchecker": __version__,
+            "settings": self.settings,
+        }
+
+    def load(self):
+        """
+        Load the cache from file, if it exists and matches our header.
+        """
+        if not os.path.exists(self.file_name):
+            return
+        try:
+            with open(self.file_name, "r") as fd:
+                data = json.load(fd)
+        except ValueError:
+            print("Cache %s is not valid json, starting fresh." % self.file_name)
+            return
+        if data.get("header") == self.header:
+            self.files = data.get("files", {})
+
+    def save(self):
+        """
+        Save the cache to file, writing to a temporary file first so an
+        interrupted run does not leave a partial cache.
+        """
+        tmp_file = "%s.tmp" % self.file_name
+        with open(tmp_file, "w") as fd:
+            json.dump({"header": self.header, "files": self.files}, fd)
+        os.replace(tmp_file, self.file_name)
+
+    def get(self, file_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the stored entry for a file, to be validated with check_entry.
+        """
+        return self.files.get(os.path.abspath(file_name))
+
+    def update(self, file_name: str, entry: Dict[str, Any], cached: bool = False):
+        """
+        Store the entry for a file, and count it as a hit or miss.
+
+        Args:
+            - file_name (str) : path to file.
+            - entry    (dict) : the cache entry from make_entry or check_entry.
+            - cached   (bool) : if the entry was a hit (not extracted again).
+        """
+        self.files[os.path.abspath(file_name)] = entry
+        if cached:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+class ResultCache:
+    """
+    An in-memory cache of url check results shared by check threads, so each
+    distinct url is checked once per run (or batch of repositories). If a
+    url is being checked by one thread, other threads that need it wait for
+    that result instead of checking it again. For a long running server,
+    results can expire after max_age seconds, and expired results are
+    removed as new ones are recorded.
+    """
+
+    def __init__(self, max_age: Optional[float] = None) -> None:
+        self.lock = threading.Lock()
+        self.max_age = max_age
+        self.results = {}  # type: Dict[str, bool]
+        self.checked = {}  # type: Dict[str, float]
+        self.pending = {}  # type: Dict[str, threading.Event]
+        self.pruned = time.time()
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self) -> str:
+        return "ResultCache:%s" % len(self.results)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def claim(self, url: str) -> Optional[bool]:
+        """
+        Get the result for a url, waiting if another thread is checking it.
+        If there is no result, the caller must check the url and record it.
+        If the result we waited for is gone (e.g., pruned) we try again, so
+        only the thread that takes the claim checks the url.
+
+        Args:
+            - url (str) : the url to check.
+
+        Returns:
+            (bool) True if passed, False if failed, or None to check it.
+        """
+        waited = False
+        while True:
+            with self.lock:
+                # A result we waited for is used, even if it just expired
+                if url in self.results and (waited or not self.expired(url)):
+                    self.hits += 1
+                    return self.results[url]
+                event = self.pending.get(url)
+                if event is None:
+                    self.misses += 1
+                    self.pending[url] = threading.Event()
+                    return None
+            event.wait()
+            waited = True
+
+    def expired(self, url: str) -> bool:
+        """
+        Determine if the result for a url is older than max_age.
+        """
+        if self.max_age is None:
+            return False
+        return time.time() - self.checked[url] > self.max_age
+
+    def prune(self):
+        """
+        Remove results older than max_age. Call with the lock held.
+        """
+        self.pruned = time.time()
+        if self.max_age is None:
+            return
+        for url in [url for url in self.checked if self.expired(url)]:
+            del self.results[url]
+            del self.checked[url]
+
+    def record(self, url: str, passed: bool):
+        """
+        Record the result for a claimed url, releasing any waiting threads.
+
+        Args:
+            - url     (str) : the url that was checked.
+            - passed (bool) : if the url passed.
+        """
+        with self.lock:
+            self.results[url] = passed
+            self.checked[url] = time.time()
+            event = self.pending.pop(url, None)
+            if self.max_age is not None and time.time() - self.pruned > self.max_age:
+                self.prune()
+        if event is not None:
+            event.set()
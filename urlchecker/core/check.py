@@ -7,16 +7,37 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 
 """
 
-import csv
+import functools
+import itertools
 import os
 import random
-import re
 import sys
-from typing import Optional, Dict, List
-
-from urlchecker.core import fileproc
-from urlchecker.core.urlproc import UrlCheckResult
-from urlchecker.core.worker import Workers
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Dict,
+    List,
+    Tuple,
+)
+
+from urlchecker.core import cache, fileproc
+from urlchecker.core.exclude import ExcludeMatcher
+from urlchecker.core.sink import ResultSink, get_sink
+from urlchecker.core.urlproc import UrlCheckResult, UrlRecord
+from urlchecker.core.urltable import CheckResults, ResultSets, UrlTable
+from urlchecker.core.worker import Pipeline, get_backend, parse_workers
+from urlchecker.logger import Progress, get_reporter
+from urlchecker.main import github
+
+# Columns of saved results, LINE and COLUMN are only saved with locations
+RESULT_HEADER = ["URL", "RESULT", "FILENAME", "LINE", "COLUMN"]
+
+# Files with more urls than this are checked in batches across threads
+URL_BATCH_SIZE = int(os.environ.get("URLCHECKER_URL_BATCH_SIZE", 8))
 
 
 class UrlChecker:
@@ -33,6 +54,18 @@ class UrlChecker:
         print_all: bool = True,
         include_patterns: Optional[List[str]] = None,
         serial: bool = False,
+        max_file_size: Optional[int] = fileproc.MAX_FILE_SIZE,
+        cache_file: Optional[str] = None,
+        changed_since: Optional[str] = None,
+        added_urls_only: bool = False,
+        discovery: str = "walk",
+        traversal_workers: int = 1,
+        revision: Optional[str] = None,
+        subfolder: Optional[str] = None,
+        workers: Optional[str] = None,
+        backend: Optional[str] = None,
+        url_table: Optional[UrlTable] = None,
+        extraction_cache: Optional[cache.ExtractionCache] = None,
     ):
         """
         initiate a url checker. At init we take in preferences for
@@ -46,16 +79,26 @@ class UrlChecker:
             - exclude_files    (list) : list of excluded files and patterns for flies.
             - include_patterns (list) : list of files and patterns to check.
             - serial           (bool) : do checks in serial (no multiprocessing)
+            - max_file_size     (int) : skip files larger than this many bytes (None or 0 to disable).
+            - cache_file        (str) : path to a json file to cache extracted urls between runs.
+            - changed_since     (str) : only check files changed since this git ref (e.g., origin/main).
+            - added_urls_only  (bool) : with changed_since, only check urls that appear in added lines.
+            - discovery         (str) : find files by "walk" (the filesystem), "git" (the index) or "auto".
+            - traversal_workers (int) : threads reading directories when walking (1 walks in serial).
+            - revision          (str) : check files at this git revision, read from the object store (no checkout).
+            - subfolder         (str) : with revision, only check files under this folder of path.
+            - workers           (str) : check threads to pin (e.g., 16), bounds to adapt within (e.g., 4:64) or auto.
+            - backend           (str) : extract files in processes ("process"), in this process ("thread" or "asyncio") or run all in "serial".
+            - url_table    (UrlTable) : the table to intern urls with, to share with other checkers (e.g., for a batch).
+            - extraction_cache (ExtractionCache) : a cache to share with other checkers, used instead of cache_file (saved by its owner).
         """
-        # Initiate results object, and checks lookup (holds UrlCheck) for each file
-        self.results = {
-            "passed": set(),
-            "failed": set(),
-            "excluded": set(),
-        }  # type: Dict[str, set]
+        # Results organized by filename, referencing each url by its id in
+        # a table, and the flattened results (passed, failed, excluded) of all
+        self.checks = CheckResults(url_table)
+        self.results = ResultSets(self.checks)
 
-        # Results organized by filename
-        self.checks = {}  # type: Dict[str, Dict]
+        # Files skipped before extraction (e.g., binary), with the reason
+        self.skipped = {}  # type: Dict[str, str]
 
         # Save run parameters
         self.exclude_files = exclude_files or []
@@ -63,8 +106,35 @@ class UrlChecker:
         self.print_all = print_all
         self.path = path
         self.file_types = file_types or [".py", ".md"]
-        self.file_paths = []
+        self.traversal_workers = traversal_workers
         self.serial = serial
+        self.max_file_size = max_file_size
+        self.changed_since = changed_since
+        self.revision = revision
+        self.workers = workers
+        parse_workers(workers)
+        self.backend = get_backend(backend)
+
+        # Blob id and size of each file at revision, by file path
+        self.tree = {}  # type: Dict[str, Tuple[str, int]]
+
+        # Urls in lines added since changed_since, by absolute file path
+        self.added_urls = None  # type: Optional[Dict[str, Optional[List[str]]]]
+
+        # Extracted urls are cached between runs (for files on disk), if requested
+        self.cache = None  # type: Optional[cache.ExtractionCache]
+        if extraction_cache is not None and not revision:
+            self.cache = extraction_cache
+        elif cache_file and not revision:
+            self.cache = cache.ExtractionCache(
+                cache_file, settings={"max_file_size": max_file_size}
+            )
+
+        # Discovered file paths, listed on first use (see iter_file_paths)
+        self._file_paths = []  # type: Optional[List[str]]
+        self.discovery = discovery
+        if discovery not in ["walk", "git", "auto"]:
+            sys.exit("Discovery must be one of walk, git or auto, found %s" % discovery)
 
         # get all file paths if a path is defined
         if path:
@@ -73,16 +143,48 @@ class UrlChecker:
             if not os.path.exists(path):
                 sys.exit("%s does not exist." % path)
 
-            # Case 1: a single file
-            if os.path.isfile(path):
+            # Case 1: files at a git revision, read from the object store
+            if revision:
+                if changed_since:
+                    sys.exit("A revision cannot be checked for changes since a ref.")
+                for file_name, blob, size in github.get_tree_files(
+                    path, revision, subfolder
+                ):
+                    self.tree[file_name] = (blob, size)
+                self.file_paths = fileproc.filter_file_paths(
+                    self.tree,
+                    file_types=self.file_types,
+                    exclude_files=self.exclude_files,
+                    include_patterns=self.include_patterns,
+                )
+
+            # Case 2: a single file
+            elif os.path.isfile(path):
                 self.file_paths = [os.path.abspath(path)]
-            else:
-                self.file_paths = fileproc.get_file_paths(
-                    base_path=path,
+
+            # Case 3: only files changed since a git ref
+            elif changed_since:
+                self.file_paths = fileproc.filter_file_paths(
+                    self.get_changed_files(path, changed_since),
                     file_types=self.file_types,
                     exclude_files=self.exclude_files,
                     include_patterns=self.include_patterns,
                 )
+                if added_urls_only:
+                    self.added_urls = {
+                        os.path.realpath(file_name): (
+                            None
+                            if lines is None
+                            else fileproc.collect_added_links(file_name, lines)
+                        )
+                        for file_name, lines in github.get_added_lines(
+                            path, changed_since
+                        ).items()
+                    }
+            # Case 4: walk the tree (or list the git index) lazily, so a run
+            # can start checking files before discovery is done
+            else:
+                self._file_paths = None
 
     def __str__(self) -> str:
         if self.path:
@@ -92,12 +194,196 @@ class UrlChecker:
     def __repr__(self) -> str:
         return self.__str__()
 
+    @property
+    def file_paths(self) -> List[str]:
+        """
+        All file paths to check, running discovery if it has not run yet.
+        """
+        if self._file_paths is None:
+            self._file_paths = list(self.iter_file_paths())
+        return self._file_paths
+
+    @file_paths.setter
+    def file_paths(self, file_paths: List[str]):
+        self._file_paths = file_paths
+
+    def iter_file_paths(self) -> Iterator[str]:
+        """
+        Yield file paths to check as they are discovered. The paths are kept,
+        so a second pass (or the file_paths property) does not walk again.
+
+        Returns:
+            (iterator) of file paths.
+        """
+        if self._file_paths is not None:
+            yield from self._file_paths
+            return
+
+        file_paths = []
+        for file_name in self.get_file_paths(self.path or ".", self.discovery):
+            file_paths.append(file_name)
+            yield file_name
+        self._file_paths = file_paths
+
+    def get_file_paths(self, path: str, discovery: str = "walk") -> Iterable[str]:
+        """
+        Find files to check under a path. With "git" discovery, files are
+        listed from the git index (respecting .gitignore), falling back to
+        walking the filesystem if the path is not in a git repository. The
+        "auto" mode uses git without a message when it falls back. A walk
+        yields files as they are found, using traversal_workers threads.
+
+        Args:
+            - path      (str) : the root folder to check.
+            - discovery (str) : one of "walk", "git" or "auto".
+
+        Returns:
+            (iterable) matching file paths.
+        """
+        if discovery in ["git", "auto"]:
+            tracked = github.get_tracked_files(path)
+            if tracked is not None:
+                return fileproc.filter_file_paths(
+                    tracked,
+                    file_types=self.file_types,
+                    exclude_files=self.exclude_files,
+                    include_patterns=self.include_patterns,
+                )
+            if discovery == "git":
+                print("%s is not a git repository, walking the filesystem." % path)
+
+        matcher = fileproc.FileMatcher(
+            self.file_types, self.exclude_files, self.include_patterns
+        )
+        return fileproc.iter_file_paths(path, matcher, workers=self.traversal_workers)
+
+    def iter_revision_files(
+        self, file_paths: Iterable[str]
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream the content of files at revision from the object store, for
+        the extraction stage. Files that are too large (by the size listed
+        in the tree) are skipped without being read.
+
+        Args:
+            - file_paths (iterable) : file paths listed at revision.
+
+        Returns:
+            (iterator) of file paths with task arguments (content, or skipped).
+        """
+        file_paths = [x for x in file_paths if x in self.tree]
+        read = []
+        for file_name in file_paths:
+            if self.max_file_size and self.tree[file_name][1] > self.max_file_size:
+                yield file_name, {
+                    "skipped": "larger than %s bytes" % self.max_file_size
+                }
+            else:
+                read.append(file_name)
+
+        blobs = [self.tree[file_name][0] for file_name in read]
+        for file_name, content in zip(read, github.iter_blobs(self.path or ".", blobs)):
+            if content is None:
+                yield file_name, {"skipped": "missing from the object store"}
+            else:
+                yield file_name, {"content": content}
+
+    def get_changed_files(self, path: str, changed_since: str) -> List[str]:
+        """
+        Get files under a path that changed since a git ref. Paths from git
+        are absolute, so they are made relative to path again (if path is)
+        to match the paths found by walking the directory.
+
+        Args:
+            - path          (str) : the root folder to check, in a git repository.
+            - changed_since (str) : the base branch, tag or commit.
+
+        Returns:
+            (list) changed files under path.
+        """
+        root = os.path.realpath(path)
+        file_paths = []
+        for file_name in github.get_changed_files(path, changed_since):
+            if not file_name.startswith(root + os.sep):
+                continue
+            file_paths.append(os.path.join(path, os.path.relpath(file_name, root)))
+        return file_paths
+
+    def get_added_urls(self, file_name: str) -> Optional[List[str]]:
+        """
+        Get the urls in lines added to a file since changed_since. None means
+        there is no restriction (we aren't limiting to added urls, or the
+        whole file is new).
+
+        Args:
+            - file_name (str) : the file to get added urls for.
+
+        Returns:
+            (list) urls from added lines, or None.
+        """
+        if self.added_urls is None:
+            return None
+        return self.added_urls.get(os.path.realpath(file_name), [])
+
+    def iter_records(self) -> Iterator[UrlRecord]:
+        """
+        Yield the record (see UrlRecord) of each url checked in this run,
+        with its status, error, seconds and attempts. A url found in many
+        files is checked (and recorded) once. Records are not kept when the
+        run saves results (see iter_run), the saved file has them instead.
+
+        Returns:
+            (iterator) of url records.
+        """
+        for stored in self.checks.stored.values():
+            yield from stored.records
+
+    def get_locations(self, file_name: str) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Get the locations (line and column) of each url found in a file
+        that was checked. When the run saves results (see iter_run) only
+        files with failures keep their locations.
+
+        Args:
+            - file_name (str) : a checked file (a key in checks).
+
+        Returns:
+            (dict) a list of (line, column) for each url.
+        """
+        result = self.checks.get(file_name, {})
+        return fileproc.index_occurrences(
+            result.get("urls", []), result.get("occurrences", [])
+        )
+
+    def add_extracted(self, file_name: str, extracted: dict):
+        """
+        Add the extraction result for a file as soon as it is back in this
+        process: decode the urls (see decode_extracted), store them in the
+        cache (if we have one) and report if the file was skipped.
+
+        Args:
+            - file_name  (str) : the file that was extracted.
+            - extracted (dict) : task kwargs updated with the extraction result.
+        """
+        entry = decode_extracted(
+            extracted,
+            self.cache.get(file_name) if self.cache else None,
+            url_table=self.checks.table,
+        )
+        if self.cache and entry:
+            self.cache.update(file_name, entry, extracted.get("cached", False))
+        if extracted.get("skipped") and not extracted.get("cached"):
+            get_reporter().message(
+                "Skipping %s, file is %s." % (file_name, extracted["skipped"])
+            )
+
     def save_results(
         self,
         file_path: str,
         sep: str = ",",
         header: Optional[List[str]] = None,
         relative_paths: bool = True,
+        locations: bool = False,
     ) -> str:
         """
         Given a check_results dictionary, a dict with "failed" and "passed" keys (
@@ -107,10 +393,11 @@ class UrlChecker:
         on error.
 
         Args:
-            - file_path       (str) : the file path (.csv) to save to.
+            - file_path       (str) : the file path (.csv, .jsonl or .db for SQLite) to save to.
             - sep             (str) : the separate to use (defaults to comma)
             - header         (list) : if not provided, will save URL,RESULT
             - relative_paths (bool) : save relative paths (default True)
+            - locations      (bool) : add LINE,COLUMN with a row for each occurrence of a url (default False)
 
         Returns:
             (str) file_path: a newly saved csv with the results
@@ -122,46 +409,123 @@ class UrlChecker:
         if not os.path.exists(dirname):
             sys.exit("%s does not exist, cannot save %s there." % (dirname, file_path))
 
-        # Ensure the header is provided and correct (length 2)
+        # Ensure the header is provided and correct (length 3, or 5 with locations)
+        columns = 5 if locations else 3
         if not header:
-            header = ["URL", "RESULT", "FILENAME"]
+            header = RESULT_HEADER[:columns]
 
-        if len(header) != 3:
-            sys.exit("Header must be length 3 to match size of data.")
+        if len(header) != columns:
+            sys.exit("Header must be length %s to match size of data." % columns)
 
         print("Saving results to %s" % file_path)
 
         # Write to file after header row
-        with open(file_path, mode="w") as fd:
-            writer = csv.writer(
-                fd, delimiter=sep, quotechar='"', quoting=csv.QUOTE_MINIMAL
+        with get_sink(file_path, header, sep=sep) as sink:
+            for file_name, result in self.checks.items():
+                self.write_result(sink, file_name, result, relative_paths, locations)
+
+        return file_path
+
+    def iter_rows(
+        self, relative_paths: bool = True, locations: bool = False
+    ) -> Iterator[List[Any]]:
+        """
+        Yield a row (URL,RESULT,FILENAME and optionally LINE,COLUMN) for
+        each url of each checked file, as saved by save_results.
+
+        Args:
+            - relative_paths (bool) : use relative paths (default True)
+            - locations      (bool) : add LINE,COLUMN with a row for each occurrence of a url (default False)
+
+        Returns:
+            (iterator) of rows.
+        """
+        for file_name, result in self.checks.items():
+            yield from self.get_rows(file_name, result, relative_paths, locations)
+
+    def write_result(
+        self,
+        sink: ResultSink,
+        file_name: str,
+        result: Dict[str, Any],
+        relative_paths: bool = True,
+        locations: bool = False,
+        path: Optional[str] = None,
+    ):
+        """
+        Write the result of a checked file to a sink (see get_sink).
+
+        Args:
+            - sink     (ResultSink) : the open sink to write to.
+            - file_name       (str) : the file that was checked.
+            - result         (dict) : the result of check_task for the file.
+            - relative_paths (bool) : use relative paths (default True)
+            - locations      (bool) : add LINE,COLUMN with a row for each occurrence of a url (default False)
+            - path            (str) : a PATH to start each row with (e.g., for a batch).
+        """
+        rows = self.get_rows(file_name, result, relative_paths, locations)
+        if path is not None:
+            rows = ([path] + row for row in rows)
+        sink.write_result(
+            self.relative_name(file_name) if relative_paths else file_name,
+            result,
+            rows,
+            path=self.path if path is None else path,
+        )
+
+    def get_rows(
+        self,
+        file_name: str,
+        result: Dict[str, Any],
+        relative_paths: bool = True,
+        locations: bool = False,
+    ) -> Iterator[List[Any]]:
+        """
+        Yield a row (URL,RESULT,FILENAME and optionally LINE,COLUMN) for
+        each url of a checked file.
+
+        Args:
+            - file_name       (str) : the file that was checked.
+            - result         (dict) : the result of check_task for the file.
+            - relative_paths (bool) : use relative paths (default True)
+            - locations      (bool) : add LINE,COLUMN with a row for each occurrence of a url (default False)
+
+        Returns:
+            (iterator) of rows.
+        """
+        positions = {}  # type: Dict[str, List[Tuple[int, int]]]
+        if locations:
+            positions = fileproc.index_occurrences(
+                result.get("urls", []), result.get("occurrences", [])
             )
-            writer.writerow(header)
 
-            # Iterate through filenames, each with check results
-            for file_name, result in self.checks.items():
+        if relative_paths:
+            file_name = self.relative_name(file_name)
 
-                # Derive the relative path based on self.path, or relative to run
-                if relative_paths:
-                    if self.path:
-                        file_name = re.sub(self.path, "", file_name).strip("/")
-                    else:
-                        file_name = os.path.relpath(file_name)
-
-                [
-                    writer.writerow([url, "failed", file_name])
-                    for url in result["failed"]
-                ]
-                [
-                    writer.writerow([url, "excluded", file_name])
-                    for url in result["excluded"]
-                ]
-                [
-                    writer.writerow([url, "passed", file_name])
-                    for url in result["passed"]
-                ]
+        for status in ["failed", "excluded", "passed"]:
+            for url in result[status]:
+                if not locations:
+                    yield [url, status, file_name]
+                    continue
+                for line, column in positions.get(url, [("", "")]):
+                    yield [url, status, file_name, line, column]
 
-        return file_path
+    def relative_name(self, file_name: str) -> str:
+        """
+        Get the name of a file relative to the path checked, or to where
+        we run if there isn't one.
+
+        Args:
+            - file_name (str) : a file found under path.
+
+        Returns:
+            (str) the relative file name.
+        """
+        if not self.path:
+            return os.path.relpath(file_name)
+        if file_name.startswith(self.path):
+            file_name = file_name[len(self.path) :]
+        return file_name.strip("/")
 
     def run(
         self,
@@ -171,105 +535,481 @@ class UrlChecker:
         retry_count: int = 2,
         timeout: int = 5,
         no_check_certs: bool = False,
-    ) -> Dict[str, set]:
+        exclude_globs: Optional[List[str]] = None,
+        exclude_regexes: Optional[List[str]] = None,
+        on_result: Optional[Callable[[str, Dict[str, Any]], Any]] = None,
+        progress: bool = False,
+        server: Optional[str] = None,
+        save: Optional[str] = None,
+        save_locations: bool = False,
+    ) -> Mapping[str, set]:
         """
         Run the url checker given a path, excluded patterns for urls/files
         name paths or patterns, and a number of retries and timeouts.
-        This provides a wrapper to check_files, which expects an already
-        determined listing of files.
+        Files stream through a pipeline: urls are extracted in a process
+        pool, and each file's urls are checked in a thread pool as soon as
+        they are extracted. See iter_run to get each result as it finishes.
 
         Args:
-            - file_paths       (list) : list of file paths to run over, defaults to those generated on init.
+            - file_paths       (list) : list of file paths to run over, defaults to those discovered from path.
             - exclude_urls     (list) : list of excluded urls.
             - exclude_patterns (list) : list of excluded patterns for urls.
             - retry_count       (int) : number of retries on failed first check. Default=2.
             - timeout           (int) : timeout to use when waiting on check feedback. Default=5.
             - no_check_certs   (bool) : do not check certificates
+            - exclude_globs    (list) : list of excluded glob patterns for urls.
+            - exclude_regexes  (list) : list of excluded regular expressions for urls.
+            - on_result    (function) : called with the file name and result as each file finishes.
+            - progress         (bool) : show live progress and throughput (on stderr).
+            - server            (str) : check urls with this urlchecker server (see urlchecker serve).
+            - save              (str) : write results to this file (csv, .jsonl or a .db for SQLite) as each file finishes, see iter_run for what is kept in memory.
+            - save_locations   (bool) : with save, add LINE,COLUMN with a row for each occurrence of a url.
 
         Returns:
             dictionary with each of list of urls for "failed" and "passed."
         """
-        file_paths = file_paths or self.file_paths
+        for file_name, result in self.iter_run(
+            file_paths=file_paths,
+            exclude_patterns=exclude_patterns,
+            exclude_urls=exclude_urls,
+            retry_count=retry_count,
+            timeout=timeout,
+            no_check_certs=no_check_certs,
+            exclude_globs=exclude_globs,
+            exclude_regexes=exclude_regexes,
+            progress=progress,
+            server=server,
+            save=save,
+            save_locations=save_locations,
+        ):
+            if on_result:
+                on_result(file_name, result)
+        return self.results
 
-        # Allow for user to skip specifying excluded options
-        exclude_urls = exclude_urls or []
-        exclude_patterns = exclude_patterns or []
+    def iter_run(
+        self,
+        file_paths: Optional[List[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        exclude_urls: Optional[List[str]] = None,
+        retry_count: int = 2,
+        timeout: int = 5,
+        no_check_certs: bool = False,
+        exclude_globs: Optional[List[str]] = None,
+        exclude_regexes: Optional[List[str]] = None,
+        progress: bool = False,
+        server: Optional[str] = None,
+        save: Optional[str] = None,
+        save_locations: bool = False,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Run the url checker (see run), yielding the result for each file as
+        soon as it finishes, in the order files complete. Each result is
+        added to checks and results (and written, if saving) before it is
+        yielded. When saving, the saved file is the complete record of the
+        run: checks still keep the failed, passed and excluded urls of every
+        file (as ids in the url table, for results), but not the url records
+        (iter_records yields nothing) or the urls and occurrences of files
+        without failures (get_locations is empty for them). Memory still
+        grows with the number of files and distinct urls, but not with their
+        locations and attempts.
 
-        # Run with multiprocessing
-        tasks = {}
-        funcs = {}
-        workers = Workers()
+        Returns:
+            (iterator) of file names with their result (see check_task).
+        """
+        # Results are written as each file finishes, if saving
+        sink = None
+        if save:
+            sink = get_sink(save, RESULT_HEADER[: 5 if save_locations else 3])
+            print("Saving results to %s" % sink.file_path)
+
+        # The same check task (and exclusions) are used for all files
+        check = get_check_task(
+            exclude_urls=exclude_urls,
+            exclude_patterns=exclude_patterns,
+            exclude_globs=exclude_globs,
+            exclude_regexes=exclude_regexes,
+            no_check_certs=no_check_certs,
+            print_all=self.print_all,
+            retry_count=retry_count,
+            timeout=timeout,
+            server=server,
+            record_attempts=sink is not None and sink.record_attempts,
+        )
+
+        # Files stream through extraction (processes) into checks (threads)
+        pipeline = Pipeline(
+            serial=self.serial, backend=self.backend, **parse_workers(self.workers)
+        )
+        display = Progress() if progress else None
+
+        try:
+            for file_name, result in pipeline.run(
+                extract_task,
+                check,
+                self.iter_tasks(file_paths),
+                on_extract=self.add_extracted,
+                measure=measure_check,
+                split=split_check_task,
+                merge=merge_check_results,
+                on_error=error_result,
+            ):
+                self.add_result(file_name, result, keep_urls=sink is None)
+                if sink:
+                    self.write_result(sink, file_name, result, locations=save_locations)
+                if display:
+                    display.update(len(result["urls"]), len(result["failed"]))
+                yield file_name, result
+
+        # Keep what was written (and reported) if the run is interrupted
+        finally:
+            if sink:
+                sink.close()
+            get_reporter().flush()
+
+        if display:
+            display.finish()
+        self.finish()
+
+    def iter_tasks(
+        self,
+        file_paths: Optional[Iterable[str]] = None,
+        ports: Optional[Iterator[int]] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield an extraction task (the file name and kwargs) for each file, as
+        files are discovered.
 
-        # Each run should have its own port (~2k)
-        ports = list(range(8000, 9999))
-        random.shuffle(ports)
+        Args:
+            - file_paths (iterable) : file paths to run over, defaults to those discovered from path.
+            - ports      (iterator) : ports for drivers, defaults to get_ports().
 
-        # loop through files
-        results = {}
-        for file_name in file_paths:
+        Returns:
+            (iterator) of file names with task kwargs.
+        """
+        paths = file_paths or self.iter_file_paths()  # type: Iterable[str]
+        ports = ports or get_ports()
+        if self.revision:
+            sources = self.iter_revision_files(paths)
+        else:
+            sources = ((file_name, {}) for file_name in paths)
+
+        for file_name, source in sources:
+            yield file_name, dict(
+                source,
+                file_name=file_name,
+                max_file_size=self.max_file_size,
+                port=next(ports),
+                use_cache=self.cache is not None,
+                cache_entry=(
+                    cache.get_stamp(self.cache.get(file_name)) if self.cache else None
+                ),
+                added_urls=self.get_added_urls(file_name),
+            )
 
-            # Re-use ports if we run out
-            if not ports:
-                ports = list(range(8000, 9999))
-
-            # Export parameters and functions, use the same check task for all
-            kwargs = {
-                "file_name": file_name,
-                "exclude_patterns": exclude_patterns,
-                "no_check_certs": no_check_certs,
-                "exclude_urls": exclude_urls,
-                "print_all": self.print_all,
-                "retry_count": retry_count,
-                "timeout": timeout,
-                "port": ports.pop(0),
-            }
-
-            if self.serial:
-                results[file_name] = check_task(**kwargs)
-                continue
+    def add_result(
+        self, file_name: str, result: Dict[str, Any], keep_urls: bool = True
+    ):
+        """
+        Add the result of a check task for a file to our checks and
+        flattened results.
 
-            tasks[file_name] = kwargs
-            funcs[file_name] = check_task
+        Args:
+            - file_name  (str) : the file that was checked.
+            - result    (dict) : the result of check_task for the file.
+            - keep_urls (bool) : keep the records, and the urls and occurrences of a file without failures (False once they are saved).
 
-        if not self.serial:
-            results = workers.run(funcs, tasks)  # type: ignore
-        if not results:
+        The failed, passed and excluded urls of the file are always kept.
+        """
+        if result.get("skipped"):
+            self.skipped[file_name] = result["skipped"]
+        if not keep_urls:
+            result = dict(result, records=[])
+            if not result["failed"]:
+                result.update(urls=[], occurrences=[])
+        self.checks[file_name] = result
+
+    def finish(self, save_cache: bool = True):
+        """
+        Finish a run, saving the extraction cache.
+
+        Args:
+            - save_cache (bool) : save (and report) the extraction cache, unless it is shared and saved by its owner.
+        """
+        if self.cache and save_cache:
+            self.cache.save()
+            print(
+                "Extraction cache: %s hits, %s misses."
+                % (self.cache.hits, self.cache.misses)
+            )
+
+        if not self.checks:
             print("\U0001F914 There were no URLs to check.")
-            return self.results
 
-        for file_name, result in results.items():
-            self.checks[file_name] = result
-            self.results["failed"].update(result["failed"])
-            self.results["passed"].update(result["passed"])
-            self.results["excluded"].update(result["excluded"])
 
-        # A flattened dict of passed and failed
-        return self.results
+def get_check_task(
+    exclude_urls: Optional[List[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    exclude_globs: Optional[List[str]] = None,
+    exclude_regexes: Optional[List[str]] = None,
+    result_cache: Optional[cache.ResultCache] = None,
+    **kwargs
+) -> Callable:
+    """
+    Get the check task to run for every file, with exclusions compiled once
+    and a result cache, both shared by the check threads so each distinct
+    url is matched and checked once.
+
+    Args:
+        - exclude_urls     (list) : list of excluded urls.
+        - exclude_patterns (list) : list of excluded patterns for urls.
+        - exclude_globs    (list) : list of excluded glob patterns for urls.
+        - exclude_regexes  (list) : list of excluded regular expressions for urls.
+        - result_cache  (ResultCache) : results to share (defaults to a new cache).
+        - kwargs           (dict) : other arguments for check_task (e.g., timeout).
+
+    Returns:
+        (function) check_task with these arguments.
+    """
+    exclude_urls = exclude_urls or []
+    exclude_patterns = exclude_patterns or []
+    return functools.partial(
+        check_task,
+        exclude_urls=exclude_urls,
+        exclude_patterns=exclude_patterns,
+        exclude_matcher=ExcludeMatcher(
+            exclude_urls, exclude_patterns, exclude_globs, exclude_regexes
+        ),
+        result_cache=result_cache or cache.ResultCache(),
+        **kwargs
+    )
+
+
+def measure_check(result: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Get the number of urls checked for a file, and how many failed, to adapt
+    the number of checks in flight.
+    """
+    return len(result["passed"]) + len(result["failed"]), len(result["failed"])
+
+
+def split_check_task(
+    kwargs: Dict[str, Any], batch_size: int = URL_BATCH_SIZE
+) -> List[Dict[str, Any]]:
+    """
+    Split the check task for a file with many urls into tasks that each check
+    a batch of them, so any free thread can take the next batch and a large
+    file doesn't keep one thread busy after the others finish.
+
+    Args:
+        - kwargs    (dict) : the kwargs for check_task, after extraction.
+        - batch_size (int) : the most urls to check in one task.
+
+    Returns:
+        (list) of kwargs for check_task, one for each batch.
+    """
+    urls = kwargs.get("urls") or []
+    if kwargs.get("added_urls") is not None:
+        added = set(kwargs["added_urls"])
+        urls = [url for url in urls if url in added]
+    if kwargs.get("skipped") or len(urls) <= batch_size:
+        return [kwargs]
+    return [
+        dict(kwargs, check_urls=urls[start : start + batch_size], print_all=False)
+        for start in range(0, len(urls), batch_size)
+    ]
+
+
+def merge_check_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the results of check tasks for batches of a file's urls (see
+    split_check_task) into one result for the file.
+    """
+    merged = dict(results[0])
+    for key in ["failed", "passed", "excluded", "records"]:
+        if key in merged:
+            merged[key] = [item for result in results for item in result[key]]
+    return merged
+
+
+def error_result(key: Any, error: str) -> Dict[str, Any]:
+    """
+    The result for a file whose extract or check task raised (see
+    Pipeline.run), with nothing checked and the error as the reason the
+    file was skipped.
+    """
+    return {
+        "failed": [],
+        "passed": [],
+        "excluded": [],
+        "skipped": "errored (%s)" % error,
+        "urls": [],
+        "occurrences": [],
+        "records": [],
+    }
+
+
+def get_ports() -> Iterator[int]:
+    """
+    Each check gets its own port (~2k) for the web driver, shuffled
+    and re-used if we run out.
+    """
+    ports = list(range(8000, 9999))
+    random.shuffle(ports)
+    return itertools.cycle(ports)
+
+
+def extract_task(*args, **kwargs) -> dict:
+    """
+    An extraction task, run in the first (cpu bound) stage of the pipeline.
+    The result updates the kwargs given to the check task. The urls and
+    occurrences are sent back as a compact record (see fileproc.pack_links)
+    to be decoded once, with decode_extracted. If caching is enabled, a valid
+    cache entry stamp is used instead of extracting again, and the urls come
+    from the cache in the parent. Files at a git revision come with their
+    content (or a reason to skip them).
+    """
+    file_name = kwargs["file_name"]
+    use_cache = kwargs.get("use_cache", False)
+    if use_cache:
+        stamp = cache.check_entry(file_name, kwargs.get("cache_entry"))
+        if stamp:
+            return {"cache_entry": stamp, "cached": True}
+
+    # Files at a git revision may be skipped before they are read
+    if kwargs.get("skipped"):
+        return {"urls": [], "occurrences": [], "skipped": kwargs["skipped"]}
+
+    # Or have content read from git (no file on disk). Skipped files are
+    # reported by the parent, so workers don't write output
+    content = kwargs.get("content")
+    checker = UrlCheckResult(
+        file_name=file_name,
+        max_file_size=kwargs.get("max_file_size", fileproc.MAX_FILE_SIZE),
+        urls=None if content is None else [],
+        print_all=False,
+    )
+    if content is not None:
+        checker.extract_urls(content=content)
+    result = {
+        "links": fileproc.pack_links(checker.urls, checker.occurrences),
+        "skipped": checker.skipped,
+    }  # type: Dict[str, Any]
+
+    # The content is not needed for checks, so don't hold it until then
+    if content is not None:
+        result["content"] = None
+    if use_cache and os.path.exists(file_name):
+        result["cache_entry"] = cache.make_entry(file_name, skipped=checker.skipped)
+        result["cached"] = False
+    return result
+
+
+def decode_extracted(
+    extracted: Dict[str, Any],
+    entry: Optional[Dict[str, Any]] = None,
+    url_table: Optional[UrlTable] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Decode the result of an extract task in place, once it is back in this
+    process: unpack the urls and occurrences, or get them from the cache
+    entry on a cache hit. With a url table, urls are the table's copies,
+    so a url found in many files is kept once.
+
+    Args:
+        - extracted    (dict) : task kwargs updated with the extraction result.
+        - entry        (dict) : the stored cache entry for the file, if any.
+        - url_table (UrlTable) : the table to intern urls with.
+
+    Returns:
+        (dict) the complete cache entry to store, if caching.
+    """
+    if "links" in extracted:
+        extracted["urls"], extracted["occurrences"] = fileproc.unpack_links(
+            extracted.pop("links")
+        )
+    elif extracted.get("cached") and entry:
+        extracted["urls"] = entry["urls"]
+        extracted["occurrences"] = entry["occurrences"]
+        extracted["skipped"] = entry["skipped"]
+    if url_table is not None and extracted.get("urls"):
+        extracted["urls"] = url_table.canonical(extracted["urls"])
+
+    if not extracted.get("cache_entry"):
+        return None
+    return dict(
+        extracted["cache_entry"],
+        urls=extracted["urls"],
+        occurrences=extracted["occurrences"],
+        skipped=extracted["skipped"],
+    )
 
 
 def check_task(*args, **kwargs):
     """
-    A checking task, the default we use
+    A checking task, the default we use. If urls are not provided (from
+    an extract task) they are extracted from the file first.
     """
+    if "links" in kwargs:
+        decode_extracted(kwargs)
+
     # Instantiate a checker to extract urls
     checker = UrlCheckResult(
         file_name=kwargs["file_name"],
         exclude_patterns=kwargs.get("exclude_patterns", []),
         exclude_urls=kwargs.get("exclude_urls", []),
         print_all=kwargs.get("print_all", True),
+        max_file_size=kwargs.get("max_file_size", fileproc.MAX_FILE_SIZE),
+        urls=kwargs.get("urls"),
+        occurrences=kwargs.get("occurrences"),
+        exclude_matcher=kwargs.get("exclude_matcher"),
+        result_cache=kwargs.get("result_cache"),
+        record_attempts=kwargs.get("record_attempts", False),
     )
-
-    # Check the urls
-    checker.check_urls(
-        retry_count=kwargs.get("retry_count", 2),
-        timeout=kwargs.get("timeout", 5),
-        port=kwargs.get("port"),
-        no_check_certs=kwargs.get("no_check_certs"),
-    )
+    checker.skipped = kwargs.get("skipped", checker.skipped)
+
+    # Only check urls from added lines, if defined
+    if kwargs.get("added_urls") is not None:
+        checker.filter_urls(set(kwargs["added_urls"]))
+
+    # Skipped files have nothing to check
+    if checker.skipped:
+        return {
+            "failed": [],
+            "passed": [],
+            "excluded": [],
+            "skipped": checker.skipped,
+            "urls": [],
+            "occurrences": [],
+            "records": [],
+        }
+
+    # Check the urls (or a batch of them, see split_check_task) with a server
+    if kwargs.get("server"):
+        checker.check_urls_remote(
+            kwargs["server"],
+            urls=kwargs.get("check_urls"),
+            retry_count=kwargs.get("retry_count", 2),
+            timeout=kwargs.get("timeout", 5),
+            no_check_certs=kwargs.get("no_check_certs"),
+        )
+
+    # Or here
+    else:
+        checker.check_urls(
+            urls=kwargs.get("check_urls"),
+            retry_count=kwargs.get("retry_count", 2),
+            timeout=kwargs.get("timeout", 5),
+            port=kwargs.get("port"),
+            no_check_certs=kwargs.get("no_check_certs"),
+        )
 
     # Update flattened results
     return {
         "failed": checker.failed,
         "passed": checker.passed,
         "excluded": checker.excluded,
+        "skipped": checker.skipped,
+        "urls": checker.urls,
+        "occurrences": checker.occurrences,
+        "records": checker.records,
     }
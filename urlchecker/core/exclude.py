@@ -7,7 +7,13 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 
 """
 
-from typing import Optional, List
+import fnmatch
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Pattern, Set
+
+# Below this many substring patterns, a loop of "in" checks beats the automaton
+AUTOMATON_MIN_PATTERNS = 16
 
 
 def excluded(
@@ -40,3 +46,166 @@ def excluded(
 
     # default return
     return False
+
+
+class PatternAutomaton:
+    """
+    An Aho-Corasick automaton to check if any of many substring patterns
+    occurs in a string, in one pass over the string (instead of one pass
+    per pattern). States are a list of transitions (dicts keyed by
+    character) with failure links, and a state is terminal if any pattern
+    ends there or at one of its suffixes.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.transitions = [{}]  # type: List[Dict[str, int]]
+        self.terminal = [False]  # type: List[bool]
+        for pattern in patterns:
+            self.add(pattern)
+        self.fail = self.link()
+
+    def add(self, pattern: str):
+        """
+        Add a pattern to the trie of states.
+        """
+        state = 0
+        for char in pattern:
+            following = self.transitions[state].get(char)
+            if following is None:
+                following = len(self.transitions)
+                self.transitions[state][char] = following
+                self.transitions.append({})
+                self.terminal.append(False)
+            state = following
+        self.terminal[state] = True
+
+    def link(self) -> List[int]:
+        """
+        Derive failure links breadth first: the failure of a state is the
+        longest proper suffix of its path that is also in the trie.
+        """
+        fail = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self.transitions[state].items():
+                queue.append(following)
+                fallback = fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = fail[fallback]
+                fail[following] = self.transitions[fallback].get(char, 0)
+                if fail[following] == following:
+                    fail[following] = 0
+                self.terminal[following] = (
+                    self.terminal[following] or self.terminal[fail[following]]
+                )
+        return fail
+
+    def search(self, text: str) -> bool:
+        """
+        Check if any pattern occurs in text.
+
+        Args:
+            - text (str) : the string to search.
+
+        Returns:
+            (bool) True if a pattern was found.
+        """
+        transitions, terminal, fail = self.transitions, self.terminal, self.fail
+        if terminal[0]:
+            return True
+        state = 0
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            if terminal[state]:
+                return True
+        return False
+
+
+class ExcludeMatcher:
+    """
+    An ExcludeMatcher checks urls against exclusions compiled once for a
+    run: a set for exact urls, an automaton for substring patterns, one
+    regular expression for globs (which must match the whole url) and one
+    for regexes (which can match anywhere, unless anchored). Results are
+    remembered by url, so each distinct url is only matched once no matter
+    how many files (or threads) ask about it.
+    """
+
+    def __init__(
+        self,
+        exclude_urls: Optional[List[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        exclude_globs: Optional[List[str]] = None,
+        exclude_regexes: Optional[List[str]] = None,
+    ):
+        self.exclude_urls = set(exclude_urls or [])  # type: Set[str]
+        self.exclude_patterns = list(dict.fromkeys(exclude_patterns or []))
+        self.automaton = None  # type: Optional[PatternAutomaton]
+        if len(self.exclude_patterns) >= AUTOMATON_MIN_PATTERNS:
+            self.automaton = PatternAutomaton(self.exclude_patterns)
+
+        # Globs and regular expressions are each joined into one expression
+        self.globs = list(exclude_globs or [])
+        self.regexes = list(exclude_regexes or [])
+        self.glob = join_expressions(fnmatch.translate(x) for x in self.globs)
+        self.regex = join_expressions(self.regexes)
+        self.seen = {}  # type: Dict[str, bool]
+
+    def __str__(self) -> str:
+        return "ExcludeMatcher:%s" % len(self)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        return (
+            len(self.exclude_urls)
+            + len(self.exclude_patterns)
+            + len(self.globs)
+            + len(self.regexes)
+        )
+
+    def __call__(self, url: str) -> bool:
+        return self.excluded(url)
+
+    def excluded(self, url: str) -> bool:
+        """
+        Check if a url is excluded, remembering the result.
+
+        Args:
+            - url (str) : link to check.
+
+        Returns:
+            (bool) boolean for whether link is excluded or not.
+        """
+        result = self.seen.get(url)
+        if result is None:
+            result = self.seen[url] = self.match(url)
+        return result
+
+    def match(self, url: str) -> bool:
+        """
+        Match a url against the exclusions, cheapest first.
+        """
+        if url in self.exclude_urls:
+            return True
+        if self.automaton is not None:
+            if self.automaton.search(url):
+                return True
+        elif any(pattern in url for pattern in self.exclude_patterns):
+            return True
+        if self.glob and self.glob.fullmatch(url):
+            return True
+        return bool(self.regex and self.regex.search(url))
+
+
+def join_expressions(expressions: Iterable[str]) -> Optional[Pattern]:
+    """
+    Compile regular expressions into one that matches where any of them do,
+    or None if there are none.
+    """
+    joined = "|".join("(?:%s)" % x for x in expressions)
+    return re.compile(joined) if joined else None
@@ -0,0 +1,259 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import json
+import re
+from html.parser import HTMLParser
+from typing import Any, Iterator, List, Optional, TextIO, Tuple
+
+# Read size for formats that are fed to a parser in chunks
+CHUNK_SIZE = 64 * 1024
+
+# Html attributes that can hold a link
+HTML_LINK_ATTRIBUTES = {
+    "href",
+    "src",
+    "srcset",
+    "action",
+    "cite",
+    "data",
+    "poster",
+    "content",
+}
+
+# The name and attributes of a tag's raw text, read as html.parser does
+TAG_NAME = re.compile(r"<[a-zA-Z][^\t\n\r\f />\x00]*(?:\s|/(?!>))*")
+TAG_ATTRIBUTE = re.compile(
+    r"""((?<=['"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*('[^']*'|"[^"]*"|(?!['"])[^>\s]*))?(?:\s|/(?!>))*"""
+)
+
+# A fragment is the line and column (both starting at 1) where text starts,
+# or a line of 0 for text without a position in the file
+Fragment = Tuple[int, int, str]
+
+
+def extract_text(fd: TextIO) -> Iterator[Fragment]:
+    """
+    The default (fallback) extractor. Stream a text file line by line and
+    yield lines that can contain a link. The url regular expression never
+    spans whitespace, so scanning lines is equivalent to scanning the full
+    content, and lines without "http" can never produce a kept url.
+
+    Args:
+        - fd (TextIO) : an open text file.
+
+    Returns:
+        (iterator) of fragments (line, column, text) that may contain links.
+    """
+    for number, line in enumerate(fd, start=1):
+        if "http" in line:
+            yield number, 1, line
+
+
+# Markdown and reStructuredText links (inline, autolinks, targets) are
+# plain text, so they are scanned by line like any other text file
+extract_markdown = extract_text
+extract_rst = extract_text
+
+
+class LinkParser(HTMLParser):
+    """
+    A streaming html parser that collects attribute values that can hold
+    a link, along with visible text. Script and style blocks are skipped.
+    Attribute values are positioned where the value starts in the tag.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.fragments = []  # type: List[Fragment]
+        self.skip = 0
+
+    def add_fragment(self, text: str, prefix: str = ""):
+        """
+        Add text found at the parser's position, after a prefix of raw text
+        (e.g., the start of a tag before an attribute value).
+        """
+        line, offset = self.getpos()
+        newlines = prefix.count("\n")
+        if newlines:
+            line += newlines
+            offset = len(prefix) - prefix.rfind("\n") - 1
+        else:
+            offset += len(prefix)
+        self.fragments.append((line, offset + 1, text))
+
+    def value_offsets(self, text: str) -> List[int]:
+        """
+        Find where the value of each attribute starts in the raw text of a
+        tag, in the order the parser gives the attributes.
+        """
+        match = TAG_NAME.match(text)
+        position = match.end() if match else len(text)
+        offsets = []
+        match = TAG_ATTRIBUTE.match(text, position)
+        while match:
+            value = match.group(3)
+            if value is None:
+                offsets.append(match.end(1))
+            else:
+                offsets.append(match.start(3) + int(value[:1] in ["'", '"']))
+            match = TAG_ATTRIBUTE.match(text, match.end())
+        return offsets
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ["script", "style"]:
+            self.skip += 1
+        self.handle_startendtag(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        offsets = None
+        for index, (name, value) in enumerate(attrs):
+            if name in HTML_LINK_ATTRIBUTES and value and "http" in value:
+                text = self.get_starttag_text() or ""
+                if offsets is None:
+                    offsets = self.value_offsets(text)
+                offset = offsets[index] if index < len(offsets) else 0
+                self.add_fragment(value, text[:offset])
+
+    def handle_endtag(self, tag):
+        if tag in ["script", "style"] and self.skip:
+            self.skip -= 1
+
+    def handle_data(self, data):
+        if not self.skip and "http" in data:
+            self.add_fragment(data)
+
+
+def extract_html(fd: TextIO) -> Iterator[Fragment]:
+    """
+    Feed an html file to a parser in chunks, yielding link attributes
+    (href, src, etc.) and visible text as they are found. The parser hands
+    over text at the end of each chunk, so the text after the last tag of
+    a chunk is held for the next one (a url in it would be cut in two).
+
+    Args:
+        - fd (TextIO) : an open text file.
+
+    Returns:
+        (iterator) of fragments (line, column, text) that may contain links.
+    """
+    parser = LinkParser()
+    held = []  # type: List[str]
+    while True:
+        chunk = fd.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        end = chunk.rfind("<")
+        if end < 0:
+            held.append(chunk)
+            continue
+        parser.feed("".join(held) + chunk[:end])
+        held = [chunk[end:]]
+        yield from parser.fragments
+        parser.fragments = []
+    parser.feed("".join(held))
+    parser.close()
+    yield from parser.fragments
+
+
+def extract_notebook_lines(fd: TextIO) -> Iterator[Fragment]:
+    """
+    Scan lines of a notebook's raw json (e.g., lines added in a diff, which
+    can't be loaded as a notebook), yielding a line that holds a json string
+    (a line of a cell's source) as the text of the string, so its urls are
+    unescaped as extract_notebook would find them.
+
+    Args:
+        - fd (TextIO) : an open text file.
+
+    Returns:
+        (iterator) of fragments (line, column, text) that may contain links.
+    """
+    for number, line in enumerate(fd, start=1):
+        if "http" not in line:
+            continue
+        try:
+            text = json.loads(line.strip().rstrip(","))
+        except ValueError:
+            text = None
+        yield number, 1, text if isinstance(text, str) else line
+
+
+def get_notebook_sources(notebook: Any) -> Optional[List[List[str]]]:
+    """
+    Get the source lines of each markdown, code and raw cell of a loaded
+    notebook, or None if it isn't laid out like a notebook (e.g., the json
+    is a list, or a cell's source is a number).
+
+    Args:
+        - notebook (any) : the loaded json of the notebook.
+
+    Returns:
+        (list) of the lines of each cell, or None.
+    """
+    if not isinstance(notebook, dict):
+        return None
+
+    # nbformat 4 has top level cells, nbformat 3 has worksheets
+    cells = notebook.get("cells", [])
+    worksheets = notebook.get("worksheets", [])
+    if not isinstance(cells, list) or not isinstance(worksheets, list):
+        return None
+    cells = list(cells)
+    for worksheet in worksheets:
+        if not isinstance(worksheet, dict):
+            return None
+        if not isinstance(worksheet.get("cells", []), list):
+            return None
+        cells += worksheet.get("cells", [])
+
+    sources = []
+    for cell in cells:
+        if not isinstance(cell, dict):
+            return None
+        if cell.get("cell_type") not in ["markdown", "code", "raw"]:
+            continue
+        source = cell.get("source", cell.get("input", []))
+        if isinstance(source, str):
+            source = source.splitlines()
+        if not isinstance(source, list):
+            return None
+        if not all(isinstance(line, str) for line in source):
+            return None
+        sources.append(source)
+    return sources
+
+
+def extract_notebook(fd: TextIO) -> Iterator[Fragment]:
+    """
+    Yield the markdown and source cells of a Jupyter notebook, skipping
+    outputs (which often hold large base64 images). If the notebook cannot
+    be loaded, or isn't laid out like a notebook, fall back to scanning the
+    raw text. The sources are parsed out of the json, so they have no line
+    or column in the file (and their urls have no locations).
+
+    Args:
+        - fd (TextIO) : an open text file.
+
+    Returns:
+        (iterator) of fragments (line, column, text) that may contain links.
+    """
+    try:
+        sources = get_notebook_sources(json.load(fd))
+    except ValueError:
+        sources = None
+    if sources is None:
+        fd.seek(0)
+        yield from extract_text(fd)
+        return
+
+    for source in sources:
+        for line in source:
+            if "http" in line:
+                yield 0, 0, line
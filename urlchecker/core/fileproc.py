@@ -7,12 +7,148 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 
 """
 
+import codecs
 import fnmatch
+import functools
+import io
+import itertools
 import os
+import queue
 import re
-from typing import Optional, List
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    List,
+    Pattern,
+    TextIO,
+    Tuple,
+)
+
+from urlchecker.core import extractors, urlmarker
+
+# An extractor takes an open file and yields text fragments that can hold links
+Extractor = Callable[[TextIO], Iterator[extractors.Fragment]]
+
+# An occurrence of a link is the index of the url, a line and column
+Occurrence = Tuple[int, int, int]
+
+# Extractors keyed by file extension, the default (text) is the fallback
+EXTRACTORS = {
+    ".md": extractors.extract_markdown,
+    ".markdown": extractors.extract_markdown,
+    ".rst": extractors.extract_rst,
+    ".html": extractors.extract_html,
+    ".htm": extractors.extract_html,
+    ".ipynb": extractors.extract_notebook,
+}  # type: Dict[str, Extractor]
+
+# Directories that never hold files to check, skipped when walking
+PRUNE_DIRECTORIES = {".git", "node_modules"}
+
+# Threads reading directories in a parallel walk, by default
+TRAVERSAL_WORKERS = int(os.environ.get("URLCHECKER_TRAVERSAL_WORKERS", 16))
+
+# Bytes read from the start of a file to detect binary content and encoding
+SNIFF_SIZE = 8192
+
+# Files larger than this (in bytes) are skipped, 0 disables the limit
+MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# Byte order marks, checked longest first (utf-32 starts with a utf-16 mark)
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Regular expressions are compiled once on import
+URL_REGEX = re.compile(urlmarker.URL_REGEX)
+FINAL_REGEX = re.compile(urlmarker.FINAL_REGEX)
+TEMPLATE_REGEX = re.compile("(\\{[a-z0-9.]*})")
+
+
+def get_file_extension(file_path: str) -> str:
+    """
+    Get the extension of a file, as used to match file types and extractors.
 
-from urlchecker.core import urlmarker
+    Args:
+        - file_path (str) : path to file.
+
+    Returns:
+        (str) the extension, including the leading period.
+    """
+    return "." + file_path.split(".")[-1]
+
+
+def register_extractor(extension: str, extractor: Extractor):
+    """
+    Register an extractor for a file extension, replacing any existing one.
+
+    Args:
+        - extension      (str) : the file extension, including the period (e.g., .md)
+        - extractor (function) : takes an open file and yields text fragments.
+    """
+    EXTRACTORS[extension] = extractor
+
+
+def get_extractor(file_path: str) -> Extractor:
+    """
+    Get the extractor for a file based on its extension, falling back
+    to scanning all text with the url regular expression.
+
+    Args:
+        - file_path (str) : path to file.
+
+    Returns:
+        (function) extractor to yield text fragments from an open file.
+    """
+    return EXTRACTORS.get(
+        get_file_extension(file_path).lower(), extractors.extract_text
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def compile_file_types(file_types: Tuple[str, ...]) -> Optional[Pattern]:
+    """
+    Compile file type patterns (e.g., *.html) into a single regular
+    expression, once for each set of file types.
+
+    Args:
+        - file_types (tuple) : file extensions or patterns.
+
+    Returns:
+        (re.Pattern) the compiled patterns, or None if empty.
+    """
+    if not file_types:
+        return None
+    return re.compile(
+        "|".join(fnmatch.translate(os.path.normcase(x)) for x in file_types)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def compile_patterns(patterns: Tuple[str, ...]) -> Optional[Pattern]:
+    """
+    Compile include or exclude patterns into an OR regular expression,
+    once for each set of patterns.
+
+    Args:
+        - patterns (tuple) : regular expressions.
+
+    Returns:
+        (re.Pattern) the compiled patterns, or None if empty.
+    """
+    if not patterns:
+        return None
+    return re.compile("(%s)" % "|".join(patterns))
 
 
 def check_file_type(file_path: str, file_types: List[str]) -> bool:
@@ -29,16 +165,7 @@ def check_file_type(file_path: str, file_types: List[str]) -> bool:
     Returns:
         (bool) true if file type is supported else false.
     """
-    ftype = "." + file_path.split(".")[-1]
-    if ftype in file_types:
-        return True
-
-    # The user can also provide a regular expression
-    if any(fnmatch.fnmatch(file_path, x) for x in file_types):
-        return True
-
-    # default return
-    return False
+    return FileMatcher(file_types).check_file_type(file_path)
 
 
 def include_file(
@@ -58,29 +185,79 @@ def include_file(
     Returns:
         (bool) boolean indicating if the URL should be excluded (not tested).
     """
-    include_patterns = include_patterns or []
-    exclude_patterns = exclude_patterns or []
-
-    # No excluded patterns, all files are included
-    if not exclude_patterns and not include_patterns:
-        return True
+    return FileMatcher([], exclude_patterns, include_patterns).include_file(file_path)
 
-    # Create a regular expression for each
-    exclude_regexp = "(%s)" % "|".join(exclude_patterns)
-    include_regexp = "(%s)" % "|".join(include_patterns)
 
-    # Return False (don't include) if excluded
-    if not include_patterns:
-        return not bool(re.search(exclude_regexp, file_path))
+class FileMatcher:
+    """
+    A FileMatcher holds file types and include and exclude patterns compiled
+    once, to decide which files to check and which directories to skip.
+    """
 
-    # We have an include_patterns only
-    elif not exclude_patterns:
-        return bool(re.search(include_regexp, file_path))
+    def __init__(
+        self,
+        file_types: List[str],
+        exclude_files: Optional[List[str]] = None,
+        include_patterns: Optional[List[str]] = None,
+        prune_directories: Optional[Iterable[str]] = None,
+    ):
+        self.extensions = set(file_types)
+        self.file_types = compile_file_types(tuple(file_types))
+        self.exclude = compile_patterns(tuple(exclude_files or []))
+        self.include = compile_patterns(tuple(include_patterns or []))
+        self.prune_directories = set(
+            PRUNE_DIRECTORIES if prune_directories is None else prune_directories
+        )
+
+        # Excluded directories are pruned, if the pattern can't depend on what follows
+        self.exclude_directories = compile_patterns(
+            tuple(
+                x
+                for x in exclude_files or []
+                if not any(anchor in x for anchor in ["$", "\\Z", "(?=", "(?!"])
+            )
+        )
+
+    def check_file_type(self, file_name: str) -> bool:
+        """
+        Check if a file name matches an extension verbatim, or a pattern.
+        """
+        if get_file_extension(file_name) in self.extensions:
+            return True
+        if self.file_types is None:
+            return False
+        return bool(self.file_types.match(os.path.normcase(file_name)))
+
+    def include_file(self, file_path: str) -> bool:
+        """
+        Check a file path for inclusion. If both include and exclude patterns
+        are defined, exclude takes preference.
+        """
+        if self.exclude and self.exclude.search(file_path):
+            return False
+        if self.include:
+            return bool(self.include.search(file_path))
+        return True
 
-    # If both defined, excluded takes preference
-    return bool(re.search(include_regexp, file_path)) and not bool(
-        re.search(exclude_regexp, file_path)
-    )
+    def include_directory(self, name: str, path: str) -> bool:
+        """
+        Check if we should descend into a directory. A directory is pruned if it
+        is one we never check (e.g., .git) or if an exclude pattern matches it,
+        since it would then match every file under it too.
+        """
+        if name in self.prune_directories:
+            return False
+        if self.exclude_directories is None:
+            return True
+        return not self.exclude_directories.search(os.path.join(path, ""))
+
+    def match(self, file_path: str) -> bool:
+        """
+        Check if a file should be checked, by type (of the name) and patterns.
+        """
+        return self.check_file_type(os.path.basename(file_path)) and self.include_file(
+            file_path
+        )
 
 
 def get_file_paths(
@@ -88,6 +265,8 @@ def get_file_paths(
     file_types: List[str],
     exclude_files: Optional[List[str]] = None,
     include_patterns: Optional[List[str]] = None,
+    prune_directories: Optional[Iterable[str]] = None,
+    workers: int = 1,
 ) -> List[str]:
     """
     Get path to all files under a give directory and its subfolders.
@@ -97,63 +276,531 @@ def get_file_paths(
         - file_types         (list) : list of file extensions to accept.
         - include_patterns   (list) : list of files and patterns to include.
         - exclude_files      (list) : list of files or patterns to exclude
+        - prune_directories  (list) : directory names to skip (defaults to PRUNE_DIRECTORIES)
+        - workers             (int) : threads reading directories (1 walks in serial)
 
     Returns:
         (list) list of file paths.
     """
-    exclude_files = exclude_files or []
-    include_patterns = include_patterns or []
+    matcher = FileMatcher(
+        file_types, exclude_files, include_patterns, prune_directories
+    )
+    return list(iter_file_paths(base_path, matcher, workers=workers))
+
+
+def scan_directory(root: str, matcher: FileMatcher) -> Tuple[List[str], List[str]]:
+    """
+    Read one directory with os.scandir, returning matching files and the
+    directories to descend into. The type of each entry comes from the
+    directory listing (no extra stat calls), symbolic links to directories
+    are not followed, and a directory that cannot be read is empty.
+
+    Args:
+        - root              (str) : the directory to read.
+        - matcher   (FileMatcher) : compiled file types and patterns.
+
+    Returns:
+        (tuple) of matching file paths and directory paths, in listing order.
+    """
+    files = []  # type: List[str]
+    directories = []  # type: List[str]
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if matcher.include_directory(entry.name, entry.path):
+                            directories.append(entry.path)
+                    elif (
+                        matcher.check_file_type(entry.name)
+                        and matcher.include_file(entry.path)
+                        and entry.is_file()
+                    ):
+                        files.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, directories
+
+
+def iter_file_paths(
+    base_path: str, matcher: FileMatcher, workers: int = 1
+) -> Iterator[str]:
+    """
+    Walk a directory with os.scandir, yielding matching files as they are
+    found. Directories are pruned before we descend into them. With more
+    than one worker, directories are read concurrently (see
+    iter_file_paths_parallel) and files come out in no particular order.
+
+    Args:
+        - base_path          (str) : base path.
+        - matcher    (FileMatcher) : compiled file types and patterns.
+        - workers            (int) : threads reading directories (1 walks in serial)
+
+    Returns:
+        (iterator) of file paths.
+    """
+    if workers > 1:
+        yield from iter_file_paths_parallel(base_path, matcher, workers)
+        return
+
+    stack = [base_path]
+    while stack:
+        files, directories = scan_directory(stack.pop(), matcher)
+        yield from files
+
+        # Visit directories in listing order
+        stack.extend(reversed(directories))
+
+
+def iter_file_paths_parallel(
+    base_path: str, matcher: FileMatcher, workers: int = TRAVERSAL_WORKERS
+) -> Iterator[str]:
+    """
+    Walk a directory with a bounded pool of threads, each reading one
+    directory at a time and submitting the directories it finds. Listing a
+    directory releases the GIL, so on network filesystems (or very large
+    trees) many directories are read at once. Matching files are streamed
+    back through a queue as each directory is read, so a consumer can start
+    working before the walk is done.
+
+    Args:
+        - base_path          (str) : base path.
+        - matcher    (FileMatcher) : compiled file types and patterns.
+        - workers            (int) : the number of threads reading directories.
+
+    Returns:
+        (iterator) of file paths, in no particular order.
+    """
+    found = queue.Queue()  # type: queue.Queue
+    lock = threading.Lock()
+    pending = [1]
+    stopped = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def scan(root: str):
+        files = []  # type: List[str]
+        try:
+            if stopped.is_set():
+                return
+            files, directories = scan_directory(root, matcher)
+            for directory in directories:
+                with lock:
+                    pending[0] += 1
+                try:
+                    executor.submit(scan, directory)
+                except RuntimeError:
+                    # The consumer stopped early and the pool is shut down
+                    with lock:
+                        pending[0] -= 1
+        finally:
+            found.put(files)
+            with lock:
+                pending[0] -= 1
+                done = pending[0] == 0
+            if done:
+                found.put(None)
+
+    executor.submit(scan, base_path)
+    try:
+        while True:
+            files = found.get()
+            if files is None:
+                break
+            yield from files
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False)
+
+
+def filter_file_paths(
+    file_paths: Iterable[str],
+    file_types: List[str],
+    exclude_files: Optional[List[str]] = None,
+    include_patterns: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Filter an existing listing of files (e.g., from git) by file type and
+    include and exclude patterns, as is done when walking a directory.
+
+    Args:
+        - file_paths     (iterable) : file paths to filter.
+        - file_types         (list) : list of file extensions to accept.
+        - include_patterns   (list) : list of files and patterns to include.
+        - exclude_files      (list) : list of files or patterns to exclude
+
+    Returns:
+        (list) list of file paths.
+    """
+    matcher = FileMatcher(file_types, exclude_files, include_patterns)
+    return [file_path for file_path in file_paths if matcher.match(file_path)]
+
+
+def detect_encoding(head: bytes) -> str:
+    """
+    Detect the encoding of a file from its first bytes. A byte order mark
+    wins, then utf-8 if the bytes decode, and latin-1 as the fallback
+    (it can decode any byte).
+
+    Args:
+        - head (bytes) : the first bytes of a file.
+
+    Returns:
+        (str) the name of the encoding.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    # The sample can end in the middle of a character, so don't finalize
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def sniff_file(
+    file_path: str, max_file_size: Optional[int] = MAX_FILE_SIZE
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Cheaply decide if a file should have links extracted, reading only the
+    first few KB. A file is skipped if it is too large or binary (has a NUL
+    byte without a utf-16/32 byte order mark).
 
-    # init paths
-    file_paths = []
+    Args:
+        - file_path     (str) : path to file.
+        - max_file_size (int) : maximum size in bytes (None or 0 to disable).
 
-    # walk folders and colect file paths
-    for root, directory, files in os.walk(base_path):
-        file_paths += [
-            os.path.join(root, file)
-            for file in files
-            if os.path.isfile(os.path.join(root, file))
-            and check_file_type(file, file_types)
-            and include_file(os.path.join(root, file), exclude_files, include_patterns)
-        ]
-    return file_paths
+    Returns:
+        (tuple) the encoding and None, or None and a reason to skip the file.
+    """
+    try:
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as fd:
+            head = fd.read(SNIFF_SIZE)
+    except OSError as e:
+        return None, "cannot be read (%s)" % e.strerror
 
+    return sniff_content(head, size, max_file_size)
 
-def collect_links_from_file(file_path: str, unique: bool = True) -> List[str]:
+
+def sniff_content(
+    head: bytes, size: int, max_file_size: Optional[int] = MAX_FILE_SIZE
+) -> Tuple[Optional[str], Optional[str]]:
     """
-    Collect all links in a file.
+    Decide if content should have links extracted from its size and first
+    bytes (e.g., for a file read from git instead of disk), as sniff_file.
+
+    Args:
+        - head        (bytes) : the first bytes (up to SNIFF_SIZE) of the content.
+        - size          (int) : the full size of the content in bytes.
+        - max_file_size (int) : maximum size in bytes (None or 0 to disable).
+
+    Returns:
+        (tuple) the encoding and None, or None and a reason to skip the content.
+    """
+    if max_file_size and size > max_file_size:
+        return None, "larger than %s bytes" % max_file_size
+
+    encoding = detect_encoding(head[:SNIFF_SIZE])
+    if b"\x00" in head[:SNIFF_SIZE] and not encoding.startswith(("utf-16", "utf-32")):
+        return None, "binary"
+    return encoding, None
+
+
+def collect_links_from_file(
+    file_path: str, unique: bool = True, encoding: str = "utf-8"
+) -> List[str]:
+    """
+    Collect all links in a file. The extractor for the file type decides
+    which parts of the file are scanned with the url regular expression.
+    Characters that cannot be decoded are replaced instead of raising an error.
 
     Args:
         - file_path  (str) : path to file.
         - unique    (bool) : specify whether to filter out duplicate links.
+        - encoding   (str) : the file encoding (see sniff_file to detect it)
 
     Returns:
         (list) list of links/ urls in a file.
     """
-    # read file content
-    with open(file_path, "r") as file:
-        content = file.read()
+    extractor = get_extractor(file_path)
+    with open(file_path, "r", encoding=encoding, errors="replace") as file:
+        return collect_links(extractor(file), unique=unique)
+
+
+def collect_added_links(file_path: str, lines: List[str]) -> List[str]:
+    """
+    Collect the links in lines added to a file (e.g., from a git diff), as
+    the file's extractor finds them (e.g., with html entities unescaped) so
+    they match the urls extracted from the whole file. The lines alone may
+    not parse as the file would (e.g., part of a notebook's json), so links
+    found by scanning them as text are included too.
 
-    # get and filter urls
-    urls = re.findall(urlmarker.URL_REGEX, content)
-    urls = [url.strip() for url in urls if url.strip().startswith("http")]
-    urls = [url.strip("\\n") if url.endswith("\\n") else url for url in urls]
+    Args:
+        - file_path (str) : path (or name) of the file, to choose the extractor.
+        - lines    (list) : the added lines.
 
-    # filter urls including {}
-    urls = [url for url in urls if not re.search("(\\{[a-z0-9.]*})", url)]
+    Returns:
+        (list) the unique links in the added lines.
+    """
+    extractor = get_extractor(file_path)
+    if extractor is extractors.extract_notebook:
+        extractor = extractors.extract_notebook_lines
+    fragments = list(enumerate(lines, start=1))
+    links = collect_links((number, 1, line) for number, line in fragments)
+    if extractor is not extractors.extract_text:
+        links += collect_links(extractor(io.StringIO("\n".join(lines) + "\n")))
+    return list(dict.fromkeys(links))
+
+
+def collect_link_occurrences(
+    file_path: str, encoding: str = "utf-8"
+) -> Tuple[List[str], List[Occurrence]]:
+    """
+    Collect the unique links in a file, along with a compact record of
+    every occurrence: the index of the url in the unique list, and the line
+    and column (both starting at 1) where it was found.
 
-    # Final cleaning of URLS
-    final = []
-    for url in urls:
-        match = re.match(urlmarker.FINAL_REGEX, url)
-        if match:
-            final.append(url[match.start() : match.end()])
+    Args:
+        - file_path  (str) : path to file.
+        - encoding   (str) : the file encoding (see sniff_file to detect it)
+
+    Returns:
+        (tuple) list of unique urls, and list of occurrences (url index, line, column).
+    """
+    extractor = get_extractor(file_path)
+    with open(file_path, "r", encoding=encoding, errors="replace") as file:
+        return collect_occurrences(extractor(file))
+
+
+def collect_link_occurrences_from_content(
+    file_path: str, content: bytes, encoding: str = "utf-8"
+) -> Tuple[List[str], List[Occurrence]]:
+    """
+    Collect the unique links and their occurrences from the content of a
+    file that is not on disk (e.g., a blob read from git). The file path
+    only chooses the extractor. Newlines are translated as when reading a
+    file, so lines and columns are the same.
+
+    Args:
+        - file_path  (str) : path (or name) of the file.
+        - content  (bytes) : the content of the file.
+        - encoding   (str) : the content encoding (see sniff_content to detect it)
+
+    Returns:
+        (tuple) list of unique urls, and list of occurrences (url index, line, column).
+    """
+    text = io.StringIO(content.decode(encoding, errors="replace"), newline=None)
+    return collect_occurrences(get_extractor(file_path)(text))
+
+
+def collect_occurrences(
+    fragments: Iterable[extractors.Fragment],
+) -> Tuple[List[str], List[Occurrence]]:
+    """
+    Collect the unique links in text fragments, and every occurrence (links
+    without a position, see iter_links, have no occurrences).
+
+    Args:
+        - fragments (iterable) : fragments (line, column, text) to search.
+
+    Returns:
+        (tuple) list of unique urls, and list of occurrences (url index, line, column).
+    """
+    ids = {}  # type: Dict[str, int]
+    occurrences = []  # type: List[Occurrence]
+    for url, line, column in iter_links(fragments):
+        index = ids.setdefault(url, len(ids))
+        if line:
+            occurrences.append((index, line, column))
+    return list(ids), occurrences
+
+
+def pack_occurrences(occurrences: Iterable[Occurrence]) -> array:
+    """
+    Pack occurrences into a flat array of unsigned ints (16 bit if they fit),
+    three for each (url index, line, column).
+
+    Args:
+        - occurrences (list) : the (url index, line, column) of each occurrence.
+
+    Returns:
+        (array) the flat array.
+    """
+    occurrences = list(occurrences)
+    try:
+        return array("H", itertools.chain.from_iterable(occurrences))
+    except OverflowError:
+        return array("I", itertools.chain.from_iterable(occurrences))
+
+
+def unpack_occurrences(flat: array) -> List[Occurrence]:
+    """
+    Unpack occurrences packed by pack_occurrences.
+
+    Args:
+        - flat (array) : the flat array.
+
+    Returns:
+        (list) the (url index, line, column) of each occurrence.
+    """
+    triples = [iter(flat)] * 3
+    return list(zip(*triples))
+
+
+def pack_links(
+    urls: List[str], occurrences: Iterable[Occurrence]
+) -> Tuple[str, bytes, str, bytes]:
+    """
+    Pack urls and their occurrences into a compact record to send between
+    processes: the urls as one string with the length of each (so any
+    character, even a NUL, can be in a url) and the occurrences as a flat
+    array (see pack_occurrences), which pickle much faster than lists of
+    tuples.
+
+    Args:
+        - urls        (list) : the unique urls.
+        - occurrences (list) : the (url index, line, column) of each occurrence.
+
+    Returns:
+        (tuple) the joined urls, their lengths, array type code and packed occurrences.
+    """
+    flat = pack_occurrences(occurrences)
+    lengths = array("I", [len(url) for url in urls])
+    return "".join(urls), lengths.tobytes(), flat.typecode, flat.tobytes()
+
+
+def unpack_links(
+    packed: Tuple[str, bytes, str, bytes]
+) -> Tuple[List[str], List[Occurrence]]:
+    """
+    Unpack urls and occurrences packed by pack_links.
+
+    Args:
+        - packed (tuple) : the joined urls, their lengths, array type code and occurrences.
+
+    Returns:
+        (tuple) the list of urls and list of occurrences.
+    """
+    joined, packed_lengths, typecode, packed_occurrences = packed
+    lengths = array("I")
+    lengths.frombytes(packed_lengths)
+    urls = []
+    start = 0
+    for length in lengths:
+        urls.append(joined[start : start + length])
+        start += length
+    assert start == len(joined), "Packed urls don't match their lengths"
+
+    flat = array(typecode)
+    flat.frombytes(packed_occurrences)
+    occurrences = unpack_occurrences(flat)
+    assert all(
+        index < len(urls) for index, _, _ in occurrences
+    ), "Packed occurrences refer to missing urls"
+    return urls, occurrences
+
+
+def index_occurrences(
+    urls: List[str], occurrences: Iterable[Occurrence]
+) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Index occurrences (from collect_link_occurrences) by url.
+
+    Args:
+        - urls         (list) : list of unique urls.
+        - occurrences  (list) : list of occurrences (url index, line, column).
+
+    Returns:
+        (dict) a list of (line, column) for each url.
+    """
+    locations = {}  # type: Dict[str, List[Tuple[int, int]]]
+    for index, line, column in occurrences:
+        locations.setdefault(urls[index], []).append((line, column))
+    return locations
+
+
+def collect_links(
+    fragments: Iterable[extractors.Fragment], unique: bool = True
+) -> List[str]:
+    """
+    Collect all links in text fragments (e.g., from an extractor).
+
+    Args:
+        - fragments (iterable) : fragments (line, column, text) to search.
+        - unique        (bool) : specify whether to filter out duplicate links.
+
+    Returns:
+        (list) list of links/ urls in the text.
+    """
+    urls = [url for url, _, _ in iter_links(fragments)]
 
     # Do we only want unique links?
     if unique:
-        return list(set(final))
+        return list(dict.fromkeys(urls))
+    return urls
+
 
-    return final
+def iter_links(
+    fragments: Iterable[extractors.Fragment],
+) -> Iterator[Tuple[str, int, int]]:
+    """
+    Find links in text fragments with the url regular expression, and clean
+    them. The position of each link is computed from the match offset as we
+    go, so the text is not scanned a second time. Links in fragments without
+    a position (line 0) have a line and column of 0.
+
+    Args:
+        - fragments (iterable) : fragments (line, column, text) to search.
+
+    Returns:
+        (iterator) of links, each with a line and column.
+    """
+    for line, column, text in fragments:
+
+        # Newlines before the last link, and where its line starts, so each
+        # link only counts the text since the one before
+        counted = newlines = 0
+        line_start = -1
+        for match in URL_REGEX.finditer(text):
+            url = match.group(1)
+            start = match.start(1)
+
+            # get and filter urls
+            stripped = url.strip()
+            if not stripped.startswith("http"):
+                continue
+            start += len(url) - len(url.lstrip())
+            url = stripped
+            if url.endswith("\\n"):
+                url = url.strip("\\n")
+
+            # filter urls including {}
+            if TEMPLATE_REGEX.search(url):
+                continue
+
+            # Final cleaning of URLS
+            final = FINAL_REGEX.match(url)
+            if not final:
+                continue
+            start += final.start()
+            url = url[final.start() : final.end()]
+
+            if not line:
+                yield url, 0, 0
+                continue
+
+            # A fragment can span lines (e.g., html text)
+            newlines += text.count("\n", counted, start)
+            line_start = max(line_start, text.rfind("\n", counted, start))
+            counted = start
+            if newlines:
+                yield url, line + newlines, start - line_start
+            else:
+                yield url, line, column + start
 
 
 def remove_empty(file_list: List[str]) -> List[str]:
@@ -0,0 +1,312 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import functools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from urlchecker.core.cache import ResultCache
+from urlchecker.core.exclude import ExcludeMatcher
+from urlchecker.core.urlproc import UrlCheckResult
+from urlchecker.logger import get_logger
+from urlchecker.version import __version__
+
+logger = get_logger()
+
+# Where urlchecker serve listens by default
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8711
+
+
+class SessionPool:
+    """
+    Sessions shared by check threads, one at a time, so connections (and
+    their TLS state) stay open between checks.
+    """
+
+    def __init__(self) -> None:
+        self.sessions = queue.LifoQueue()  # type: queue.LifoQueue
+
+    def get(self) -> requests.Session:
+        """
+        Get a free session, or a new one if they are all in use.
+        """
+        try:
+            return self.sessions.get_nowait()
+        except queue.Empty:
+            return requests.Session()
+
+    def put(self, session: requests.Session):
+        """
+        Return a session for another check to use.
+        """
+        self.sessions.put(session)
+
+
+class UrlCheckServer(ThreadingHTTPServer):
+    """
+    A local server that checks urls for urlchecker clients (see urlchecker
+    serve, and check --server). Imports, connections and results stay warm
+    between runs, and a url requested by many clients at once is checked once.
+    Results are kept for each set of check options (certificates, timeout and
+    retries), since a url can pass with one and fail with another.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        workers: int = 32,
+        max_age: Optional[float] = 300,
+        batch_size: int = 8,
+    ):
+        """
+        Args:
+            - host         (str) : the host to listen on.
+            - port         (int) : the port to listen on.
+            - workers      (int) : threads checking urls, shared by all clients.
+            - max_age    (float) : seconds to keep a result (None to keep them all).
+            - batch_size   (int) : the most urls for one thread to check at a time.
+        """
+        super().__init__((host, port), UrlCheckHandler)
+        self.max_age = max_age
+        self.result_caches = {}  # type: Dict[Tuple[bool, int, int], ResultCache]
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(workers)
+        self.sessions = SessionPool()
+        self.batch_size = batch_size
+        self.start_time = time.time()
+        self.requests = 0
+
+    def __str__(self) -> str:
+        return "UrlCheckServer:%s" % self.url
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return "http://%s:%s" % (str(host), port)
+
+    @property
+    def status(self) -> Dict[str, Any]:
+        """
+        The version, uptime and result cache counts of the server.
+        """
+        caches = list(self.result_caches.values())
+        return {
+            "version": __version__,
+            "uptime": time.time() - self.start_time,
+            "requests": self.requests,
+            "results": sum(len(cache.results) for cache in caches),
+            "hits": sum(cache.hits for cache in caches),
+            "misses": sum(cache.misses for cache in caches),
+        }
+
+    def get_result_cache(
+        self, no_check_certs: bool, timeout: int, retry_count: int
+    ) -> ResultCache:
+        """
+        Get the results for a set of check options, shared by the clients
+        that check with the same options.
+        """
+        options = (no_check_certs, timeout, retry_count)
+        with self.lock:
+            if options not in self.result_caches:
+                self.result_caches[options] = ResultCache(max_age=self.max_age)
+            return self.result_caches[options]
+
+    def check(
+        self,
+        urls: List[str],
+        exclude_urls: Optional[List[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        exclude_globs: Optional[List[str]] = None,
+        exclude_regexes: Optional[List[str]] = None,
+        retry_count: int = 2,
+        timeout: int = 5,
+        no_check_certs: bool = False,
+    ) -> Dict[str, List[str]]:
+        """
+        Check urls for a client, in batches across the server's threads.
+
+        Args:
+            - urls             (list) : the urls to check.
+            - exclude_urls     (list) : list of excluded urls.
+            - exclude_patterns (list) : list of excluded patterns for urls.
+            - exclude_globs    (list) : list of excluded glob patterns for urls.
+            - exclude_regexes  (list) : list of excluded regular expressions for urls.
+            - retry_count       (int) : number of retries on failed first check. Default=2.
+            - timeout           (int) : timeout to use when waiting on check feedback. Default=5.
+            - no_check_certs   (bool) : do not check certificates
+
+        Returns:
+            (dict) of "passed", "failed" and "excluded" urls.
+        """
+        self.requests += 1
+        matcher = get_matcher(
+            tuple(exclude_urls or []),
+            tuple(exclude_patterns or []),
+            tuple(exclude_globs or []),
+            tuple(exclude_regexes or []),
+        )
+        result_cache = self.get_result_cache(no_check_certs, timeout, retry_count)
+        urls = list(dict.fromkeys(urls))
+        futures = [
+            self.executor.submit(
+                self.check_batch,
+                urls[start : start + self.batch_size],
+                matcher,
+                result_cache,
+                retry_count=retry_count,
+                timeout=timeout,
+                no_check_certs=no_check_certs,
+            )
+            for start in range(0, len(urls), self.batch_size)
+        ]
+
+        result = {"passed": [], "failed": [], "excluded": []}  # type: Dict[str, List]
+        for future in futures:
+            for key, values in future.result().items():
+                result[key] += values
+        return result
+
+    def check_batch(
+        self,
+        urls: List[str],
+        matcher: ExcludeMatcher,
+        result_cache: ResultCache,
+        **kwargs
+    ) -> Dict[str, List[str]]:
+        """
+        Check a batch of urls with a session from the pool, sharing results
+        with the other checks that use the same options.
+        """
+        session = self.sessions.get()
+        try:
+            checker = UrlCheckResult(
+                urls=urls,
+                print_all=False,
+                exclude_matcher=matcher,
+                result_cache=result_cache,
+                session=session,
+            )
+            checker.check_urls(**kwargs)
+        finally:
+            self.sessions.put(session)
+        return {
+            "passed": checker.passed,
+            "failed": checker.failed,
+            "excluded": checker.excluded,
+        }
+
+
+@functools.lru_cache(maxsize=32)
+def get_matcher(
+    exclude_urls: Tuple[str, ...],
+    exclude_patterns: Tuple[str, ...],
+    exclude_globs: Tuple[str, ...],
+    exclude_regexes: Tuple[str, ...],
+) -> ExcludeMatcher:
+    """
+    Get a compiled matcher for a set of exclusions, reused by clients that
+    send the same exclusions.
+    """
+    return ExcludeMatcher(
+        list(exclude_urls),
+        list(exclude_patterns),
+        list(exclude_globs),
+        list(exclude_regexes),
+    )
+
+
+class UrlCheckHandler(BaseHTTPRequestHandler):
+    """
+    Handle GET /status and POST /check (a json object with urls and the
+    arguments of UrlCheckServer.check) for a UrlCheckServer.
+    """
+
+    server: UrlCheckServer
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self.send_json(404, {"error": "Unknown path %s" % self.path})
+        self.send_json(200, self.server.status)
+
+    def do_POST(self):
+        if self.path != "/check":
+            return self.send_json(404, {"error": "Unknown path %s" % self.path})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            result = self.server.check(**body)
+        except (ValueError, TypeError) as e:
+            return self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.error("Error checking urls: %s" % e)
+            return self.send_json(500, {"error": "%s: %s" % (type(e).__name__, e)})
+        self.send_json(200, result)
+
+    def send_json(self, code: int, data: Dict[str, Any]):
+        """
+        Send a json response.
+        """
+        content = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+def get_status(server: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the status of a urlchecker server, or None if it can't be reached.
+
+    Args:
+        - server (str) : the server url (e.g., http://127.0.0.1:8711).
+    """
+    try:
+        response = requests.get(server.rstrip("/") + "/status", timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def request_check(server: str, urls: List[str], **kwargs) -> Dict[str, List[str]]:
+    """
+    Ask a urlchecker server to check urls, waiting for the result.
+
+    Args:
+        - server (str) : the server url (e.g., http://127.0.0.1:8711).
+        - urls  (list) : the urls to check.
+        - kwargs (dict) : other arguments for UrlCheckServer.check (e.g., timeout).
+
+    Returns:
+        (dict) of "passed", "failed" and "excluded" urls.
+    """
+    response = requests.post(
+        server.rstrip("/") + "/check", json=dict(kwargs, urls=urls), timeout=(5, None)
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,374 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+from urllib.parse import urlsplit
+
+from urlchecker.core import fileproc
+from urlchecker.version import __version__
+
+
+class ResultSink(ABC):
+    """
+    A ResultSink writes result rows (e.g., URL,RESULT,FILENAME) to a file as
+    each file's checks finish, flushing every few rows, so results written
+    so far survive an interrupted run and aren't all held until the end.
+    Subclasses write a format (see CsvSink, JsonlSink and SqliteSink).
+    """
+
+    # The file extensions for the format, the first is the default
+    extensions = []  # type: List[str]
+
+    # If the sink saves each attempt to check a url (see write_result)
+    record_attempts = False
+
+    def __init__(self, file_path: str, header: List[str], flush_every: int = 500):
+        """
+        Open the file to write to, exiting on error if the directory of the
+        file path doesn't exist.
+
+        Args:
+            - file_path   (str) : the file path to save to.
+            - header     (list) : the name of each column of a row.
+            - flush_every (int) : flush to disk after this many rows.
+        """
+        self.file_path = os.path.abspath(file_path)
+        dirname = os.path.dirname(self.file_path)
+        if not os.path.exists(dirname):
+            sys.exit(
+                "%s does not exist, cannot save %s there." % (dirname, self.file_path)
+            )
+        self.header = header
+        self.flush_every = flush_every
+        self.rows = 0
+        self.unflushed = 0
+        self.fd = None  # type: Optional[TextIO]
+        self.open()
+        self.start()
+
+    def __str__(self) -> str:
+        return "%s:%s" % (self.__class__.__name__, self.file_path)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """
+        Open the file to write to, replacing any previous results.
+        """
+        self.fd = open(self.file_path, mode="w")
+
+    def start(self):
+        """
+        Write anything that comes before the rows (e.g., a header).
+        """
+        pass
+
+    @abstractmethod
+    def write_row(self, row: List[Any]):
+        """
+        Write a single row, implemented by each format.
+        """
+
+    def write(self, rows: Iterable[List[Any]]):
+        """
+        Write rows (e.g., for a file that was checked), and flush if enough
+        rows were written since the last flush.
+
+        Args:
+            - rows (iterable) : the rows to write, each a list matching the header.
+        """
+        for row in rows:
+            self.write_row(row)
+            self.rows += 1
+            self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def write_result(
+        self,
+        file_name: str,
+        result: Dict[str, Any],
+        rows: Iterable[List[Any]],
+        path: Optional[str] = None,
+    ):
+        """
+        Write the result of a checked file. Most formats write the rows,
+        others can use the result (e.g., for each attempt to check a url).
+
+        Args:
+            - file_name  (str) : the checked file (relative to path).
+            - result    (dict) : the result of check_task for the file.
+            - rows  (iterable) : the rows for the result, matching the header.
+            - path       (str) : the path the file was found under, if known.
+        """
+        self.write(rows)
+
+    def flush(self):
+        """
+        Flush written rows to the file.
+        """
+        if self.fd:
+            self.fd.flush()
+        self.unflushed = 0
+
+    def close(self):
+        """
+        Flush and close the file.
+        """
+        if self.fd:
+            self.flush()
+            self.fd.close()
+            self.fd = None
+
+
+class CsvSink(ResultSink):
+    """
+    Write rows to a csv file, with the header first.
+    """
+
+    extensions = [".csv"]
+
+    def __init__(
+        self,
+        file_path: str,
+        header: List[str],
+        flush_every: int = 500,
+        sep: str = ",",
+    ):
+        self.sep = sep
+        super().__init__(file_path, header, flush_every)
+
+    def start(self):
+        self.writer = csv.writer(
+            self.fd, delimiter=self.sep, quotechar='"', quoting=csv.QUOTE_MINIMAL
+        )
+        self.writer.writerow(self.header)
+
+    def write_row(self, row: List[Any]):
+        self.writer.writerow(row)
+
+
+class JsonlSink(ResultSink):
+    """
+    Write rows to a json lines file, an object (keyed by the lowercase
+    header) on each line.
+    """
+
+    extensions = [".jsonl", ".ndjson"]
+
+    def start(self):
+        self.keys = [name.lower() for name in self.header]
+
+    def write_row(self, row: List[Any]):
+        assert self.fd is not None
+        self.fd.write(json.dumps(dict(zip(self.keys, row))) + "\n")
+
+
+class SqliteSink(ResultSink):
+    """
+    Write results to a SQLite database, adding a run each time so slow
+    hosts and flaky links can be queried across runs. Tables are:
+
+     - runs: the start and finish time (and version) of each run.
+     - urls: each url with its host.
+     - occurrences: the result of a url in a file, with the line and column.
+     - attempts: each request for a url, with the status, seconds, bytes,
+       redirect target, error class and if the web driver was used.
+    """
+
+    extensions = [".db", ".sqlite", ".sqlite3"]
+    record_attempts = True
+
+    schema = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        started REAL NOT NULL,
+        finished REAL,
+        version TEXT
+    );
+    CREATE TABLE IF NOT EXISTS urls (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        host TEXT
+    );
+    CREATE INDEX IF NOT EXISTS urls_host ON urls (host);
+    CREATE TABLE IF NOT EXISTS occurrences (
+        run_id INTEGER NOT NULL REFERENCES runs (id),
+        url_id INTEGER NOT NULL REFERENCES urls (id),
+        result TEXT NOT NULL,
+        path TEXT,
+        file TEXT NOT NULL,
+        line INTEGER,
+        column INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS occurrences_run ON occurrences (run_id, result);
+    CREATE INDEX IF NOT EXISTS occurrences_url ON occurrences (url_id);
+    CREATE TABLE IF NOT EXISTS attempts (
+        run_id INTEGER NOT NULL REFERENCES runs (id),
+        url_id INTEGER NOT NULL REFERENCES urls (id),
+        attempt INTEGER NOT NULL,
+        status INTEGER,
+        elapsed REAL,
+        bytes INTEGER,
+        redirect TEXT,
+        error TEXT,
+        driver INTEGER,
+        passed INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS attempts_run ON attempts (run_id);
+    CREATE INDEX IF NOT EXISTS attempts_url ON attempts (url_id);
+    """
+
+    def open(self) -> None:
+        db = sqlite3.connect(self.file_path)
+        db.executescript(self.schema)
+        self.db = db  # type: Optional[sqlite3.Connection]
+        self.url_ids = {}  # type: Dict[str, int]
+
+    def start(self):
+        assert self.db is not None
+
+        # Rows are in the order of the result header, with the path first
+        # for results of many paths (see BatchChecker)
+        self.path_first = bool(self.header) and self.header[0].upper() == "PATH"
+        self.run_id = self.db.execute(
+            "INSERT INTO runs (started, version) VALUES (?, ?)",
+            (time.time(), __version__),
+        ).lastrowid
+
+    def get_url_id(self, url: str) -> int:
+        """
+        Get the id of a url, adding it the first time it is seen.
+        """
+        if url not in self.url_ids:
+            assert self.db is not None
+            self.db.execute(
+                "INSERT OR IGNORE INTO urls (url, host) VALUES (?, ?)",
+                (url, urlsplit(url).hostname),
+            )
+            self.url_ids[url] = self.db.execute(
+                "SELECT id FROM urls WHERE url = ?", (url,)
+            ).fetchone()[0]
+        return self.url_ids[url]
+
+    def write_row(self, row: List[Any]):
+        """
+        Write a row (url, result, file name and optionally the line and
+        column) as an occurrence, without attempts (see write_result).
+        """
+        assert self.db is not None
+        values = list(row)
+        path = values.pop(0) if self.path_first else None
+        url, status, file_name = values[:3]
+        line, column = (values[3:5] + [None, None])[:2]
+        self.db.execute(
+            "INSERT INTO occurrences VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.run_id,
+                self.get_url_id(url),
+                status,
+                path,
+                file_name,
+                line or None,
+                column or None,
+            ),
+        )
+
+    def write_result(
+        self,
+        file_name: str,
+        result: Dict[str, Any],
+        rows: Iterable[List[Any]],
+        path: Optional[str] = None,
+    ):
+        assert self.db is not None
+        positions = fileproc.index_occurrences(
+            result.get("urls", []), result.get("occurrences", [])
+        )
+        occurrences = [
+            (self.run_id, self.get_url_id(url), status, path, file_name, line, column)
+            for status in ["failed", "excluded", "passed"]
+            for url in result[status]
+            for line, column in positions.get(url, [(None, None)])
+        ]
+        self.db.executemany(
+            "INSERT INTO occurrences VALUES (?, ?, ?, ?, ?, ?, ?)", occurrences
+        )
+        self.db.executemany(
+            "INSERT INTO attempts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.run_id,
+                    self.get_url_id(record.url),
+                    attempt.number,
+                    attempt.status,
+                    attempt.elapsed,
+                    attempt.bytes,
+                    attempt.redirect,
+                    attempt.error,
+                    attempt.driver,
+                    attempt.passed,
+                )
+                for record in result.get("records", [])
+                for attempt in record.attempts
+            ],
+        )
+        self.rows += len(occurrences)
+        self.unflushed += len(occurrences)
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.db:
+            self.db.commit()
+        self.unflushed = 0
+
+    def close(self):
+        if self.db:
+            self.db.execute(
+                "UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run_id)
+            )
+            self.flush()
+            self.db.close()
+            self.db = None
+
+
+def get_sink(file_path: str, header: List[str], **kwargs) -> ResultSink:
+    """
+    Get a sink for a file path, json lines for a .jsonl (or .ndjson)
+    extension, SQLite for .db (or .sqlite) and csv otherwise.
+
+    Args:
+        - file_path (str) : the file path to save to.
+        - header   (list) : the name of each column of a row.
+        - kwargs   (dict) : other arguments for the sink (e.g., flush_every).
+
+    Returns:
+        (ResultSink) the open sink.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    for sink in [JsonlSink, SqliteSink]:
+        if extension in sink.extensions:
+            kwargs.pop("sep", None)
+            return sink(file_path, header, **kwargs)
+    return CsvSink(file_path, header, **kwargs)
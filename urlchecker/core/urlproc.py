@@ -7,17 +7,19 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 
 """
 
+import functools
 import os
 import random
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import requests
 from fake_useragent import UserAgent
 
 from urlchecker.core import fileproc
-from urlchecker.core.exclude import excluded
-from urlchecker.logger import print_failure, print_success
+from urlchecker.core.cache import ResultCache
+from urlchecker.core.exclude import ExcludeMatcher
+from urlchecker.logger import get_reporter
 
 import logging
 
@@ -29,7 +31,8 @@ def check_response_status_code(
 ) -> bool:
     """
     Check response status of an input url. Returns a boolean
-    to indicate if retry is needed.
+    to indicate if retry is needed. The url is reported once it has a
+    final result (see record_response), not for each attempt.
 
     Args:
         - url                    (str) : url text.
@@ -40,16 +43,13 @@ def check_response_status_code(
     """
     # Case 1: response is None indicating triggered error
     if not response:
-        print_failure(url)
         return True
 
     # Case 2: success! Retry is not needed.
     if response.status_code == 200:
-        print_success(url)
         return False
 
     # Case 3: failure of some kind
-    print_failure(url)
     return True
 
 
@@ -62,10 +62,19 @@ def get_user_agent() -> dict:
     """
     browser = random.choice(["chrome", "firefox"])
     headers = get_faux_headers(browser)
-    headers["User-Agent"] = getattr(UserAgent(), browser)
+    headers["User-Agent"] = getattr(get_user_agents(), browser)
     return headers
 
 
+@functools.lru_cache(maxsize=None)
+def get_user_agents() -> UserAgent:
+    """
+    Load the user agents once, since loading them takes longer than
+    choosing one for each request.
+    """
+    return UserAgent()
+
+
 def get_faux_headers(browser) -> Dict[Any, Any]:
     """
     Get faux headers to populate based on user agent
@@ -97,6 +106,148 @@ def get_faux_headers(browser) -> Dict[Any, Any]:
     return headers[browser]
 
 
+class Attempt:
+    """
+    An Attempt is one request to check a url: the http status code (0 if
+    there was no response), seconds taken (including the web driver), bytes
+    read, redirect target, the class of an error and if the web driver was
+    used as a fallback. Slots keep it small, since a run can have millions.
+    """
+
+    __slots__ = (
+        "number",
+        "status",
+        "elapsed",
+        "bytes",
+        "redirect",
+        "error",
+        "driver",
+        "passed",
+    )
+
+    def __init__(
+        self,
+        number: int = 1,
+        status: int = 0,
+        elapsed: float = 0,
+        bytes: int = 0,
+        redirect: Optional[str] = None,
+        error: Optional[str] = None,
+        driver: bool = False,
+        passed: bool = False,
+    ):
+        self.number = number
+        self.status = status
+        self.elapsed = elapsed
+        self.bytes = bytes
+        self.redirect = redirect
+        self.error = error
+        self.driver = driver
+        self.passed = passed
+
+    def __str__(self) -> str:
+        return "Attempt:%s:%s" % (self.number, self.error or self.status)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class UrlRecord:
+    """
+    A UrlRecord is the outcome of checking a url: if it passed, the status
+    code and error class of the last attempt, the total seconds, the number
+    of attempts, and if the web driver was used. Each Attempt is kept too
+    when requested (see UrlCheckResult record_attempts).
+    """
+
+    __slots__ = (
+        "url",
+        "passed",
+        "status",
+        "error",
+        "elapsed",
+        "tries",
+        "driver",
+        "attempts",
+    )
+
+    def __init__(
+        self,
+        url: str,
+        passed: bool = False,
+        status: int = 0,
+        error: Optional[str] = None,
+        elapsed: float = 0,
+        tries: int = 0,
+        driver: bool = False,
+        attempts: Tuple[Attempt, ...] = (),
+    ):
+        self.url = url
+        self.passed = passed
+        self.status = status
+        self.error = error
+        self.elapsed = elapsed
+        self.tries = tries
+        self.driver = driver
+        self.attempts = attempts
+
+    def __str__(self) -> str:
+        return "UrlRecord:%s:%s" % ("passed" if self.passed else "failed", self.url)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {name: getattr(self, name) for name in self.__slots__}
+        record["attempts"] = [attempt.to_dict() for attempt in self.attempts]
+        return record
+
+
+def get_attempt(
+    response: Optional[requests.models.Response],
+    number: int = 1,
+    status: int = 0,
+    elapsed: float = 0,
+    error: Optional[str] = None,
+    driver: bool = False,
+) -> Attempt:
+    """
+    Describe one attempt to check a url, from its response.
+
+    Args:
+        - response (requests.Response) : the response of the attempt.
+        - number                 (int) : the number of the attempt, from 1.
+        - status                 (int) : the http status code (0 if there was no response).
+        - elapsed              (float) : seconds the attempt took, including the web driver.
+        - error                  (str) : the class of the error, if the request raised one.
+        - driver                (bool) : if the web driver was used as a fallback.
+
+    Returns:
+        (Attempt) the attempt, with the bytes read and redirect target.
+    """
+    redirect = None
+    content = None
+    if response is not None:
+        if response.is_redirect:
+            redirect = response.headers.get("location")
+        elif response.history:
+            redirect = response.url
+        content = response.content
+    return Attempt(
+        number=number,
+        status=status,
+        elapsed=elapsed,
+        bytes=len(content or b""),
+        redirect=redirect,
+        error=error,
+        driver=driver,
+        passed=response is not None and response.status_code == 200,
+    )
+
+
 class UrlCheckResult:
     """
     A UrlCheckResult is a basic class to hold a result for a filename.
@@ -110,18 +261,48 @@ class UrlCheckResult:
         exclude_patterns: Optional[List[str]] = None,
         exclude_urls: Optional[List[str]] = None,
         print_all: bool = True,
+        max_file_size: Optional[int] = fileproc.MAX_FILE_SIZE,
+        urls: Optional[List[str]] = None,
+        occurrences: Optional[List[fileproc.Occurrence]] = None,
+        exclude_matcher: Optional[ExcludeMatcher] = None,
+        result_cache: Optional[ResultCache] = None,
+        session: Optional[requests.Session] = None,
+        record_attempts: bool = False,
     ):
         self.file_name = file_name
         self.print_all = print_all
+        self.max_file_size = max_file_size
+        self.skipped = None  # type: Optional[str]
         self.passed = []  # type: List[str]
         self.failed = []  # type: List[str]
         self.excluded = []  # type: List[str]
-        self.urls = []  # type: List[str]
+        self.urls = urls or []  # type: List[str]
+        self.occurrences = occurrences or []  # type: List[fileproc.Occurrence]
         self.exclude_patterns = exclude_patterns or []
         self.exclude_urls = exclude_urls or []
 
-        # Only extract if we have a filename in advance
-        if self.file_name:
+        # Results shared with other files, so a url is only checked once
+        self.result_cache = result_cache
+
+        # A session keeps connections open between requests (e.g., for a server)
+        self.session = session
+
+        # The outcome of each url checked here, with each request if recording
+        self.records = []  # type: List[UrlRecord]
+        self.record_attempts = record_attempts
+        self.last_error = None  # type: Optional[str]
+
+        # The web driver for a check session, started on first use
+        self.driver = None  # type: Any
+        self.driver_started = False
+
+        # A matcher shared across files, or compiled from our own exclusions
+        self.exclude_matcher = exclude_matcher or ExcludeMatcher(
+            self.exclude_urls, self.exclude_patterns
+        )
+
+        # Only extract if we have a filename in advance (and no urls)
+        if self.file_name and urls is None:
             self.extract_urls()
 
     def __str__(self) -> str:
@@ -144,6 +325,13 @@ class UrlCheckResult:
     def count(self) -> int:
         return len(self.all)
 
+    @property
+    def locations(self) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Locations returns the (line, column) of each occurrence of each url.
+        """
+        return fileproc.index_occurrences(self.urls, self.occurrences)
+
     def get_driver(self, port: Optional[int] = None, timeout: Optional[int] = 5):
         """
         Get a selenium web driver for a check session, if possible.
@@ -164,45 +352,107 @@ class UrlCheckResult:
             )
         return driver
 
-    def extract_urls(self):
+    def extract_urls(self, content: Optional[bytes] = None):
         """
         Typically on init, use the provided exclude patterns and urls to
-        extract a list of urls for the given filename.
+        extract a list of urls for the given filename. If the content is
+        provided (e.g., read from git) the file is not read from disk.
+
+        Args:
+            - content (bytes) : the content of the file, if not on disk.
         """
-        if not self.file_name or not os.path.exists(self.file_name):
-            print(
-                "File name %s is undefined or does not exist, skipping extraction."
-                % self.file_name
+        if not self.file_name or (
+            content is None and not os.path.exists(self.file_name)
+        ):
+            if self.print_all:
+                print(
+                    "File name %s is undefined or does not exist, skipping extraction."
+                    % self.file_name
+                )
+            return
+
+        # Skip binary and large files before reading them
+        if content is not None:
+            encoding, reason = fileproc.sniff_content(
+                content, len(content), self.max_file_size
             )
+        else:
+            encoding, reason = fileproc.sniff_file(self.file_name, self.max_file_size)
+        if not encoding:
+            self.skipped = reason
+            if self.print_all:
+                print("Skipping %s, file is %s." % (self.file_name, reason))
             return
 
-        # collect all links from file (unique=True is set)
-        self.urls = fileproc.collect_links_from_file(self.file_name)
+        # collect unique links from file, and where each occurs
+        if content is not None:
+            self.urls, self.occurrences = (
+                fileproc.collect_link_occurrences_from_content(
+                    self.file_name, content, encoding=encoding
+                )
+            )
+        else:
+            self.urls, self.occurrences = fileproc.collect_link_occurrences(
+                self.file_name, encoding=encoding
+            )
+
+    def filter_urls(self, keep: Set[str]):
+        """
+        Only keep some of the extracted urls (e.g., those in added lines),
+        along with their occurrences.
+
+        Args:
+            - keep (set) : the urls to keep.
+        """
+        urls = [url for url in self.urls if url in keep]
+        ids = {url: index for index, url in enumerate(urls)}
+        self.occurrences = [
+            (ids[self.urls[index]], line, column)
+            for index, line, column in self.occurrences
+            if self.urls[index] in ids
+        ]
+        self.urls = urls
 
     def make_request(self, url, timeout=5, headers=None, verify=True):
         """
         Make a request.
 
-        Start with a HEAD (quicker) and fall back to standard get. We
-        return None if there is an error
+        Start with a HEAD (quicker) and fall back to standard get. If there
+        is an error, the response has a status code of 0 and the class of
+        the error is kept as last_error.
         """
         response = requests.Response()
         response.status_code = 0
+        self.last_error = None
+        client = self.session or requests
         try:
-            response = requests.head(
-                url, timeout=timeout, headers=headers, verify=verify
-            )
+            response = client.head(url, timeout=timeout, headers=headers, verify=verify)
 
             # 405 means that head is not allowed, fall back to requests.get
             if response.status_code == 405:
-                response = requests.get(
+                response = client.get(
                     url, timeout=timeout, headers=headers, verify=verify
                 )
             response.close()
         except Exception as e:
+            self.last_error = e.__class__.__name__
             logger.warning(f"Issue with url {url}: {e}")
         return response
 
+    def use_driver(self, port: Optional[int] = None, timeout: Optional[int] = 5):
+        """
+        Get the web driver for this check session, starting it the first
+        time a url needs it (most urls pass without it).
+
+        Args:
+            - port           (int) : a port for the driver to use (if installed)
+            - timeout        (int) : a timeout in seconds for the driver.
+        """
+        if not self.driver_started:
+            self.driver_started = True
+            self.driver = self.get_driver(port, timeout)
+        return self.driver
+
     def check_urls(
         self,
         urls: Optional[List[str]] = None,
@@ -215,107 +465,239 @@ class UrlCheckResult:
         Check urls extracted from a certain file and print the checks results.
 
         Args:
-            - urls          (list) : list of urls.
+            - urls          (list) : list of urls (defaults to all urls extracted).
             - retry_count    (int) : a number of retries to issue (defaults to 1, no retry).
             - timeout        (int) : a timeout in seconds for blocking operations like the connection attempt.
             - port           (int) : a port for the driver to use (if installed)
             - no_check_certs (bool) : do not check certificates
         """
-        urls = urls or self.urls
+        urls = self.exclude(self.urls if urls is None else urls)
         no_check_certs = False if no_check_certs is None else no_check_certs
 
-        # Set driver (session) at start of check
-        # NOTE: since selenium is installed by default, we might want
-        # a flag for the user to ask to disable using it
-        driver = self.get_driver(port, timeout)
-
-        # eliminate excluded urls and patterns
-        if self.exclude_urls or self.exclude_patterns:
-            self.excluded = [
-                url
-                for url in urls
-                if excluded(url, self.exclude_urls, self.exclude_patterns)
-            ]
-            urls = list(set(urls).difference(set(self.excluded)))
-
         # if no urls are found, mention it if required
         if not urls:
             if self.print_all:
-                print("No urls found.")
+                get_reporter().message("No urls found.")
             return
 
         # init seen urls list
         seen = set()
 
         # check links
-        for url in [url for url in urls if "http" in url]:
-
-            # Some sites will return 403 if it's not a "human" user agent
-            headers = get_user_agent()
-
-            # init do retrails and retrails counts
-            do_retry = True
-            rcount = retry_count
+        try:
+            for url in [url for url in urls if "http" in url]:
 
-            # we will double the time for retry each time
-            retry_seconds = 2
+                # No need to test the same URL twice
+                if url in seen:
+                    continue
 
-            # With retry, increase timeout by a second
-            pause = timeout
+                seen.add(url)
 
-            # No need to test the same URL twice
-            if url in seen:
-                continue
+                # A url checked (or being checked) for another file is reused
+                if self.result_cache:
+                    passed = self.result_cache.claim(url)
+                    if passed is not None:
+                        (self.passed if passed else self.failed).append(url)
+                        continue
 
-            seen.add(url)
-            while rcount > 0 and do_retry:
                 try:
-                    response = self.make_request(
-                        url, timeout=pause, headers=headers, verify=not no_check_certs
+                    self.check_url(
+                        url,
+                        retry_count=retry_count,
+                        timeout=timeout,
+                        port=port,
+                        no_check_certs=no_check_certs,
                     )
+                finally:
+                    if self.result_cache:
+                        self.result_cache.record(
+                            url, bool(self.passed) and self.passed[-1] == url
+                        )
+
+        # Close driver (if one was started) at end of session
+        finally:
+            if self.driver:
+                self.driver.close()
+            self.driver = None
+            self.driver_started = False
+
+    def exclude(self, urls: List[str]) -> List[str]:
+        """
+        Record excluded urls (urls and patterns), and return the others.
 
-                    needs_driver_check = (
-                        not response.status_code
-                        or response.status_code not in [200, 404]
-                    )
+        Args:
+            - urls (list) : list of urls.
 
-                    # Fallback to trying selenium driver for any error code
-                    if needs_driver_check and driver and driver.check(url):
-                        response.status_code = 200
+        Returns:
+            (list) the urls that are not excluded.
+        """
+        if not self.exclude_matcher:
+            return urls
+        self.excluded = [url for url in urls if self.exclude_matcher(url)]
+        return list(set(urls).difference(set(self.excluded)))
 
-                # Web driver doesn't have same issues with ssl
-                except Exception as e:
-                    if driver and driver.check(url):
-                        response = requests.Response()
-                        response.status_code = 200
-                    else:
-                        print(e)
+    def check_urls_remote(
+        self,
+        server: str,
+        urls: Optional[List[str]] = None,
+        retry_count: int = 1,
+        timeout: int = 5,
+        no_check_certs: bool = False,
+    ) -> None:
+        """
+        Check urls with a urlchecker server (see urlchecker serve) instead of
+        in this process, and print the checks results. Exclusions are
+        applied here, so only the urls to check are sent.
 
-                # decrement retrials count
-                rcount -= 1
+        Args:
+            - server         (str) : the server url (e.g., http://127.0.0.1:8711).
+            - urls          (list) : list of urls (defaults to all urls extracted).
+            - retry_count    (int) : a number of retries to issue (defaults to 1, no retry).
+            - timeout        (int) : a timeout in seconds for blocking operations like the connection attempt.
+            - no_check_certs (bool) : do not check certificates
+        """
+        from .server import request_check
+
+        urls = self.exclude(self.urls if urls is None else urls)
+        urls = [url for url in urls if "http" in url]
+        if not urls:
+            if self.print_all:
+                get_reporter().message("No urls found.")
+            return
+
+        result = request_check(
+            server,
+            urls,
+            retry_count=retry_count,
+            timeout=timeout,
+            no_check_certs=bool(no_check_certs),
+        )
+        reporter = get_reporter()
+        for url in result["passed"]:
+            reporter.success(url)
+            self.passed.append(url)
+        for url in result["failed"]:
+            reporter.failure(url)
+            self.failed.append(url)
+
+    def check_url(
+        self,
+        url: str,
+        retry_count: int = 1,
+        timeout: int = 5,
+        port: Optional[int] = None,
+        no_check_certs: bool = False,
+    ) -> None:
+        """
+        Check a single url, with retries, and record it as passed or failed.
+        The web driver is used (and started, if needed) for urls that fail.
 
-                # Break from the loop if we have success, update user
-                do_retry = check_response_status_code(url, response)
+        Args:
+            - url            (str) : the url to check.
+            - retry_count    (int) : a number of retries to issue (defaults to 1, no retry).
+            - timeout        (int) : a timeout in seconds for blocking operations like the connection attempt.
+            - port           (int) : a port for the driver to use (if installed)
+            - no_check_certs (bool) : do not check certificates
+        """
+        # Some sites will return 403 if it's not a "human" user agent
+        headers = get_user_agent()
+
+        # init do retrails and retrails counts
+        do_retry = True
+        rcount = retry_count
+
+        # we will double the time for retry each time
+        retry_seconds = 2
+
+        # With retry, increase timeout by a second
+        pause = timeout
+
+        # The status, error and time of each attempt go in the url's record
+        attempts = []  # type: List[Attempt]
+        elapsed = 0.0
+        driver_used = False
+
+        while rcount > 0 and do_retry:
+            start = time.time()
+            status = 0
+            used_driver = False
+            try:
+                response = self.make_request(
+                    url,
+                    timeout=pause,
+                    headers=headers,
+                    verify=not no_check_certs,
+                )
+                status = response.status_code
 
-                # If we try again, pause for retry seconds and update retry seconds
-                if rcount > 0 and do_retry:
-                    # keep this only for debugging
-                    # print("Retry n° %s for %s, with timeout of %s seconds." % (retry_count - rcount, url, pause))
-                    time.sleep(retry_seconds)
-                    retry_seconds = retry_seconds * 2
-                    pause += 1
+                needs_driver_check = (
+                    not response.status_code or response.status_code not in [200, 404]
+                )
 
-            # When we break from while, we record final response
-            self.record_response(url, response)
+                # Fallback to trying selenium driver for any error code
+                if needs_driver_check:
+                    driver = self.use_driver(port, timeout)
+                    used_driver = driver is not None
+                    if driver and driver.check(url):
+                        response.status_code = 200
 
-        # Close driver at end of session
-        if driver:
-            driver.close()
+            # Web driver doesn't have same issues with ssl
+            except Exception as e:
+                self.last_error = e.__class__.__name__
+                driver = self.use_driver(port, timeout)
+                used_driver = driver is not None
+                if driver and driver.check(url):
+                    response = requests.Response()
+                    response.status_code = 200
+                else:
+                    get_reporter().message(str(e))
+
+            attempt = get_attempt(
+                response,
+                number=retry_count - rcount + 1,
+                status=status,
+                elapsed=time.time() - start,
+                error=self.last_error,
+                driver=used_driver,
+            )
+            elapsed += attempt.elapsed
+            driver_used = driver_used or used_driver
+            if self.record_attempts:
+                attempts.append(attempt)
+
+            # decrement retrials count
+            rcount -= 1
+
+            # Break from the loop if we have success, update user
+            do_retry = check_response_status_code(url, response)
+
+            # If we try again, pause for retry seconds and update retry seconds
+            if rcount > 0 and do_retry:
+                # keep this only for debugging
+                # print("Retry n° %s for %s, with timeout of %s seconds." % (retry_count - rcount, url, pause))
+                time.sleep(retry_seconds)
+                retry_seconds = retry_seconds * 2
+                pause += 1
+
+        # When we break from while, we record final response
+        self.record_response(url, response)
+        self.records.append(
+            UrlRecord(
+                url,
+                passed=attempt.passed,
+                status=attempt.status,
+                error=attempt.error,
+                elapsed=elapsed,
+                tries=attempt.number,
+                driver=driver_used,
+                attempts=tuple(attempts),
+            )
+        )
 
     def record_response(self, url: str, response: Optional[requests.models.Response]):
         """
-        Record response status of an input url. This function is run after success,
-        or at the end of retry to record the final response.
+        Record response status of an input url, and report it. This function
+        is run after success, or at the end of retry to record the final response.
 
         Args:
             - url                    (str) : url text.
@@ -324,11 +706,14 @@ class UrlCheckResult:
         # response of None indicates a failure
         if not response:
             self.failed.append(url)
+            get_reporter().failure(url)
 
         # success
         elif response.status_code == 200:
             self.passed.append(url)
+            get_reporter().success(url)
 
         # Any other error
         else:
             self.failed.append(url)
+            get_reporter().failure(url)
@@ -0,0 +1,234 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import threading
+from array import array
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Set,
+)
+
+from urlchecker.core import fileproc
+
+# The result lists of a check, stored as url ids
+STATUSES = ["failed", "passed", "excluded"]
+
+# Keys of a check result kept by a StoredResult, others are kept as they are
+STORED_KEYS = STATUSES + ["urls", "occurrences", "skipped", "records"]
+
+
+class UrlTable:
+    """
+    A UrlTable interns the urls of a run: each distinct url is kept once,
+    with an integer id, so the results of every file can keep compact
+    arrays of ids instead of their own copies of each url.
+    """
+
+    def __init__(self) -> None:
+        self.ids = {}  # type: Dict[str, int]
+        self.urls = []  # type: List[str]
+        self.lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return "UrlTable:%s" % len(self.urls)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def __contains__(self, url: object) -> bool:
+        return url in self.ids
+
+    def __getitem__(self, url_id: int) -> str:
+        return self.urls[url_id]
+
+    def intern(self, urls: Iterable[str]) -> array:
+        """
+        Get the id of each url, adding urls that are new to the table.
+
+        Args:
+            - urls (iterable) : the urls.
+
+        Returns:
+            (array) the id of each url.
+        """
+        ids = array("I")
+        with self.lock:
+            for url in urls:
+                url_id = self.ids.get(url)
+                if url_id is None:
+                    url_id = self.ids[url] = len(self.urls)
+                    self.urls.append(url)
+                ids.append(url_id)
+        return ids
+
+    def lookup(self, ids: Iterable[int]) -> List[str]:
+        """
+        Get the url for each id.
+
+        Args:
+            - ids (iterable) : the url ids.
+
+        Returns:
+            (list) the urls.
+        """
+        urls = self.urls
+        return [urls[url_id] for url_id in ids]
+
+    def canonical(self, urls: Iterable[str]) -> List[str]:
+        """
+        Get the table's copy of each url (adding new urls), so the same url
+        found in many files is one string.
+
+        Args:
+            - urls (iterable) : the urls.
+
+        Returns:
+            (list) the urls, as kept by the table.
+        """
+        return self.lookup(self.intern(urls))
+
+
+class StoredResult:
+    """
+    The result of checking a file (see check_task), with the urls of each
+    status as arrays of ids in a UrlTable and the occurrences as a flat
+    array (see fileproc.pack_occurrences).
+    """
+
+    __slots__ = (
+        "urls",
+        "occurrences",
+        "failed",
+        "passed",
+        "excluded",
+        "skipped",
+        "records",
+        "extra",
+    )
+
+    def __init__(self, table: UrlTable, result: Dict[str, Any]):
+        """
+        Args:
+            - table (UrlTable) : the table to intern urls with.
+            - result    (dict) : the result of check_task for the file.
+        """
+        self.urls = table.intern(result.get("urls") or [])
+        self.occurrences = fileproc.pack_occurrences(result.get("occurrences") or [])
+        self.failed = table.intern(result["failed"])
+        self.passed = table.intern(result["passed"])
+        self.excluded = table.intern(result["excluded"])
+        self.skipped = result.get("skipped")
+        self.records = result.get("records") or []
+        self.extra = None  # type: Optional[Dict[str, Any]]
+        if set(result).difference(STORED_KEYS):
+            self.extra = {
+                key: value for key, value in result.items() if key not in STORED_KEYS
+            }
+
+    def to_dict(self, table: UrlTable) -> Dict[str, Any]:
+        """
+        Project the result back to a dict with lists of urls.
+
+        Args:
+            - table (UrlTable) : the table the urls were interned with.
+
+        Returns:
+            (dict) the result, as returned by check_task.
+        """
+        result = {
+            "failed": table.lookup(self.failed),
+            "passed": table.lookup(self.passed),
+            "excluded": table.lookup(self.excluded),
+            "skipped": self.skipped,
+            "urls": table.lookup(self.urls),
+            "occurrences": fileproc.unpack_occurrences(self.occurrences),
+            "records": list(self.records),
+        }  # type: Dict[str, Any]
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+class CheckResults(MutableMapping):
+    """
+    The results of each checked file by file name, kept as StoredResults
+    that share one UrlTable. Getting a result projects it to a dict (like
+    check_task returns), so changing that dict doesn't change what is kept.
+    """
+
+    def __init__(self, table: Optional[UrlTable] = None) -> None:
+        self.table = UrlTable() if table is None else table
+        self.stored = {}  # type: Dict[str, StoredResult]
+
+        # Changes with every result set, so projections know to update
+        self.version = 0
+
+    def __getitem__(self, file_name: str) -> Dict[str, Any]:
+        return self.stored[file_name].to_dict(self.table)
+
+    def __setitem__(self, file_name: str, result: Dict[str, Any]):
+        self.stored[file_name] = StoredResult(self.table, result)
+        self.version += 1
+
+    def __delitem__(self, file_name: str):
+        del self.stored[file_name]
+        self.version += 1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.stored)
+
+    def __len__(self) -> int:
+        return len(self.stored)
+
+    def iter_ids(self, status: str) -> Iterator[int]:
+        """
+        Yield the id of each url with a status (e.g., failed), for all files.
+        """
+        for stored in self.stored.values():
+            yield from getattr(stored, status)
+
+
+class ResultSets(Mapping):
+    """
+    The set of urls that "failed", "passed" and were "excluded" across
+    all files of CheckResults, projected when first asked for (and again
+    after results change).
+    """
+
+    def __init__(self, checks: CheckResults) -> None:
+        self.checks = checks
+        self.sets = {}  # type: Dict[str, Set[str]]
+        self.version = -1
+
+    def __getitem__(self, status: str) -> Set[str]:
+        if status not in STATUSES:
+            raise KeyError(status)
+        if self.version != self.checks.version:
+            self.sets = {}
+            self.version = self.checks.version
+        if status not in self.sets:
+            ids = set(self.checks.iter_ids(status))
+            self.sets[status] = set(self.checks.table.lookup(ids))
+        return self.sets[status]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(STATUSES)
+
+    def __len__(self) -> int:
+        return len(STATUSES)
@@ -7,35 +7,76 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 
 """
 
+import asyncio
+import functools
 import itertools
 import multiprocessing
 import os
 import signal
 import sys
 import time
-from typing import Optional
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+    FIRST_COMPLETED,
+)
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from urlchecker.logger import get_logger
 
 logger = get_logger()
 
+# Bounds for the number of checks in flight, when not pinned
+MIN_CHECK_WORKERS = int(os.environ.get("URLCHECKER_MIN_WORKERS", 2))
+MAX_CHECK_WORKERS = int(os.environ.get("URLCHECKER_MAX_WORKERS", 64))
+
+# Executor backends for Workers (and the Pipeline extraction stage)
+BACKENDS = ["process", "thread", "asyncio", "serial"]
+
+
+def get_backend(backend: Optional[str] = None) -> str:
+    """
+    Get the executor backend to use, from the argument or URLCHECKER_BACKEND
+    (defaults to process).
+
+    Args:
+        - backend (str) : one of process, thread, asyncio or serial.
+
+    Returns:
+        (str) the backend.
+    """
+    backend = backend or os.environ.get("URLCHECKER_BACKEND") or "process"
+    if backend not in BACKENDS:
+        sys.exit("Backend must be one of %s, found %s" % (", ".join(BACKENDS), backend))
+    return backend
+
 
 class Workers:
-    def __init__(self, workers=None):
+    """
+    Run tasks with an executor backend: a process pool ("process", the
+    default), a thread pool ("thread"), an asyncio event loop ("asyncio",
+    coroutine functions are awaited and others run in threads) or one at a
+    time in this process ("serial"). Set with URLCHECKER_BACKEND.
+    """
+
+    def __init__(self, workers=None, backend: Optional[str] = None):
 
         if workers is None:
             workers = int(os.environ.get("URLCHECKER_WORKERS", 9))
         self.workers = workers
-        logger.debug(f"Using {self.workers} workers for multiprocess.")
+        self.backend = get_backend(backend)
+        logger.debug(f"Using {self.workers} workers with {self.backend} backend.")
 
     def start(self):
-        logger.debug("Starting multiprocess")
+        logger.debug(f"Starting {self.backend} workers")
         self.start_time = time.time()
 
     def end(self):
         self.end_time = time.time()
         self.runtime = self.runtime = self.end_time - self.start_time
-        logger.debug(f"Ending multiprocess, runtime: {self.runtime} sec")
+        logger.debug(f"Ending {self.backend} workers, runtime: {self.runtime} sec")
 
     def run(self, funcs: dict, tasks: dict) -> Optional[dict]:
         """
@@ -43,54 +84,542 @@ class Workers:
         the arguments should be ordered correctly.
 
         Args:
-            - funcs (dict) : the functions to run with multiprocessing.pool, a dictionary with lookup by the task name
+            - funcs (dict) : the functions to run with the backend, a dictionary with lookup by the task name
             - tasks (dict) : a dict of tasks, each task name (key) with a tuple of arguments to process
         """
-        # Number of tasks must == number of functions
-        assert len(funcs) == len(tasks)
-
-        # Keep track of some progress for the user
-        progress = 1
-
         # if we don't have tasks, don't run
         if not tasks:
             return None
 
         # results will also have the same key to look up
         finished = dict()
-        results = []
-
         try:
-            pool = multiprocessing.Pool(self.workers, init_worker)
+            for key, result in self.stream(funcs, tasks):
+                finished[key] = result
+        except (KeyboardInterrupt, SystemExit):
+            sys.exit(1)
+        except:
+            logger.error("Error running task")
+        return finished
 
-            self.start()
-            for key, params in tasks.items():
-                func = funcs[key]
-                result = pool.apply_async(multi_wrapper, multi_package(func, [params]))
+    def stream(self, funcs: dict, tasks: dict) -> Iterator[Tuple[Any, Any]]:
+        """
+        Run tasks like run, but yield each result (with the task name) as
+        soon as it finishes, in the order tasks complete.
 
-                # Store the key with the result
-                results.append((key, result))
+        Args:
+            - funcs (dict) : the functions to run with the backend, a dictionary with lookup by the task name
+            - tasks (dict) : a dict of tasks, each task name (key) with a tuple of arguments to process
 
-            while len(results) > 0:
-                pair = results.pop()
-                key, result = pair
-                result.wait()
-                progress += 1
-                finished[key] = result.get()
+        Returns:
+            (iterator) of task names with results.
+        """
+        # Number of tasks must == number of functions
+        assert len(funcs) == len(tasks)
+        streams = {
+            "process": self.stream_process,
+            "thread": self.stream_thread,
+            "asyncio": self.stream_asyncio,
+            "serial": self.stream_serial,
+        }
 
-            self.end()
+        # Keep track of some progress for the user
+        progress = 0
+
+        self.start()
+        for key, result in streams[self.backend](
+            (key, funcs[key], params) for key, params in tasks.items()
+        ):
+            progress += 1
+            logger.debug(f"Finished {progress}/{len(tasks)} tasks: {key}")
+            yield key, result
+        self.end()
+
+    def stream_process(self, items: Iterable[Tuple[Any, Callable, dict]]):
+        """
+        Run tasks in a process pool (functions and arguments must pickle).
+        """
+        pool = multiprocessing.Pool(self.workers, init_worker)
+        try:
+            yield from pool.imap_unordered(multi_task_wrapper, items)
             pool.close()
             pool.join()
 
         except (KeyboardInterrupt, SystemExit):
             logger.error("Keyboard interrupt detected, terminating workers!")
             pool.terminate()
+            raise
+
+        finally:
+            pool.terminate()
+
+    def stream_thread(self, items: Iterable[Tuple[Any, Callable, dict]]):
+        """
+        Run tasks in a thread pool, in this process.
+        """
+        executor = ThreadPoolExecutor(self.workers)
+        futures = []  # type: List[Future]
+        try:
+            futures = [executor.submit(multi_task_wrapper, item) for item in items]
+            for future in as_completed(futures):
+                yield future.result()
+
+        except (KeyboardInterrupt, SystemExit):
+            logger.error("Keyboard interrupt detected, cancelling workers!")
+            for future in futures:
+                future.cancel()
+            raise
+
+        finally:
+            executor.shutdown(wait=True)
+
+    def stream_asyncio(self, items: Iterable[Tuple[Any, Callable, dict]]):
+        """
+        Run tasks on an asyncio event loop, at most workers at once.
+        Coroutine functions are awaited, and others run in a thread pool.
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor(self.workers)
+
+        # Created on the loop, since older Pythons bind it to a loop
+        async def make_semaphore():
+            return asyncio.Semaphore(self.workers)
+
+        semaphore = loop.run_until_complete(make_semaphore())
+
+        async def run_task(key, function, kwargs):
+            async with semaphore:
+                if asyncio.iscoroutinefunction(function):
+                    return key, await function(**kwargs)
+                return key, await loop.run_in_executor(
+                    executor, functools.partial(function, **kwargs)
+                )
+
+        pending = set()  # type: Set[asyncio.Task]
+        try:
+            pending = {loop.create_task(run_task(*item)) for item in items}
+            while pending:
+                done, pending = loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                )
+                for task in done:
+                    yield task.result()
+
+        except (KeyboardInterrupt, SystemExit):
+            logger.error("Keyboard interrupt detected, cancelling workers!")
+            for task in pending:
+                task.cancel()
+            raise
+
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+
+    def stream_serial(self, items: Iterable[Tuple[Any, Callable, dict]]):
+        """
+        Run tasks one at a time, in this process (e.g., for debugging).
+        """
+        for item in items:
+            yield multi_task_wrapper(item)
+
+
+class Concurrency:
+    """
+    An additive increase, multiplicative decrease (AIMD) controller for the
+    number of tasks in flight. Finished tasks are measured in windows (about
+    one task per slot in flight). The limit doubles while throughput keeps
+    improving (slow start), then grows by one each window. It is halved when
+    the error rate rises, or latency grows without a gain in throughput.
+    """
+
+    def __init__(
+        self,
+        minimum: int = MIN_CHECK_WORKERS,
+        maximum: int = MAX_CHECK_WORKERS,
+        initial: Optional[int] = None,
+        latency_factor: float = 2.0,
+        error_margin: float = 0.25,
+        backoff: float = 0.5,
+    ):
+        """
+        Args:
+            - minimum          (int) : the lowest number of tasks in flight.
+            - maximum          (int) : the highest number of tasks in flight.
+            - initial          (int) : the starting limit (defaults to the minimum).
+            - latency_factor (float) : latency over the best seen by this factor is congestion.
+            - error_margin   (float) : an error rate over the lowest seen by this margin is congestion.
+            - backoff        (float) : multiply the limit by this on congestion.
+        """
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial or self.minimum))
+        self.latency_factor = latency_factor
+        self.error_margin = error_margin
+        self.backoff = backoff
+        self.slow_start = True
+
+        # Lowest latency (seconds per unit) and error rate seen, the last
+        # window's throughput (units per second) and the best with its limit
+        self.base_latency = None  # type: Optional[float]
+        self.base_errors = None  # type: Optional[float]
+        self.throughput = 0.0
+        self.best = (0.0, self.limit)
+
+        # The limit and throughput of each window
+        self.history = []  # type: List[Tuple[int, float]]
+        self.reset()
+
+    def __str__(self) -> str:
+        return "Concurrency:%s" % self.limit
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def reset(self):
+        """
+        Start a new measurement window.
+        """
+        self.window_start = time.time()
+        self.tasks = 0
+        self.units = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def record(self, seconds: float, units: int = 1, errors: int = 0):
+        """
+        Record a finished task, and adjust the limit when a window is full.
+
+        Args:
+            - seconds (float) : how long the task ran.
+            - units     (int) : the units of work it did (e.g., urls checked).
+            - errors    (int) : how many of those units failed.
+        """
+        self.tasks += 1
+        self.units += units
+        self.errors += errors
+        self.busy += seconds
+        if self.tasks >= max(self.limit, 4):
+            self.adjust()
+
+    def adjust(self):
+        """
+        Set the limit for the next window from the measurements of this one.
+        """
+        elapsed = max(time.time() - self.window_start, 1e-6)
+        if not self.units:
+            self.reset()
+            return
+
+        throughput = self.units / elapsed
+        latency = self.busy / self.units
+        error_rate = self.errors / self.units
+        self.history.append((self.limit, throughput))
+        if throughput > self.best[0]:
+            self.best = (throughput, self.limit)
+
+        reason = None
+        if (
+            self.base_errors is not None
+            and error_rate > self.base_errors + self.error_margin
+        ):
+            reason = "error rate %.2f" % error_rate
+        elif (
+            self.base_latency is not None
+            and latency > self.base_latency * self.latency_factor
+            and throughput <= self.throughput
+        ):
+            reason = "latency %.2fs" % latency
+
+        limit = self.limit
+        if reason:
+            self.slow_start = False
+            limit = int(limit * self.backoff)
+        elif self.slow_start and self.throughput and throughput < self.throughput * 1.1:
+            self.slow_start = False
+            reason = "throughput %.1f/s" % throughput
+            limit += 1
+        elif self.slow_start:
+            limit *= 2
+        else:
+            limit += 1
+        limit = min(self.maximum, max(self.minimum, limit))
+
+        if limit != self.limit:
+            logger.debug(
+                f"Concurrency {self.limit} -> {limit} ({reason or 'throughput %.1f/s' % throughput})"
+            )
+        self.limit = limit
+        self.throughput = throughput
+        self.base_errors = (
+            error_rate
+            if self.base_errors is None
+            else min(error_rate, self.base_errors)
+        )
+        self.base_latency = (
+            latency if self.base_latency is None else min(latency, self.base_latency)
+        )
+        self.reset()
+
+
+class Pipeline:
+    """
+    A two stage pipeline. Tasks stream through a process pool sized for cpu
+    bound extraction, and each extraction result is handed to a thread pool
+    for i/o bound checks as soon as it is ready, so checking starts while
+    later files are still being extracted. Unless the number of check
+    threads is given (or set with URLCHECKER_WORKERS) the number of checks
+    in flight is adapted to the measured throughput, latency and errors.
+    With the thread or asyncio backend files are extracted in this process
+    (no fork), and with serial everything runs one task at a time.
+    """
+
+    def __init__(
+        self,
+        extract_workers: Optional[int] = None,
+        check_workers: Optional[int] = None,
+        serial: bool = False,
+        min_check_workers: Optional[int] = None,
+        max_check_workers: Optional[int] = None,
+        backend: Optional[str] = None,
+    ):
+        if extract_workers is None:
+            extract_workers = int(
+                os.environ.get("URLCHECKER_EXTRACT_WORKERS", os.cpu_count() or 1)
+            )
+        if check_workers is None and "URLCHECKER_WORKERS" in os.environ:
+            check_workers = int(os.environ["URLCHECKER_WORKERS"])
+        self.extract_workers = max(1, extract_workers)
+        self.backend = get_backend(backend)
+        self.serial = serial or self.backend == "serial"
+
+        # Adapt the checks in flight, unless the number is pinned
+        self.concurrency = None  # type: Optional[Concurrency]
+        if check_workers is None:
+            self.concurrency = Concurrency(
+                minimum=min_check_workers or MIN_CHECK_WORKERS,
+                maximum=max_check_workers or MAX_CHECK_WORKERS,
+            )
+            self.check_workers = self.concurrency.maximum
+        else:
+            self.check_workers = max(1, check_workers)
+        logger.debug(
+            f"Using {self.backend} backend, {self.extract_workers} extract processes and {self.check_workers} check threads."
+        )
+
+    def start(self):
+        logger.debug("Starting pipeline")
+        self.start_time = time.time()
+
+    def end(self):
+        self.end_time = time.time()
+        self.runtime = self.end_time - self.start_time
+        logger.debug(f"Ending pipeline, runtime: {self.runtime} sec")
+
+        # Report the level we chose (on stderr, with progress), so it can be pinned
+        if self.concurrency and self.concurrency.history:
+            throughput, limit = self.concurrency.best
+            sys.stderr.write(
+                "Adaptive concurrency: best %.1f/s with %s checks in flight (ended at %s), pin with --workers %s.\n"
+                % (throughput, limit, self.concurrency.limit, limit)
+            )
+
+    def run(
+        self,
+        extract: Callable,
+        check: Callable,
+        tasks: Iterable[Tuple[Any, dict]],
+        on_extract: Optional[Callable] = None,
+        measure: Optional[Callable] = None,
+        split: Optional[Callable] = None,
+        merge: Optional[Callable] = None,
+        on_error: Optional[Callable] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Run each task through extract (in a process) and then check (in a
+        thread), yielding results in the order they complete. If split is
+        given, each extracted task is split into parts (e.g., batches of urls)
+        checked by any free thread, and the results of the parts are merged,
+        so one large task doesn't keep a single thread busy. A task that
+        raises is logged and the others continue.
+
+        Args:
+            - extract    (function) : run with the task kwargs, returns a dict of extra kwargs for check.
+            - check      (function) : run with the task kwargs updated with the extract result.
+            - tasks      (iterable) : pairs of task name (key) and kwargs, can be a generator.
+            - on_extract (function) : optionally called in this process with the key and kwargs after extraction.
+            - measure    (function) : get the units of work and errors from a check result, for adaptive concurrency.
+            - split      (function) : split extracted kwargs into a list of kwargs to check separately.
+            - merge      (function) : merge the list of check results of the parts (in order) into one.
+            - on_error   (function) : get the result to yield for a task that raised, with the key and error (otherwise it isn't yielded).
+        """
+        self.start()
+        if self.serial:
+            for key, kwargs in tasks:
+                try:
+                    kwargs.update(extract(**kwargs))
+                    if on_extract:
+                        on_extract(key, kwargs)
+                    if split:
+                        result = merge_results(
+                            [check(**part) for part in split(kwargs)], merge
+                        )
+                    else:
+                        result = check(**kwargs)
+                except Exception as e:
+                    yield from self.errored(key, describe_error(e), on_error)
+                    continue
+                yield key, result
+            self.end()
+            return
+
+        # Futures for checks in progress, with the task name (key) and part,
+        # the results of the parts of each task, and the first error of each
+        pending = {}  # type: Dict[Future, Tuple[Any, int]]
+        parts = {}  # type: Dict[Any, List[Any]]
+        remaining = {}  # type: Dict[Any, int]
+        errors = {}  # type: Dict[Any, str]
+        executor = ThreadPoolExecutor(self.check_workers)
+        pool = None
+
+        def collect(futures: Iterable[Future]) -> Iterator[Tuple[Any, Any]]:
+            """
+            Collect finished checks, yielding each task once all parts are done.
+            """
+            for future in futures:
+                key, index = pending.pop(future)
+                try:
+                    parts[key][index] = self.finished(future, measure)
+                except Exception as e:
+                    errors.setdefault(key, describe_error(e))
+                remaining[key] -= 1
+                if not remaining[key]:
+                    del remaining[key]
+                    results = parts.pop(key)
+                    if key in errors:
+                        yield from self.errored(key, errors.pop(key), on_error)
+                    else:
+                        yield key, (
+                            merge_results(results, merge) if split else results[0]
+                        )
+
+        try:
+            # A single extract worker (or other backend) doesn't need a process pool
+            if self.extract_workers == 1 or self.backend != "process":
+                extracted = (
+                    multi_keyed_wrapper((key, extract, kwargs)) for key, kwargs in tasks
+                )  # type: Iterable
+            else:
+                pool = multiprocessing.Pool(self.extract_workers, init_worker)
+                extracted = pool.imap_unordered(
+                    multi_keyed_wrapper,
+                    ((key, extract, kwargs) for key, kwargs in tasks),
+                )
+
+            for key, kwargs, error in extracted:
+                try:
+                    if error is None and on_extract:
+                        on_extract(key, kwargs)
+                    task_parts = split(kwargs) if split else [kwargs]
+                except Exception as e:
+                    error = describe_error(e)
+                if error is not None:
+                    yield from self.errored(key, error, on_error)
+                    continue
+
+                parts[key] = [None] * len(task_parts)
+                remaining[key] = len(task_parts)
+                for index, part in enumerate(task_parts):
+
+                    # Wait for a free slot, if the checks in flight are limited
+                    while self.concurrency and len(pending) >= self.concurrency.limit:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from collect(done)
+                    pending[executor.submit(timed_call, check, part)] = (key, index)
+
+                # Yield anything that finished while we were extracting
+                yield from collect([x for x in pending if x.done()])
+
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+
+            self.end()
+
+        except (KeyboardInterrupt, SystemExit):
+            logger.error("Keyboard interrupt detected, terminating workers!")
             sys.exit(1)
 
-        except:
-            logger.error("Error running task")
+        # Checks that haven't started are cancelled, and extraction stopped,
+        # if we are interrupted or the caller stops early (GeneratorExit)
+        finally:
+            for future in pending:
+                future.cancel()
+            if pool is not None:
+                pool.terminate()
+            executor.shutdown(wait=True)
 
-        return finished
+    def errored(
+        self, key: Any, error: str, on_error: Optional[Callable] = None
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Log a task that raised, and yield the result on_error gives for it.
+        """
+        logger.error("Error running task %s: %s" % (key, error))
+        if on_error:
+            yield key, on_error(key, error)
+
+    def finished(self, future: Future, measure: Optional[Callable] = None) -> Any:
+        """
+        Get the result of a finished check, and record it for adaptive
+        concurrency (with the units of work and errors from measure).
+        """
+        seconds, result = future.result()
+        if self.concurrency:
+            units, errors = measure(result) if measure else (1, 0)
+            self.concurrency.record(seconds, units, errors)
+        return result
+
+
+def merge_results(results: List[Any], merge: Optional[Callable] = None) -> Any:
+    """
+    Merge the results of the parts of a task, if there is more than one
+    (without a merge function, the list of results is returned).
+    """
+    if len(results) == 1:
+        return results[0]
+    return merge(results) if merge else results
+
+
+def parse_workers(value: Optional[str] = None) -> Dict[str, int]:
+    """
+    Parse a number of check workers, either a number to pin (e.g., 16) or
+    bounds for adaptive concurrency (e.g., 4:128). "auto" (or None) adapts
+    within the default bounds.
+
+    Args:
+        - value (str) : the number of workers, bounds or "auto".
+
+    Returns:
+        (dict) of Pipeline arguments for the check workers.
+    """
+    if not value or value == "auto":
+        return {}
+    try:
+        if ":" in value:
+            minimum, maximum = (int(x) for x in value.split(":", 1))
+            if minimum < 1 or maximum < minimum:
+                raise ValueError
+            return {"min_check_workers": minimum, "max_check_workers": maximum}
+        workers = int(value)
+        if workers < 1:
+            raise ValueError
+        return {"check_workers": workers}
+    except ValueError:
+        sys.exit("Workers must be a number, MIN:MAX or auto, found %s" % value)
 
 
 # Supporting functions for MultiProcess Worker
@@ -103,6 +632,44 @@ def multi_wrapper(func_args):
     return function(**kwargs)
 
 
+def multi_task_wrapper(key_func_args):
+    """
+    Run a function, returning the key with the result.
+    """
+    key, function, kwargs = key_func_args
+    return key, function(**kwargs)
+
+
+def timed_call(function: Callable, kwargs: dict) -> Tuple[float, Any]:
+    """
+    Run a function, returning how long it took with the result.
+    """
+    start = time.time()
+    result = function(**kwargs)
+    return time.time() - start, result
+
+
+def multi_keyed_wrapper(key_func_args):
+    """
+    Run an extract function, returning the key with the kwargs updated
+    by the result so the next stage has everything it needs, and the
+    error if it raised (as a string, so it can be sent between processes).
+    """
+    key, function, kwargs = key_func_args
+    try:
+        kwargs.update(function(**kwargs))
+    except Exception as e:
+        return key, kwargs, describe_error(e)
+    return key, kwargs, None
+
+
+def describe_error(error: Exception) -> str:
+    """
+    Describe an error of a task with its type (e.g., ValueError: bad value).
+    """
+    return "%s: %s" % (type(error).__name__, error)
+
+
 def multi_package(func, kwargs):
     zipped = zip(itertools.repeat(func), kwargs)
     return zipped
@@ -8,6 +8,15 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 """
 
 import logging
+import os
+import sys
+import threading
+import time
+from typing import List, Optional, TextIO
+
+# How the result of each url is reported: each line as it comes, lines
+# written together, only failed urls, or only a progress line
+REPORT_MODES = ["all", "buffered", "failures", "progress"]
 
 
 def print_failure(message: str):
@@ -57,3 +66,204 @@ def get_logger(name: str = "urlchecker", level: int = logging.INFO) -> logging.L
     ch.setFormatter(formatter)
     logger.addHandler(ch)
     return logger
+
+
+class Progress:
+    """
+    A live progress display of files and urls checked, with throughput.
+    On a terminal the line is redrawn in place, otherwise a line is written
+    every few seconds (e.g., for CI logs).
+    """
+
+    def __init__(
+        self, stream: Optional[TextIO] = None, interval: Optional[float] = None
+    ):
+        self.stream = stream or sys.stderr
+        self.tty = self.stream.isatty()
+        self.interval = interval if interval is not None else (0.2 if self.tty else 5)
+        self.files = 0
+        self.urls = 0
+        self.failed = 0
+        self.start_time = time.time()
+        self.shown = 0.0
+
+    def update(self, urls: int = 0, failed: int = 0):
+        """
+        Count a finished file with its number of urls (and failed urls), and
+        show progress if enough time has passed.
+        """
+        self.files += 1
+        self.urls += urls
+        self.failed += failed
+        if time.time() - self.shown >= self.interval:
+            self.show()
+
+    def show(self):
+        """
+        Write the progress line.
+        """
+        self.shown = time.time()
+        elapsed = max(self.shown - self.start_time, 1e-6)
+        line = "%s files, %s urls checked (%s failed), %.1f urls/s, %.1fs elapsed" % (
+            self.files,
+            self.urls,
+            self.failed,
+            self.urls / elapsed,
+            elapsed,
+        )
+        self.stream.write(("\r%s" if self.tty else "%s\n") % line)
+        self.stream.flush()
+
+    def finish(self):
+        """
+        Show the final progress, and end the line on a terminal.
+        """
+        self.show()
+        if self.tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class Reporter:
+    """
+    A Reporter writes the result of each url (and other messages, e.g., a
+    skipped file) as checks finish, from any check thread. Set a reporter
+    for a run with set_reporter. The modes are:
+
+     - all: write each line as it comes (the default).
+     - buffered: collect lines and write them together, within interval
+       seconds or every max_lines lines, so a large run makes fewer writes.
+     - failures: only write failed urls and messages.
+     - progress: write no lines, for a run with a Progress display.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        stream: Optional[TextIO] = None,
+        interval: float = 0.5,
+        max_lines: int = 1000,
+    ):
+        """
+        Args:
+            - mode        (str) : one of all, buffered, failures or progress (defaults to URLCHECKER_REPORT, or all).
+            - stream   (stream) : where to write (defaults to stdout).
+            - interval  (float) : with buffered, the most seconds to hold lines.
+            - max_lines   (int) : with buffered, the most lines to hold.
+        """
+        self.mode = mode or os.environ.get("URLCHECKER_REPORT") or "all"
+        if self.mode not in REPORT_MODES:
+            sys.exit(
+                "Report must be one of %s, found %s"
+                % (", ".join(REPORT_MODES), self.mode)
+            )
+        self.stream = stream
+        self.interval = interval
+        self.max_lines = max_lines
+        self.lines = []  # type: List[str]
+        self.lock = threading.Lock()
+        self.flushed = time.time()
+
+        # Writes held lines once interval passes, if no more lines come
+        self.timer = None  # type: Optional[threading.Timer]
+
+    def __str__(self) -> str:
+        return "Reporter:%s" % self.mode
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def success(self, url: str):
+        """
+        Report a url that passed, in green.
+        """
+        if self.mode in ["all", "buffered"]:
+            self.write("\033[92m" + url + "\033[0m")
+
+    def failure(self, url: str):
+        """
+        Report a url that failed, in red.
+        """
+        if self.mode != "progress":
+            self.write("\033[91m" + url + "\033[0m")
+
+    def message(self, message: str):
+        """
+        Report another message (e.g., a skipped file).
+        """
+        if self.mode != "progress":
+            self.write(message)
+
+    def write(self, line: str):
+        """
+        Write a line, or hold it to write with others if buffered. Lines
+        are written whole, so lines from different threads don't mix.
+        """
+        if self.mode != "buffered":
+            with self.lock:
+                (self.stream or sys.stdout).write(line + "\n")
+            return
+        with self.lock:
+            self.lines.append(line)
+            if (
+                len(self.lines) < self.max_lines
+                and time.time() - self.flushed < self.interval
+            ):
+                if self.timer is None:
+                    self.timer = threading.Timer(self.interval, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            self.write_held()
+
+    def flush(self):
+        """
+        Write any lines that are held (e.g., at the end of a run).
+        """
+        with self.lock:
+            self.write_held()
+
+    def write_held(self):
+        """
+        Write the lines that are held, with the lock held.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        lines, self.lines = self.lines, []
+        self.flushed = time.time()
+        if lines:
+            self.write_lines(lines)
+
+    def write_lines(self, lines: List[str]):
+        stream = self.stream or sys.stdout
+        stream.write("\n".join(lines) + "\n")
+        stream.flush()
+
+
+# The reporter for url results, see set_reporter
+reporter = Reporter("all")
+
+
+def get_reporter() -> Reporter:
+    """
+    Get the reporter for url results.
+    """
+    return reporter
+
+
+def set_reporter(new_reporter: Reporter) -> Reporter:
+    """
+    Set the reporter for url results (e.g., buffered for a large run),
+    writing anything held by the one it replaces.
+
+    Args:
+      - new_reporter (Reporter) : the reporter to use.
+
+    Returns: the previous reporter
+    """
+    global reporter
+    previous = reporter
+    previous.flush()
+    reporter = new_reporter
+    return previous
@@ -0,0 +1,94 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import argparse
+import time
+from typing import Dict, List, Optional
+
+from urlchecker.core.worker import BACKENDS, Workers
+
+
+def simulated_check(urls: List[str], latency: float = 0.01) -> Dict[str, List[str]]:
+    """
+    Simulate checking the urls of a file, waiting on the network for each.
+
+    Args:
+        - urls     (list) : the urls to "check".
+        - latency (float) : seconds to wait for each url.
+
+    Returns:
+        (dict) with all urls passed, like a check result.
+    """
+    for _ in urls:
+        time.sleep(latency)
+    return {"passed": urls, "failed": [], "excluded": []}
+
+
+def benchmark_backends(
+    backends: Optional[List[str]] = None,
+    files: int = 200,
+    urls: int = 5,
+    latency: float = 0.01,
+    workers: int = 9,
+) -> Dict[str, float]:
+    """
+    Time running the same simulated checks with each Workers backend.
+
+    Args:
+        - backends (list) : backends to compare (defaults to all).
+        - files     (int) : the number of tasks, one for each file.
+        - urls      (int) : the number of urls in each file.
+        - latency (float) : seconds to wait for each url.
+        - workers   (int) : the number of workers for each backend.
+
+    Returns:
+        (dict) the runtime in seconds of each backend.
+    """
+    tasks = {}
+    for number in range(files):
+        tasks["file-%s" % number] = {
+            "urls": ["https://example.com/%s/%s" % (number, x) for x in range(urls)],
+            "latency": latency,
+        }
+    funcs = {key: simulated_check for key in tasks}
+
+    runtimes = {}
+    for backend in backends or BACKENDS:
+        start = time.time()
+        results = Workers(workers=workers, backend=backend).run(funcs, tasks)
+        runtimes[backend] = time.time() - start
+        assert results is not None and len(results) == files
+    return runtimes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare Workers backends on simulated url checks."
+    )
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--urls", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=9)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    args = parser.parse_args()
+
+    runtimes = benchmark_backends(
+        backends=args.backends.split(","),
+        files=args.files,
+        urls=args.urls,
+        latency=args.latency,
+        workers=args.workers,
+    )
+    print("%-10s %10s" % ("backend", "seconds"))
+    for backend, runtime in runtimes.items():
+        print("%-10s %10.2f" % (backend, runtime))
+
+
+if __name__ == "__main__":
+    main()
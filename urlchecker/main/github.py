@@ -10,21 +10,37 @@ For a copy, see <https://opensource.org/licenses/MIT>.
 import os
 import subprocess
 import sys
+import threading
+import time
 
-from urlchecker.main.utils import get_tmpdir
-from typing import Optional
+from urlchecker.main.utils import format_size, get_directory_size, get_tmpdir
+from typing import Dict, Iterator, List, Optional, Tuple
 
 
 def clone_repo(
-    git_path: str, branch: str = "master", dest: Optional[str] = None
+    git_path: str,
+    branch: str = "master",
+    dest: Optional[str] = None,
+    depth: Optional[int] = None,
+    filter_spec: Optional[str] = None,
+    sparse_patterns: Optional[List[str]] = None,
+    bare: bool = False,
 ) -> str:
     """
-    Clone and name a git repository.
+    Clone and name a git repository. Since we only read files at one commit,
+    the clone can be shallow (depth), partial (filter_spec, e.g., blob:none
+    to fetch file content only when it is checked out) and sparse (only
+    checking out files matching sparse_patterns, see get_sparse_patterns).
+    A partial and sparse clone only fetches the files that will be checked.
 
     Args:
-        - git_path (str) : https path to git repository.
-        - branch   (str) : name of the branch to use. Default="master"
-        - dest     (str) : fullpath to clone repository to. Defaults to tmp.
+        - git_path         (str) : https path to git repository.
+        - branch           (str) : name of the branch to use. Default="master"
+        - dest             (str) : fullpath to clone repository to. Defaults to tmp.
+        - depth            (int) : the number of commits of history to fetch (None for all).
+        - filter_spec      (str) : a partial clone filter (e.g., blob:none).
+        - sparse_patterns (list) : gitignore style patterns of files to check out.
+        - bare            (bool) : clone without a working tree (see get_tree_files).
 
     Returns:
         (str) base path of the cloned git repository.
@@ -33,8 +49,19 @@ def clone_repo(
         base_path = os.path.basename(git_path)
         dest = get_tmpdir(prefix=base_path, create=False)
 
+    command = ["git", "clone", "-b", branch]
+    if depth:
+        command += ["--depth", str(depth)]
+    if filter_spec:
+        command += ["--filter=%s" % filter_spec]
+    if bare:
+        command += ["--bare"]
+    elif sparse_patterns:
+        command += ["--no-checkout"]
+
+    start = time.time()
     result = subprocess.run(
-        ["git", "clone", "-b", branch, git_path, dest],
+        command + [git_path, dest],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     )
@@ -42,9 +69,385 @@ def clone_repo(
     if result.returncode != 0:
         sys.exit("Issue with cloning branch %s of %s" % (branch, git_path))
 
+    # Check out only the files we need (with a filter, only these are fetched)
+    if sparse_patterns and not bare:
+        sparse_checkout(dest, branch, sparse_patterns)
+
+    print(
+        "Cloned %s in %.2f seconds, fetched %s."
+        % (
+            git_path,
+            time.time() - start,
+            format_size(
+                get_directory_size(dest if bare else os.path.join(dest, ".git"))
+            ),
+        )
+    )
     return dest
 
 
+def sparse_checkout(base_path: str, branch: str, sparse_patterns: List[str]):
+    """
+    Check out a branch of a clone made with --no-checkout, limited to files
+    matching sparse checkout patterns (non-cone, in gitignore syntax).
+
+    Args:
+        - base_path        (str) : the cloned repository.
+        - branch           (str) : name of the branch to check out.
+        - sparse_patterns (list) : gitignore style patterns of files to check out.
+    """
+    error = "Issue with sparse checkout of %s" % base_path
+    run_git(base_path, ["sparse-checkout", "set", "--no-cone"] + sparse_patterns, error)
+    run_git(base_path, ["checkout", branch], error)
+
+
+def get_sparse_patterns(
+    file_types: List[str], subfolder: Optional[str] = None
+) -> List[str]:
+    """
+    Derive sparse checkout patterns (non-cone, in gitignore syntax) from the
+    file types to check. An extension (.md) becomes a glob (*.md), and a
+    pattern (*.html, or .* for hidden files) is kept as is. Both match file
+    names at any depth, or under the subfolder only if one is given.
+
+    Args:
+        - file_types (list) : file extensions or patterns to check.
+        - subfolder   (str) : a relative folder to limit the checkout to.
+
+    Returns:
+        (list) sparse checkout patterns.
+    """
+    prefix = ""
+    if subfolder:
+        prefix = "/%s/**/" % subfolder.strip("/")
+
+    patterns = []
+    for file_type in file_types:
+        if file_type.startswith(".") and not any(x in file_type for x in "*?["):
+            file_type = "*%s" % file_type
+        patterns.append(prefix + file_type)
+    return patterns
+
+
+def run_git(base_path: str, args: List[str], error: str) -> str:
+    """
+    Run a git command in a repository and return the output, exiting with
+    an error message if the command fails.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - args     (list) : arguments for git.
+        - error     (str) : the message to exit with on failure.
+
+    Returns:
+        (str) the output of the command.
+    """
+    result = subprocess.run(
+        ["git", "-C", base_path] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        sys.exit("%s: %s" % (error, result.stderr.decode("utf-8", "replace")))
+    return result.stdout.decode("utf-8", "replace")
+
+
+def get_merge_base(base_path: str, base_ref: str) -> str:
+    """
+    Get the commit where HEAD diverged from a base ref (e.g., origin/main), so
+    that changes made on the base ref since then are not included.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - base_ref  (str) : the base branch, tag or commit.
+
+    Returns:
+        (str) the merge base commit.
+    """
+    return run_git(
+        base_path,
+        ["merge-base", base_ref, "HEAD"],
+        "Issue finding the merge base of %s and HEAD" % base_ref,
+    ).strip()
+
+
+def get_repo_root(base_path: str) -> str:
+    """
+    Get the top level directory of the git repository that a path is in.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+
+    Returns:
+        (str) the repository root.
+    """
+    return run_git(
+        base_path,
+        ["rev-parse", "--show-toplevel"],
+        "%s is not a git repository" % base_path,
+    ).strip()
+
+
+def get_tree_files(
+    base_path: str, revision: str, subfolder: Optional[str] = None
+) -> List[Tuple[str, str, int]]:
+    """
+    List files at a revision (any branch, tag or commit) from the object
+    store, without a checkout. Like git ls-tree, files are listed under
+    base_path (e.g., a folder of a working tree), or under subfolder of a
+    bare repository. Submodules and symbolic links are not listed.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - revision  (str) : the branch, tag or commit.
+        - subfolder (str) : a relative folder to list files under.
+
+    Returns:
+        (list) of (path under base_path, blob id, size in bytes).
+    """
+    args = ["ls-tree", "-r", "-z", "-l", revision]
+    if subfolder:
+        args += ["--", subfolder]
+    output = run_git(base_path, args, "Issue with listing files at %s" % revision)
+
+    files = []
+    for record in output.split("\0"):
+        if not record:
+            continue
+        meta, name = record.split("\t", 1)
+        mode, kind, blob, size = meta.split()
+        if kind != "blob" or mode == "120000":
+            continue
+        files.append((os.path.join(base_path, name), blob, int(size)))
+    return files
+
+
+def iter_blobs(base_path: str, blobs: List[str]) -> Iterator[Optional[bytes]]:
+    """
+    Stream the content of blobs from the object store with a single git
+    cat-file --batch process. Ids are written from a thread while content
+    is read, so a long list never blocks on a full pipe.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - blobs    (list) : blob ids to read.
+
+    Returns:
+        (iterator) of the content of each blob in order (None if missing).
+    """
+    process = subprocess.Popen(
+        ["git", "-C", base_path, "cat-file", "--batch"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    stdin, stdout = process.stdin, process.stdout
+    assert stdin is not None and stdout is not None
+
+    def write():
+        try:
+            for blob in blobs:
+                stdin.write(("%s\n" % blob).encode("utf-8"))
+            stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    try:
+        for _ in blobs:
+            header = stdout.readline().split()
+            if not header:
+                break
+
+            # A missing object is reported as "<id> missing"
+            if len(header) != 3:
+                yield None
+                continue
+            content = stdout.read(int(header[2]))
+            stdout.read(1)
+            yield content
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        writer.join()
+
+
+def get_untracked_files(root: str) -> List[str]:
+    """
+    Get untracked files that are not ignored (respecting .gitignore).
+
+    Args:
+        - root (str) : the repository root.
+
+    Returns:
+        (list) absolute paths of untracked files.
+    """
+    untracked = run_git(
+        root,
+        ["ls-files", "-z", "--others", "--exclude-standard"],
+        "Issue listing untracked files",
+    )
+    return [os.path.join(root, x) for x in untracked.split("\0") if x]
+
+
+def get_tracked_files(base_path: str) -> Optional[List[str]]:
+    """
+    List files under a path from the git index, along with untracked files
+    that are not ignored, so .gitignore is respected and we don't need to
+    walk the working tree. Tracked files deleted from the working tree and
+    submodules are not included.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+
+    Returns:
+        (list) file paths (joined to base_path), or None if not a git repository.
+    """
+    result = subprocess.run(
+        [
+            "git",
+            "-C",
+            base_path,
+            "ls-files",
+            "-z",
+            "--cached",
+            "--others",
+            "--exclude-standard",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        return None
+
+    # A file with a merge conflict is listed once for each stage
+    listing = dict.fromkeys(result.stdout.decode("utf-8", "replace").split("\0"))
+    file_paths = [os.path.join(base_path, x) for x in listing if x]
+    return [x for x in file_paths if os.path.isfile(x)]
+
+
+def get_changed_files(base_path: str, base_ref: str) -> List[str]:
+    """
+    Get the files that were added or modified since a base ref, including
+    uncommitted and untracked (but not ignored) files. Deleted files are
+    not included.
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - base_ref  (str) : the base branch, tag or commit.
+
+    Returns:
+        (list) absolute paths of changed files.
+    """
+    root = get_repo_root(base_path)
+    changed = run_git(
+        root,
+        [
+            "diff",
+            "--name-only",
+            "-z",
+            "--diff-filter=d",
+            get_merge_base(root, base_ref),
+        ],
+        "Issue listing files changed since %s" % base_ref,
+    )
+    changed_files = [os.path.join(root, x) for x in changed.split("\0") if x]
+    return changed_files + get_untracked_files(root)
+
+
+# Escapes git uses in quoted paths, other than octal bytes (e.g., \303)
+GIT_ESCAPES = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13}
+
+
+def unquote_path(path: str) -> str:
+    """
+    Get a path from how it is written in a git diff header. Git adds a tab after a path
+    with a space, and quotes paths with special characters (e.g., a quote,
+    or a tab) in double quotes with C style escapes.
+
+    Args:
+        - path (str) : the path from the header (e.g., "dir/a\\tb.md").
+
+    Returns:
+        (str) the path.
+    """
+    if path.endswith("\t"):
+        path = path[:-1]
+    if len(path) < 2 or not (path.startswith('"') and path.endswith('"')):
+        return path
+
+    raw = bytearray()
+    quoted = path[1:-1]
+    index = 0
+    while index < len(quoted):
+        char = quoted[index]
+        index += 1
+        if char != "\\" or index == len(quoted):
+            raw += char.encode("utf-8")
+            continue
+        char = quoted[index]
+        if quoted[index : index + 3].isdigit():
+            raw.append(int(quoted[index : index + 3], 8) & 0xFF)
+            index += 3
+            continue
+        if char in GIT_ESCAPES:
+            raw.append(GIT_ESCAPES[char])
+        else:
+            raw += char.encode("utf-8")
+        index += 1
+    return raw.decode("utf-8", "replace")
+
+
+def get_added_lines(base_path: str, base_ref: str) -> Dict[str, Optional[List[str]]]:
+    """
+    Get the lines added to each file since a base ref. Untracked files are
+    entirely new, so they map to None (meaning all lines).
+
+    Args:
+        - base_path (str) : a path in the git repository.
+        - base_ref  (str) : the base branch, tag or commit.
+
+    Returns:
+        (dict) added lines, keyed by absolute path of each changed file.
+    """
+    root = get_repo_root(base_path)
+    diff = run_git(
+        root,
+        [
+            "-c",
+            "core.quotepath=off",
+            "diff",
+            "-U0",
+            "--no-color",
+            "--no-prefix",
+            "--diff-filter=d",
+            get_merge_base(root, base_ref),
+        ],
+        "Issue getting changes since %s" % base_ref,
+    )
+
+    added = {}  # type: Dict[str, Optional[List[str]]]
+    lines = []  # type: List[str]
+    in_header = False
+    for line in diff.splitlines():
+        if line.startswith("diff --git "):
+            in_header = True
+        elif in_header and line.startswith("+++ "):
+            lines = []
+            added[os.path.join(root, unquote_path(line[4:]))] = lines
+        elif line.startswith("@@"):
+            in_header = False
+        elif not in_header and line.startswith("+"):
+            lines.append(line[1:])
+
+    # Untracked files are all new
+    for file_name in get_untracked_files(root):
+        added[file_name] = None
+    return added
+
+
 def delete_repo(base_path: str) -> int:
     """
     Delete repository.
@@ -0,0 +1,186 @@
+"""
+
+Copyright (c) 2020-2024 Ayoub Malek and Vanessa Sochat
+
+This source code is licensed under the terms of the MIT license.
+For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from urlchecker.main.github import run_git, sparse_checkout
+from urlchecker.main.utils import format_size, get_directory_size, get_tmpdir
+
+
+class MirrorCache:
+    """
+    A persistent directory of bare mirrors of remote repositories. The first
+    check of a repository clones a mirror, and later checks only fetch what
+    changed, then make a lightweight checkout that shares the mirror's
+    objects (nothing is copied). Mirrors not used for max_age seconds are
+    evicted, and the least recently used are evicted while the total size is
+    over max_size bytes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_age: Optional[float] = None,
+        max_size: Optional[int] = None,
+    ):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_age = max_age
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __str__(self) -> str:
+        return "MirrorCache:%s" % self.cache_dir
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def get_mirror_path(self, git_path: str) -> str:
+        """
+        Get the mirror directory for a repository, a readable name from the
+        url with a short hash so different urls never collide.
+
+        Args:
+            - git_path (str) : https (or ssh) path to git repository.
+
+        Returns:
+            (str) the path to the bare mirror.
+        """
+        name = re.sub("[^A-Za-z0-9._-]+", "-", git_path.split("://")[-1]).strip("-")
+        digest = hashlib.sha1(git_path.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.cache_dir, "%s-%s.git" % (name[-80:], digest))
+
+    def update(self, git_path: str) -> str:
+        """
+        Clone a mirror of a repository, or fetch into an existing one (pruning
+        deleted branches), and mark it as used.
+
+        Args:
+            - git_path (str) : https (or ssh) path to git repository.
+
+        Returns:
+            (str) the path to the bare mirror.
+        """
+        mirror = self.get_mirror_path(git_path)
+        start = time.time()
+        if os.path.exists(mirror):
+            run_git(
+                mirror,
+                ["fetch", "--prune", "origin"],
+                "Issue with fetching %s into %s" % (git_path, mirror),
+            )
+            action = "Fetched"
+        else:
+            result = subprocess.run(
+                ["git", "clone", "--mirror", git_path, mirror],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            if result.returncode != 0:
+                shutil.rmtree(mirror, ignore_errors=True)
+                sys.exit("Issue with mirroring %s" % git_path)
+            action = "Mirrored"
+
+        # The modified time of the mirror is its last use, for eviction
+        os.utime(mirror)
+        print("%s %s in %.2f seconds." % (action, git_path, time.time() - start))
+        return mirror
+
+    def checkout(
+        self,
+        git_path: str,
+        branch: str = "master",
+        dest: Optional[str] = None,
+        sparse_patterns: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Update the mirror of a repository, and check out a branch from it.
+        The checkout borrows objects from the mirror (git clone --shared), so
+        only the working tree is written. Evict other mirrors afterwards.
+
+        Args:
+            - git_path         (str) : https (or ssh) path to git repository.
+            - branch           (str) : name of the branch to use. Default="master"
+            - dest             (str) : fullpath to check out to. Defaults to tmp.
+            - sparse_patterns (list) : gitignore style patterns of files to check out.
+
+        Returns:
+            (str) base path of the checkout.
+        """
+        mirror = self.update(git_path)
+        if not dest:
+            dest = get_tmpdir(prefix=os.path.basename(git_path), create=False)
+
+        command = ["git", "clone", "--shared", "-b", branch]
+        if sparse_patterns:
+            command += ["--no-checkout"]
+        result = subprocess.run(
+            command + [mirror, dest],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            sys.exit("Issue with checking out branch %s of %s" % (branch, git_path))
+        if sparse_patterns:
+            sparse_checkout(dest, branch, sparse_patterns)
+
+        self.evict(keep=mirror)
+        return dest
+
+    def list_mirrors(self) -> List[Tuple[float, int, str]]:
+        """
+        List mirrors in the cache with their last use and size.
+
+        Returns:
+            (list) of (last used, size in bytes, path), least recently used first.
+        """
+        mirrors = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                mirrors.append((os.stat(path).st_mtime, get_directory_size(path), path))
+        return sorted(mirrors)
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """
+        Remove mirrors that are older than max_age, and then the least
+        recently used while the cache is larger than max_size.
+
+        Args:
+            - keep (str) : a mirror to never evict (e.g., the one in use).
+
+        Returns:
+            (list) the removed mirrors.
+        """
+        mirrors = self.list_mirrors()
+        total = sum(size for _, size, _ in mirrors)
+        now = time.time()
+        evicted = []
+        for used, size, path in mirrors:
+            if path == keep:
+                continue
+            expired = self.max_age is not None and now - used > self.max_age
+            too_big = self.max_size is not None and total > self.max_size
+            if expired or too_big:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                evicted.append(path)
+
+        if evicted:
+            print(
+                "Evicted %s mirror(s), cache is now %s."
+                % (len(evicted), format_size(total))
+            )
+        return evicted
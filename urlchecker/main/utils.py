@@ -37,3 +37,42 @@ def get_tmpdir(
         os.mkdir(tmpdir)
 
     return tmpdir
+
+
+def get_directory_size(path: str) -> int:
+    """
+    Get the total size (in bytes) of files under a directory.
+
+    Args:
+        - path (str) : the directory.
+
+    Returns:
+        (int) the total size in bytes.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def format_size(size: float) -> str:
+    """
+    Format a size in bytes for humans (e.g., 1.5 MB).
+
+    Args:
+        - size (float) : size in bytes.
+
+    Returns:
+        (str) the formatted size.
+    """
+    for unit in ["bytes", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024.0
+    if unit == "bytes":
+        return "%d bytes" % size
+    return "%.1f %s" % (size, unit)